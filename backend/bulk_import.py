@@ -0,0 +1,78 @@
+"""Incremental NDJSON / CSV parsing for bulk imports.
+
+Request bodies are consumed chunk by chunk, so a whole shift of rows is
+never held in memory at once. Rows come out as
+``(row_number, data, error)`` where exactly one of data/error is set;
+a bad row is reported and the import carries on.
+"""
+import codecs
+import csv
+import json
+
+BATCH_SIZE = 500
+
+
+async def _lines(chunks):
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+
+async def iter_ndjson(chunks):
+    row_number = 0
+    async for line in _lines(chunks):
+        row_number += 1
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            yield row_number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(data, dict):
+            yield row_number, None, "Row must be a JSON object"
+            continue
+        yield row_number, data, None
+
+
+async def iter_csv(chunks):
+    # Rows are split on newlines, so quoted fields may not contain one
+    header = None
+    row_number = 0
+    async for line in _lines(chunks):
+        row_number += 1
+        if not line.strip():
+            continue
+        values = next(csv.reader([line]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield row_number, None, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        # Empty cells become None so optional fields validate
+        yield row_number, {k: (v if v != "" else None) for k, v in zip(header, values)}, None
+
+
+async def batched(rows, size: int = BATCH_SIZE):
+    batch = []
+    async for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def format_validation_error(error) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in error.errors()
+    )
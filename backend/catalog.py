@@ -0,0 +1,131 @@
+"""In-process raw-material catalog.
+
+Manufacturing and shipment writes look up the color material by id, the
+masura material by name and GAZ001 by code on every call. Those catalog
+rows almost never change, so each worker keeps them in memory, indexed
+by id, code and name. Only descriptive fields are held: stock quantities
+change on every posting and are always read from MongoDB.
+
+The raw-material endpoints update the local catalog write-through and
+bump the version in ``catalog_state``. Other workers follow a change
+stream on ``raw_materials`` when the server is a replica set, and
+otherwise poll that version every CATALOG_POLL_SECONDS and reload when
+it moved. A lookup that misses falls back to MongoDB, so a row created
+on another worker is found even before the change has propagated.
+"""
+import asyncio
+import logging
+import os
+
+from pymongo.errors import PyMongoError
+
+from stock_posting import supports_transactions
+
+logger = logging.getLogger(__name__)
+
+CATALOG_POLL_SECONDS = float(os.environ.get('CATALOG_POLL_SECONDS', '5'))
+
+# Everything but the balance fields written by stock postings
+CATALOG_FIELDS = ("id", "name", "code", "unit", "unit_price", "min_stock_level", "created_at")
+CATALOG_PROJECTION = {"_id": 0, **{name: 1 for name in CATALOG_FIELDS}}
+STOCK_FIELDS = ("current_stock",)
+
+
+class MaterialCatalog:
+    STATE_ID = "raw_materials"
+
+    def __init__(self):
+        self.version = None
+        self._by_id = {}
+        self._by_code = {}
+        self._by_name = {}
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def put(self, material: dict):
+        entry = {k: material[k] for k in CATALOG_FIELDS if k in material}
+        previous = self._by_id.get(entry['id'])
+        if previous:
+            self._by_code.pop(previous.get('code'), None)
+            self._by_name.pop(previous.get('name'), None)
+        self._by_id[entry['id']] = entry
+        self._by_code[entry.get('code')] = entry
+        self._by_name[entry.get('name')] = entry
+
+    async def load(self, db):
+        state = await db.catalog_state.find_one({"_id": self.STATE_ID})
+        materials = await db.raw_materials.find({}, CATALOG_PROJECTION).to_list(None)
+        self._by_id, self._by_code, self._by_name = {}, {}, {}
+        for material in materials:
+            self.put(material)
+        self.version = state['version'] if state else 0
+
+    async def changed(self, db, material: dict):
+        """Write-through after a raw-material write on this worker."""
+        self.put(material)
+        # Our own version stays put, so the next poll reloads once; that
+        # also picks up anything another worker wrote in the meantime
+        await db.catalog_state.update_one({"_id": self.STATE_ID}, {"$inc": {"version": 1}}, upsert=True)
+
+    async def _lookup(self, db, index: dict, field: str, value):
+        material = index.get(value)
+        if material is None:
+            material = await db.raw_materials.find_one({field: value}, CATALOG_PROJECTION)
+            if material:
+                self.put(material)
+        return material
+
+    # Returned dicts are shared: read them, don't modify them
+    async def by_id(self, db, material_id: str):
+        return await self._lookup(db, self._by_id, "id", material_id)
+
+    async def by_code(self, db, code: str):
+        return await self._lookup(db, self._by_code, "code", code)
+
+    async def by_name(self, db, name: str):
+        return await self._lookup(db, self._by_name, "name", name)
+
+    async def _poll(self, db):
+        while True:
+            await asyncio.sleep(CATALOG_POLL_SECONDS)
+            try:
+                state = await db.catalog_state.find_one({"_id": self.STATE_ID})
+                if (state['version'] if state else 0) != self.version:
+                    await self.load(db)
+            except PyMongoError as e:
+                logger.warning(f"Catalog refresh failed: {e}")
+
+    async def _watch(self, db):
+        # Stock postings update raw_materials constantly; skip events that
+        # touch nothing but the balance
+        async with db.raw_materials.watch(full_document="updateLookup") as stream:
+            # Reload once the stream is open so nothing between the two is missed
+            await self.load(db)
+            async for change in stream:
+                if change['operationType'] == 'update':
+                    fields = change['updateDescription']['updatedFields']
+                    if all(name.split('.')[0] in STOCK_FIELDS for name in fields):
+                        continue
+                if change.get('fullDocument'):
+                    self.put(change['fullDocument'])
+                else:
+                    await self.load(db)
+
+    async def follow(self, db):
+        """Keep the catalog in step with other workers until cancelled."""
+        while True:
+            try:
+                if not await supports_transactions(db.client):
+                    return await self._poll(db)
+                await self._watch(db)
+            except PyMongoError as e:
+                logger.warning(f"Catalog change stream failed, reloading: {e}")
+                await asyncio.sleep(CATALOG_POLL_SECONDS)
+                try:
+                    await self.load(db)
+                except PyMongoError:
+                    pass
+
+
+catalog = MaterialCatalog()
@@ -0,0 +1,149 @@
+"""Response compression for large bodies.
+
+Bodies of at least COMPRESS_MIN_SIZE bytes are compressed with Brotli
+when the client accepts ``br`` and the ``brotli`` package is installed.
+Otherwise they use gzip when the client accepts it. Smaller bodies go
+out as they are: compressing them costs more than it saves.
+
+Streamed bodies (SSE events, CSV exports) are compressed chunk by chunk.
+Each chunk is flushed, so an event still reaches the client as soon as
+it is sent. Bodies that are already compressed (XLSX is a zip file), or
+that carry a Content-Encoding, are passed through untouched.
+
+Starlette's GZipMiddleware is not used: it holds streamed chunks in the
+compressor's buffer, which stalls the event stream, and it has no
+Brotli.
+"""
+import os
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - gzip only
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '5'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '4'))
+
+# Already compressed; a second pass only burns CPU
+PASSTHROUGH_TYPES = (
+    "application/vnd.openxmlformats",
+    "application/zip",
+    "application/gzip",
+    "image/",
+)
+
+
+def _accepted(accept_encoding: str) -> set:
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, *params = [piece.strip() for piece in part.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(coding)
+    return accepted
+
+
+class _Gzip:
+    name = "gzip"
+
+    def __init__(self):
+        # wbits=31: gzip header and trailer
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH)
+
+
+class _Brotli:
+    name = "br"
+
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.process(data) + self._compressor.finish()
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accepted = _accepted(Headers(scope=scope).get("accept-encoding", ""))
+        if brotli is not None and "br" in accepted:
+            encoder = _Brotli
+        elif "gzip" in accepted:
+            encoder = _Gzip
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                passthrough = (
+                    "content-encoding" in headers
+                    or content_type.startswith(PASSTHROUGH_TYPES)
+                )
+                if passthrough:
+                    await send(message)
+                else:
+                    # Held back until the first body chunk decides the encoding
+                    start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                initial, start = start, None
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(initial)
+                    await send(message)
+                    return
+                compressor = encoder()
+                headers = MutableHeaders(raw=initial["headers"])
+                headers["Content-Encoding"] = compressor.name
+                headers.add_vary_header("Accept-Encoding")
+                if "content-length" in headers:
+                    del headers["content-length"]
+                if not more_body:
+                    body = compressor.finish(body)
+                    headers["Content-Length"] = str(len(body))
+                    await send(initial)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(initial)
+            body = compressor.chunk(body) if more_body else compressor.finish(body)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,190 @@
+"""Cost analysis (maliyet analizi) computed inside MongoDB.
+
+Consumptions are summed by an aggregation pipeline instead of being
+loaded into Python. Each consumption carries the cost it was priced at
+when posted (see ``costing``), so a report is a plain sum and a later
+price change does not rewrite history. Closed months are folded once
+into the ``consumption_monthly`` rollup; a report over closed months
+reads the rollup and only the open edges of the range rescan
+``consumptions``.
+"""
+from datetime import datetime, timezone
+from typing import Optional
+
+PERIOD_FORMATS = {
+    "day": "%Y-%m-%d",
+    "week": "%G-W%V",
+    "month": "%Y-%m",
+}
+
+# Renamed when the rollup's shape changes, so it is rebuilt from scratch
+ROLLUP_STATE_ID = "consumption_monthly_costed"
+
+
+def _as_utc(value) -> datetime:
+    if isinstance(value, str):
+        # Not yet converted by the ISO-date migration
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def month_start(value: datetime) -> datetime:
+    value = _as_utc(value)
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def next_month(value: datetime) -> datetime:
+    if value.month == 12:
+        return value.replace(year=value.year + 1, month=1)
+    return value.replace(month=value.month + 1)
+
+
+def _date_match(date_from: Optional[datetime], date_to: Optional[datetime]) -> dict:
+    created_at = {}
+    if date_from:
+        created_at["$gte"] = _as_utc(date_from)
+    if date_to:
+        created_at["$lt"] = _as_utc(date_to)
+    return {"created_at": created_at} if created_at else {}
+
+
+def _period_expr(group_by: Optional[str]):
+    if not group_by:
+        return None
+    return {"$dateToString": {"format": PERIOD_FORMATS[group_by], "date": {"$toDate": "$created_at"}}}
+
+
+def _project() -> list:
+    return [
+        {"$project": {
+            "_id": 0,
+            "material_id": "$_id.material_id",
+            "period": "$_id.period",
+            "material_name": 1,
+            "total_quantity": 1,
+            "total_cost": 1,
+        }},
+    ]
+
+
+def consumption_pipeline(ranges: list, group_by: Optional[str]) -> list:
+    """Group raw consumptions inside the given (from, to) ranges."""
+    matches = [_date_match(start, end) for start, end in ranges]
+    match = matches[0] if len(matches) == 1 else {"$or": matches}
+    return [
+        {"$match": match},
+        # $last below then names each material as its latest consumption did
+        {"$sort": {"created_at": 1}},
+        {"$group": {
+            "_id": {"material_id": "$material_id", "period": _period_expr(group_by)},
+            "material_name": {"$last": "$material_name"},
+            "total_quantity": {"$sum": "$quantity"},
+            "total_cost": {"$sum": "$total_cost"},
+        }},
+        *_project(),
+    ]
+
+
+def rollup_pipeline(first_month: datetime, end_month: datetime, group_by: Optional[str]) -> list:
+    period = "$_id.month" if group_by == "month" else None
+    return [
+        {"$match": {"_id.month": {
+            "$gte": first_month.strftime("%Y-%m"),
+            "$lt": end_month.strftime("%Y-%m"),
+        }}},
+        {"$sort": {"_id.month": 1}},
+        {"$group": {
+            "_id": {"material_id": "$_id.material_id", "period": period},
+            "material_name": {"$last": "$material_name"},
+            "total_quantity": {"$sum": "$total_quantity"},
+            "total_cost": {"$sum": "$total_cost"},
+        }},
+        *_project(),
+    ]
+
+
+async def refresh_monthly_rollup(db, now: Optional[datetime] = None) -> Optional[datetime]:
+    """Fold every closed month not yet rolled up into consumption_monthly.
+
+    Returns the start of the first month that is *not* covered by the
+    rollup, or None when there is nothing to roll up yet. Nothing is
+    rolled up before the ISO-date migration has finished: a month is
+    never folded again, so a consumption still dated by a string would
+    be left out of it for good.
+    """
+    if not await db.migrations.find_one({"_id": "iso_dates", "done": True}):
+        return None
+    current = month_start(now or datetime.now(timezone.utc))
+    state = await db.rollup_state.find_one({"_id": ROLLUP_STATE_ID})
+    if state:
+        start = _as_utc(state['rolled_until'])
+    else:
+        first = await db.consumptions.find_one({}, {"created_at": 1}, sort=[("created_at", 1)])
+        if not first:
+            return None
+        start = month_start(first['created_at'])
+
+    if start < current:
+        await db.consumptions.aggregate([
+            {"$match": _date_match(start, current)},
+            {"$sort": {"created_at": 1}},
+            {"$group": {
+                "_id": {
+                    "material_id": "$material_id",
+                    # Every created_at is a BSON date once the migration is done
+                    "month": {"$dateToString": {"format": "%Y-%m", "date": "$created_at"}},
+                },
+                "material_name": {"$last": "$material_name"},
+                "total_quantity": {"$sum": "$quantity"},
+                "total_cost": {"$sum": "$total_cost"},
+            }},
+            {"$merge": {"into": "consumption_monthly", "whenMatched": "replace", "whenNotMatched": "insert"}},
+        ], allowDiskUse=True).to_list(None)
+        start = current
+        await db.rollup_state.update_one(
+            {"_id": ROLLUP_STATE_ID},
+            {"$set": {"rolled_until": start}},
+            upsert=True
+        )
+    return start
+
+
+async def cost_analysis(db, date_from: Optional[datetime] = None, date_to: Optional[datetime] = None,
+                        group_by: Optional[str] = None) -> list:
+    """Total consumption and cost per material (and period) in [from, to)."""
+    raw_ranges = [(date_from, date_to)]
+    rolled = []
+
+    # Day and week buckets do not line up with months, so only plain and
+    # monthly reports can be answered from the rollup.
+    if group_by in (None, "month"):
+        rolled_until = await refresh_monthly_rollup(db)
+        if rolled_until:
+            if date_from is None:
+                first_month = datetime(1970, 1, 1, tzinfo=timezone.utc)
+            else:
+                first_month = month_start(date_from)
+                if first_month != _as_utc(date_from):
+                    first_month = next_month(first_month)
+            end_month = min(month_start(date_to), rolled_until) if date_to else rolled_until
+            if first_month < end_month:
+                rolled = await db.consumption_monthly.aggregate(
+                    rollup_pipeline(first_month, end_month, group_by)
+                ).to_list(None)
+                raw_ranges = [(date_from, first_month), (end_month, date_to)]
+                if date_from is None:
+                    raw_ranges = raw_ranges[1:]
+
+    raw = await db.consumptions.aggregate(consumption_pipeline(raw_ranges, group_by), allowDiskUse=True).to_list(None)
+
+    totals = {}
+    for row in rolled + raw:
+        key = (row['material_id'], row.get('period'))
+        if key in totals:
+            totals[key]['total_quantity'] += row['total_quantity']
+            totals[key]['total_cost'] += row['total_cost']
+        else:
+            totals[key] = row
+    return sorted(totals.values(), key=lambda r: (r.get('period') or '', r['material_name']))
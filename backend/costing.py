@@ -0,0 +1,240 @@
+"""Raw-material costing with historical price layers.
+
+Receipts (IN stock transactions) carry a unit cost. Withdrawals
+(consumptions and OUT transactions) are priced when they are posted,
+and the cost is stored on the ledger row. Reports therefore sum stored
+costs and never reprice history at today's ``unit_price``.
+
+COSTING_METHOD selects how withdrawals are priced:
+
+``fifo`` (default)
+    Every receipt becomes a row in ``cost_layers`` with its remaining
+    quantity. A withdrawal draws from the oldest layers first.
+``average``
+    Each material has one ``cost_pools`` document holding the quantity
+    on hand and its total value. A withdrawal is priced at value /
+    quantity.
+
+Draws are compare-and-swap updates, so concurrent postings never take
+the same quantity twice. Stock that was on hand before costing was
+introduced gets an opening layer at the material's ``unit_price`` (the
+``opening_cost_layers`` migration). Anything a withdrawal still cannot
+cover from layers is priced at ``unit_price`` at posting time.
+
+The method is a deployment-wide choice. Layers and pools are only
+written for the configured method.
+"""
+import os
+import uuid
+from datetime import datetime, timezone
+
+COSTING_METHOD = os.environ.get('COSTING_METHOD', 'fifo')
+
+
+async def receive(db, material_id: str, quantity: float, unit_cost: float, source_id: str = None, session=None):
+    """Add a receipt of ``quantity`` at ``unit_cost`` to the material's layers."""
+    if quantity <= 0:
+        return
+    if COSTING_METHOD == 'average':
+        await db.cost_pools.update_one(
+            {"material_id": material_id},
+            {"$inc": {"quantity": quantity, "value": quantity * unit_cost}},
+            upsert=True,
+            session=session
+        )
+        return
+    await db.cost_layers.insert_one({
+        "id": str(uuid.uuid4()),
+        "material_id": material_id,
+        "source_id": source_id,
+        "received_at": datetime.now(timezone.utc),
+        "quantity": quantity,
+        "remaining": quantity,
+        "unit_cost": unit_cost,
+    }, session=session)
+
+
+async def _draw_fifo(db, material_id: str, quantity: float, session=None) -> tuple:
+    slices = []
+    try:
+        while quantity > 0:
+            layer = await db.cost_layers.find_one(
+                {"material_id": material_id, "remaining": {"$gt": 0}},
+                {"_id": 0, "id": 1, "remaining": 1, "unit_cost": 1},
+                sort=[("received_at", 1), ("id", 1)],
+                session=session
+            )
+            if layer is None:
+                break
+            take = min(layer['remaining'], quantity)
+            result = await db.cost_layers.update_one(
+                {"id": layer['id'], "remaining": layer['remaining']},
+                {"$set": {"remaining": layer['remaining'] - take}},
+                session=session
+            )
+            if result.modified_count:
+                slices.append((take, layer['unit_cost'], layer['id']))
+                quantity -= take
+            # else: another posting drew from this layer first; look again
+    except Exception:
+        # A transaction rolls back the layers already drawn; without one, put them back
+        if session is None:
+            await restore(db, material_id, slices)
+        raise
+    return slices, quantity
+
+
+async def _draw_average(db, material_id: str, quantity: float, session=None) -> tuple:
+    while True:
+        pool = await db.cost_pools.find_one({"material_id": material_id}, session=session)
+        if pool is None or pool['quantity'] <= 0:
+            return [], quantity
+        take = min(pool['quantity'], quantity)
+        unit_cost = pool['value'] / pool['quantity']
+        remaining = pool['quantity'] - take
+        result = await db.cost_pools.update_one(
+            {"material_id": material_id, "quantity": pool['quantity'], "value": pool['value']},
+            {"$set": {"quantity": remaining, "value": remaining * unit_cost}},
+            session=session
+        )
+        if result.modified_count:
+            return [(take, unit_cost, material_id)], quantity - take
+
+
+async def draw(db, material: dict, quantity: float, session=None) -> list:
+    """Take ``quantity`` out of the material's layers.
+
+    Returns ``(quantity, unit_cost, source)`` slices in draw order, where
+    source is the layer id (FIFO) or the material id (average pool) the
+    quantity came from. Quantity not covered by a layer is priced at the
+    material's ``unit_price`` and has no source. ``restore`` undoes a draw.
+    """
+    if quantity <= 0:
+        return []
+    if COSTING_METHOD == 'average':
+        slices, uncovered = await _draw_average(db, material['id'], quantity, session)
+    else:
+        slices, uncovered = await _draw_fifo(db, material['id'], quantity, session)
+    if uncovered > 0:
+        slices.append((uncovered, material.get('unit_price', 0), None))
+    return slices
+
+
+async def restore(db, material_id: str, slices: list, session=None):
+    """Put back what ``draw`` took, when the posting it priced failed."""
+    for quantity, unit_cost, source in slices:
+        if source is None:
+            continue
+        if COSTING_METHOD == 'average':
+            await db.cost_pools.update_one(
+                {"material_id": material_id},
+                {"$inc": {"quantity": quantity, "value": quantity * unit_cost}},
+                session=session
+            )
+        else:
+            await db.cost_layers.update_one({"id": source}, {"$inc": {"remaining": quantity}}, session=session)
+
+
+def allocate(slices: list, quantities: list) -> list:
+    """Split the cost of ``slices`` over ``quantities`` in order.
+
+    Used when one aggregated draw covers several ledger rows: each row
+    gets the layers the draw reached while it was being filled.
+    """
+    costs = []
+    slices = list(slices)
+    for quantity in quantities:
+        cost = 0.0
+        while quantity > 1e-12 and slices:
+            available, unit_cost, source = slices[0]
+            take = min(available, quantity)
+            cost += take * unit_cost
+            quantity -= take
+            if available - take > 1e-12:
+                slices[0] = (available - take, unit_cost, source)
+            else:
+                slices.pop(0)
+        costs.append(cost)
+    return costs
+
+
+def set_cost(doc: dict, total_cost: float) -> dict:
+    quantity = doc['quantity']
+    doc['total_cost'] = total_cost
+    doc['unit_cost'] = total_cost / quantity if quantity else 0.0
+    return doc
+
+
+async def stock_valuation(db) -> list:
+    """Value of the stock held in layers, per material."""
+    if COSTING_METHOD == 'average':
+        pipeline = [
+            {"$match": {"quantity": {"$gt": 0}}},
+            {"$project": {"_id": 0, "material_id": 1, "quantity": 1, "value": 1}},
+        ]
+        return await db.cost_pools.aggregate(pipeline).to_list(None)
+    pipeline = [
+        {"$match": {"remaining": {"$gt": 0}}},
+        {"$group": {
+            "_id": "$material_id",
+            "quantity": {"$sum": "$remaining"},
+            "value": {"$sum": {"$multiply": ["$remaining", "$unit_cost"]}},
+        }},
+        {"$project": {"_id": 0, "material_id": "$_id", "quantity": 1, "value": 1}},
+    ]
+    return await db.cost_layers.aggregate(pipeline).to_list(None)
+
+
+async def seed_opening_layer(db, material_id: str, session=None) -> float:
+    """Cover stock that has no layer yet with one at ``unit_price``.
+
+    The material is marked seeded only if its stock is still the value
+    the layers were compared against; a posting in between makes the
+    mark miss and the opening quantity is worked out again. Inside a
+    transaction the mark also conflicts with any concurrent posting.
+    Returns the quantity of the opening layer.
+    """
+    while True:
+        material = await db.raw_materials.find_one({"id": material_id}, {"_id": 0}, session=session)
+        if material is None or material.get('opening_cost_seeded'):
+            return 0
+        if COSTING_METHOD == 'average':
+            pool = await db.cost_pools.find_one({"material_id": material_id}, session=session)
+            covered = pool['quantity'] if pool else 0
+        else:
+            layers = await db.cost_layers.find(
+                {"material_id": material_id, "remaining": {"$gt": 0}}, {"remaining": 1}, session=session
+            ).to_list(None)
+            covered = sum(layer['remaining'] for layer in layers)
+        stock = material.get('current_stock', 0)
+        marked = await db.raw_materials.update_one(
+            {"id": material_id, "current_stock": stock, "opening_cost_seeded": {"$ne": True}},
+            {"$set": {"opening_cost_seeded": True}},
+            session=session
+        )
+        if marked.modified_count:
+            break
+        # else: the stock moved (or another worker seeded it); look again
+
+    opening = stock - covered
+    if opening <= 0:
+        return 0
+    try:
+        if COSTING_METHOD == 'average':
+            await receive(db, material_id, opening, material.get('unit_price', 0), "opening", session)
+        else:
+            await db.cost_layers.insert_one({
+                "id": str(uuid.uuid4()),
+                "material_id": material_id,
+                "source_id": "opening",
+                # Oldest stock: drawn before any receipt
+                "received_at": datetime(1970, 1, 1, tzinfo=timezone.utc),
+                "quantity": opening,
+                "remaining": opening,
+                "unit_cost": material.get('unit_price', 0),
+            }, session=session)
+    except Exception:
+        if session is None:
+            await db.raw_materials.update_one({"id": material_id}, {"$unset": {"opening_cost_seeded": ""}})
+        raise
+    return opening
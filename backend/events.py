@@ -0,0 +1,199 @@
+"""Change events pushed to clients over Server-Sent Events.
+
+Write handlers call ``events.publish(type, data)`` after a change is
+committed. The event is handed to this worker's subscribers at once and
+also appended to the capped ``events`` collection. Every worker tails
+that collection and forwards the events written by the other workers,
+so a client sees every change no matter which worker it is connected to.
+
+Each client has a bounded queue of EVENT_QUEUE_SIZE events. Publishing
+never waits on a client. If a client falls that far behind, its queue
+is emptied and it gets a single ``resync`` event, telling it to refetch
+instead of patching.
+
+Event ids are the ObjectIds of the capped-collection rows. Each worker
+makes its own, so they are not in insertion order across workers; only
+the capped collection's natural order is. A tail that reopens, and a
+reconnecting client that sends Last-Event-ID, therefore read natural
+order from EVENTS_RESUME_WINDOW_SECONDS before the last event they saw
+(ObjectIds are only that far out of order) and resume after it: the
+tail skips the ids it already forwarded, and the client gets the events
+after its Last-Event-ID, or a ``resync`` when that event is gone or it
+missed more than a queue's worth.
+
+A stream ends once its token expires or its user is revoked; the
+browser reconnects and is asked to sign in again.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+from fast_json import dumps
+
+logger = logging.getLogger(__name__)
+
+EVENT_QUEUE_SIZE = int(os.environ.get('EVENT_QUEUE_SIZE', '256'))
+EVENTS_CAPPED_BYTES = int(os.environ.get('EVENTS_CAPPED_BYTES', str(16 * 1024 * 1024)))
+EVENTS_HEARTBEAT_SECONDS = float(os.environ.get('EVENTS_HEARTBEAT_SECONDS', '15'))
+EVENTS_RESUME_WINDOW_SECONDS = float(os.environ.get('EVENTS_RESUME_WINDOW_SECONDS', '300'))
+
+RESYNC = "resync"
+
+
+def _resume_from(at: datetime) -> dict:
+    """Rows published from a window before ``at``, in natural (insertion) order."""
+    return {"_id": {"$gte": ObjectId.from_datetime(at - timedelta(seconds=EVENTS_RESUME_WINDOW_SECONDS))}}
+
+
+class Subscriber:
+    def __init__(self, types=None):
+        self.types = set(types) if types else None
+        self.queue = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
+
+    def offer(self, event: dict):
+        if self.types is not None and event['type'] not in self.types:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too far behind to catch up by patching: start over
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": RESYNC, "data": {}})
+
+
+class EventBus:
+    def __init__(self):
+        self.worker_id = str(uuid.uuid4())
+        self.subscribers = set()
+        self.db = None
+
+    async def start(self, db):
+        self.db = db
+        try:
+            await db.create_collection("events", capped=True, size=EVENTS_CAPPED_BYTES)
+        except CollectionInvalid:
+            pass
+
+    async def publish(self, type: str, data: dict):
+        event = {
+            "_id": ObjectId(),
+            "type": type,
+            "data": data,
+            "worker": self.worker_id,
+            "at": datetime.now(timezone.utc),
+        }
+        self._deliver(event)
+        try:
+            await self.db.events.insert_one(event)
+        except PyMongoError as e:
+            # The change itself is committed; other workers just miss this event
+            logger.warning(f"Could not fan out {type} event: {e}")
+
+    def _deliver(self, event: dict):
+        for subscriber in list(self.subscribers):
+            subscriber.offer(event)
+
+    async def tail(self):
+        """Forward events published by other workers until cancelled."""
+        # Ids already forwarded (or there before we started), oldest first
+        seen = deque(maxlen=EVENT_QUEUE_SIZE * 16)
+        since = datetime.now(timezone.utc)
+        async for event in self.db.events.find(_resume_from(since), {"_id": 1}):
+            seen.append(event['_id'])
+        seen_ids = set(seen)
+        while True:
+            try:
+                cursor = self.db.events.find(_resume_from(since), cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    async for event in cursor:
+                        if event['_id'] in seen_ids:
+                            continue
+                        if len(seen) == seen.maxlen:
+                            seen_ids.discard(seen[0])
+                        seen.append(event['_id'])
+                        seen_ids.add(event['_id'])
+                        since = max(since, event['_id'].generation_time)
+                        if event.get('worker') != self.worker_id:
+                            self._deliver(event)
+                    await asyncio.sleep(0.5)
+            except PyMongoError as e:
+                logger.warning(f"Event tail failed: {e}")
+            # A tailable cursor over an empty result dies at once; reopen shortly
+            await asyncio.sleep(1)
+
+    def subscribe(self, types=None) -> Subscriber:
+        subscriber = Subscriber(types)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    async def missed(self, last_event_id: str, types=None) -> list:
+        """Events after ``last_event_id`` in insertion order, or one resync."""
+        try:
+            last_id = ObjectId(last_event_id)
+        except (InvalidId, TypeError):
+            return []
+        found = False
+        missed = []
+        async for event in self.db.events.find(_resume_from(last_id.generation_time)):
+            if not found:
+                found = event['_id'] == last_id
+            elif types is None or event['type'] in types:
+                missed.append(event)
+                if len(missed) > EVENT_QUEUE_SIZE:
+                    break
+        if not found or len(missed) > EVENT_QUEUE_SIZE:
+            return [{"type": RESYNC, "data": {}}]
+        return missed
+
+
+def format_event(event: dict) -> bytes:
+    lines = []
+    if event.get('_id') is not None:
+        lines.append(f"id: {event['_id']}")
+    lines.append(f"event: {event['type']}")
+    lines.append(f"data: {dumps(event['data']).decode('utf-8')}")
+    return ("\n".join(lines) + "\n\n").encode('utf-8')
+
+
+async def stream(bus: EventBus, subscriber: Subscriber, request, last_event_id: str = None, authorized=None):
+    """SSE body for one client; ends when the client disconnects, or when
+    ``authorized()`` (checked before every write) turns false."""
+    try:
+        # Tell the browser how long to wait before reconnecting
+        yield b"retry: 3000\n\n"
+        replayed = set()
+        if last_event_id:
+            for event in await bus.missed(last_event_id, subscriber.types):
+                if event.get('_id') is not None:
+                    replayed.add(event['_id'])
+                yield format_event(event)
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                event = None
+            if authorized is not None and not authorized():
+                break
+            if event is None:
+                yield b": keep-alive\n\n"
+            elif event.get('_id') not in replayed:
+                yield format_event(event)
+    finally:
+        bus.unsubscribe(subscriber)
+
+
+events = EventBus()
@@ -0,0 +1,104 @@
+"""Streaming CSV / XLSX export.
+
+Rows are read from a server-side cursor and written out a batch at a
+time, so memory stays flat however many rows are exported. CSV goes to
+the client as it is produced: the header leaves at once, and rows follow
+every CSV_CHUNK_SIZE bytes, before the query has finished. XLSX is a zip archive that can only be finished at the end;
+openpyxl's write-only mode spools the rows to disk and the finished file
+is then streamed. openpyxl is optional; without it only CSV is offered.
+"""
+import asyncio
+import csv
+import io
+import os
+import tempfile
+from datetime import datetime, timezone
+
+try:
+    from openpyxl import Workbook
+except ImportError:  # pragma: no cover - XLSX export is optional
+    Workbook = None
+
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '1000'))
+CSV_CHUNK_SIZE = 16 * 1024
+FILE_CHUNK_SIZE = 64 * 1024
+
+# name -> (collection, date field, columns in output order)
+EXPORTS = {
+    "manufacturing": ("manufacturing_records", "production_date", (
+        "id", "production_date", "machine", "thickness_mm", "width_cm", "length_m", "quantity",
+        "square_meters", "masura_type", "masura_quantity", "color_material_id", "color_name",
+        "model", "gas_consumption_kg", "created_by", "created_at",
+    )),
+    "shipments": ("shipments", "shipment_date", (
+        "id", "shipment_number", "shipment_date", "customer_company", "thickness_mm", "width_cm",
+        "length_m", "color_name", "quantity", "square_meters", "invoice_number", "vehicle_plate",
+        "driver_name", "created_by", "created_at",
+    )),
+    "consumptions": ("consumptions", "created_at", (
+        "id", "production_order_id", "material_id", "material_name", "quantity",
+        "unit_cost", "total_cost", "created_by", "created_at",
+    )),
+}
+
+
+def export_cursor(db, name: str, columns, query: dict):
+    """Rows of ``name`` matching ``query`` (built like the list filters), oldest first."""
+    collection, date_field, _ = EXPORTS[name]
+    projection = {"_id": 0, **{column: 1 for column in columns}}
+    # (date, id) is the pagination index, so this is an index scan
+    return db[collection].find(query, projection).sort(
+        [(date_field, 1), ("id", 1)]
+    ).batch_size(EXPORT_BATCH_SIZE)
+
+
+def _cell(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+async def stream_csv(cursor, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM so Excel opens Turkish characters correctly
+    buffer.write("\ufeff")
+    writer.writerow(columns)
+    yield buffer.getvalue().encode('utf-8')
+    buffer.seek(0)
+    buffer.truncate()
+    async for doc in cursor:
+        writer.writerow([_cell(doc.get(column)) for column in columns])
+        if buffer.tell() >= CSV_CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _naive_utc(value: datetime) -> datetime:
+    # Excel has no time zones; write UTC wall time
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+async def stream_xlsx(cursor, columns, title: str):
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append(list(columns))
+    async for doc in cursor:
+        values = [doc.get(column) for column in columns]
+        sheet.append([_naive_utc(v) if isinstance(v, datetime) else v for v in values])
+
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        # Zipping is CPU work; keep it off the event loop
+        await asyncio.to_thread(workbook.save, path)
+        with open(path, "rb") as f:
+            while chunk := f.read(FILE_CHUNK_SIZE):
+                yield chunk
+    finally:
+        os.remove(path)
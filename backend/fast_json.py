@@ -0,0 +1,111 @@
+"""Fast JSON encoding for large list responses.
+
+With FAST_JSON_RESPONSES=true the list endpoints skip FastAPI's
+response_model validation and encode the Mongo documents directly with
+orjson. To keep the wire format identical to the Pydantic models, each
+document is reduced to the model's fields, in model order, with the
+model defaults filled in for missing fields. tests/test_fast_json.py
+holds the contract. The OpenAPI schema is untouched because the routes
+keep their response_model.
+"""
+import json
+import os
+import typing
+from datetime import date, datetime
+from enum import Enum
+from functools import lru_cache
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - falls back to the stdlib encoder
+    orjson = None
+
+FAST_JSON_RESPONSES = os.environ.get('FAST_JSON_RESPONSES', 'false').lower() == 'true'
+
+
+def _annotation_type(annotation):
+    # Optional[X] -> X
+    args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+    return args[0] if typing.get_origin(annotation) is typing.Union and len(args) == 1 else annotation
+
+
+def _to_float(value):
+    return float(value) if isinstance(value, int) and not isinstance(value, bool) else value
+
+
+def _to_int(value):
+    return int(value) if isinstance(value, float) and value.is_integer() else value
+
+
+def _to_datetime(value):
+    # ISO strings not yet rewritten by the iso_dates migration
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+_COERCE = {float: _to_float, int: _to_int, datetime: _to_datetime}
+
+
+@lru_cache(maxsize=None)
+def _model_fields(model) -> tuple:
+    fields = []
+    for name, field in model.model_fields.items():
+        coerce = _COERCE.get(_annotation_type(field.annotation))
+        if field.default_factory is not None:
+            default = field.default_factory
+        elif field.is_required():
+            default = None
+        else:
+            default = (lambda value: lambda: value)(coerce(field.default) if coerce else field.default)
+        fields.append((name, default, coerce))
+    return tuple(fields)
+
+
+def shape_document(doc: dict, model, fields=None) -> dict:
+    """Reduce a Mongo document to exactly what ``model`` would serialize.
+
+    Keys the model does not declare (``_id``, password hashes, ...) are
+    dropped, missing optional fields get their default, and numbers and
+    dates are coerced the way validation would coerce them. ``fields``
+    narrows the output to a subset of the model's fields.
+    """
+    shaped = {}
+    for name, default, coerce in _model_fields(model):
+        if fields is not None and name not in fields:
+            continue
+        if name in doc:
+            value = doc[name]
+            shaped[name] = coerce(value) if coerce and value is not None else value
+        elif default is not None:
+            shaped[name] = default()
+    return shaped
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        text = value.isoformat()
+        return text[:-6] + "Z" if text.endswith("+00:00") else text
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_UTC_Z)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode('utf-8')
+
+
+def encode_documents(docs: list, model, fields=None) -> bytes:
+    return dumps([shape_document(doc, model, fields) for doc in docs])
+
+
+def encode_page(docs: list, next_cursor, model, fields=None) -> bytes:
+    return dumps({"items": [shape_document(doc, model, fields) for doc in docs], "next_cursor": next_cursor})
+
+
+def json_response(body: bytes, status_code: int = 200) -> Response:
+    return Response(content=body, status_code=status_code, media_type="application/json")
@@ -0,0 +1,134 @@
+"""Materialized finished-goods stock (mamul stok).
+
+The ``finished_stock`` collection holds one document per
+thickness|width|length|color key with the running quantity and square
+meters. Manufacturing records add to it and shipments subtract from it
+through atomic ``$inc`` deltas, so GET /api/stock never has to rescan
+the history. Every delta is also appended to ``finished_stock_movements``
+so past balances can be replayed (see ``stock_history``).
+
+Rebuild from scratch with::
+
+    python finished_stock.py rebuild
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+
+from indexes import ensure_indexes
+
+
+def stock_key(thickness_mm, width_cm, length_m, color_name) -> str:
+    # Same key the old in-memory grouping used: color is '' when missing
+    return f"{thickness_mm}|{width_cm}|{length_m}|{color_name or ''}"
+
+
+def _stock_update(item: dict, sign: int):
+    return (
+        {"key": stock_key(item['thickness_mm'], item['width_cm'], item['length_m'], item.get('color_name'))},
+        {
+            "$inc": {
+                "total_quantity": sign * item['quantity'],
+                "total_square_meters": sign * item['square_meters'],
+            },
+            "$setOnInsert": {
+                "thickness_mm": item['thickness_mm'],
+                "width_cm": item['width_cm'],
+                "length_m": item['length_m'],
+                "color_name": item.get('color_name'),
+            },
+        },
+    )
+
+
+def stock_movement(item: dict, sign: int) -> dict:
+    """Ledger row for a delta, as written to finished_stock_movements."""
+    return {
+        "key": stock_key(item['thickness_mm'], item['width_cm'], item['length_m'], item.get('color_name')),
+        "thickness_mm": item['thickness_mm'],
+        "width_cm": item['width_cm'],
+        "length_m": item['length_m'],
+        "color_name": item.get('color_name'),
+        "quantity": sign * item['quantity'],
+        "square_meters": sign * item['square_meters'],
+        "at": datetime.now(timezone.utc),
+    }
+
+
+def stock_delta(item: dict, sign: int) -> UpdateOne:
+    """Build the upsert that applies ``sign`` * item to its stock row."""
+    return UpdateOne(*_stock_update(item, sign), upsert=True)
+
+
+async def post_finished_stock(db, item: dict, sign: int, session=None):
+    """Add (sign=1) or remove (sign=-1) a record or shipment from stock."""
+    query, update = _stock_update(item, sign)
+    await db.finished_stock.update_one(query, update, upsert=True, session=session)
+    await db.finished_stock_movements.insert_one(stock_movement(item, sign), session=session)
+
+
+async def rebuild_finished_stock(db, session=None) -> int:
+    """Recompute every stock row from manufacturing records and shipments.
+
+    Pass ``session`` to run it inside a transaction while the API is live:
+    readers keep the old rows until it commits, and a delta posted in a
+    transaction meanwhile conflicts with it, so one of the two is retried
+    against the other's result. Without a session nothing may write stock
+    while it runs (the command line, with the API stopped).
+    """
+    group = {
+        "_id": {
+            "thickness_mm": "$thickness_mm",
+            "width_cm": "$width_cm",
+            "length_m": "$length_m",
+            "color_name": {"$ifNull": ["$color_name", None]},
+        },
+        "quantity": {"$sum": "$quantity"},
+        "square_meters": {"$sum": "$square_meters"},
+    }
+    rows = {}
+    async for made in db.manufacturing_records.aggregate([{"$group": group}], allowDiskUse=True, session=session):
+        dims = made['_id']
+        key = stock_key(dims['thickness_mm'], dims['width_cm'], dims['length_m'], dims['color_name'])
+        row = rows.setdefault(key, {**dims, "key": key, "total_quantity": 0, "total_square_meters": 0})
+        row['total_quantity'] += made['quantity']
+        row['total_square_meters'] += made['square_meters']
+
+    async for shipped in db.shipments.aggregate([{"$group": group}], allowDiskUse=True, session=session):
+        dims = shipped['_id']
+        key = stock_key(dims['thickness_mm'], dims['width_cm'], dims['length_m'], dims['color_name'])
+        row = rows.setdefault(key, {**dims, "key": key, "total_quantity": 0, "total_square_meters": 0})
+        row['total_quantity'] -= shipped['quantity']
+        row['total_square_meters'] -= shipped['square_meters']
+
+    await db.finished_stock.delete_many({}, session=session)
+    if rows:
+        await db.finished_stock.insert_many(list(rows.values()), session=session)
+    return len(rows)
+
+
+async def _main(command: str):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        if command == "rebuild":
+            await ensure_indexes(db)
+            count = await rebuild_finished_stock(db)
+            print(f"finished_stock rebuilt: {count} rows")
+        else:
+            raise SystemExit(f"Unknown command: {command}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else "rebuild"))
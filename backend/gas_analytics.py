@@ -0,0 +1,119 @@
+"""Gas efficiency (gaz verimi) analytics over manufacturing history.
+
+The columns needed are read from ``manufacturing_records`` with a narrow
+projection and turned into NumPy/pandas columns; everything after that
+is vectorized. For every machine and thickness this computes:
+
+* gas per square meter, overall (sum of gas / sum of m²) and per roll;
+* a rolling baseline: mean and standard deviation of gas/m² over the
+  previous GAS_BASELINE_WINDOW rolls of the same machine and thickness
+  (the roll itself is left out);
+* the z-score of each roll against its baseline. Rolls with
+  ``|z| >= z_threshold`` are reported as outliers.
+
+Results are cached per worker. The manufacturing write handlers clear
+the cache, and the cache key includes the collection's document count,
+so inserts made by other workers also start a new analysis.
+"""
+import asyncio
+import os
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from cache import TTLCache
+
+GAS_BASELINE_WINDOW = int(os.environ.get('GAS_BASELINE_WINDOW', '30'))
+GAS_BASELINE_MIN_ROLLS = int(os.environ.get('GAS_BASELINE_MIN_ROLLS', '5'))
+GAS_ANALYTICS_CACHE_TTL = float(os.environ.get('GAS_ANALYTICS_CACHE_TTL', '3600'))
+DEFAULT_Z_THRESHOLD = 3.0
+
+PROJECTION = {"_id": 0, "id": 1, "production_date": 1, "machine": 1, "thickness_mm": 1,
+              "square_meters": 1, "gas_consumption_kg": 1}
+GROUP_KEYS = ["machine", "thickness_mm"]
+
+gas_analytics_cache = TTLCache(maxsize=64, ttl=GAS_ANALYTICS_CACHE_TTL)
+
+
+async def load_frame(db, query: dict) -> pd.DataFrame:
+    docs = await db.manufacturing_records.find(query, PROJECTION).sort("production_date", 1).to_list(None)
+    frame = pd.DataFrame({
+        "id": [d['id'] for d in docs],
+        "production_date": pd.to_datetime([d['production_date'] for d in docs], utc=True),
+        "machine": pd.Categorical([getattr(d['machine'], 'value', d['machine']) for d in docs]),
+        "thickness_mm": np.fromiter((d['thickness_mm'] for d in docs), dtype=float, count=len(docs)),
+        "square_meters": np.fromiter((d['square_meters'] for d in docs), dtype=float, count=len(docs)),
+        "gas_consumption_kg": np.fromiter((d['gas_consumption_kg'] for d in docs), dtype=float, count=len(docs)),
+    })
+    return frame
+
+
+def analyze(frame: pd.DataFrame, z_threshold: float = DEFAULT_Z_THRESHOLD) -> dict:
+    # Rolls without area cannot have a gas/m² figure
+    frame = frame[frame['square_meters'] > 0].copy()
+    frame['gas_per_m2'] = frame['gas_consumption_kg'] / frame['square_meters']
+    frame = frame.sort_values("production_date", kind="stable")
+
+    groups = frame.groupby(GROUP_KEYS, observed=True, sort=True)
+    previous = groups['gas_per_m2'].shift()
+    rolling = previous.groupby([frame['machine'], frame['thickness_mm']], observed=True).rolling(
+        GAS_BASELINE_WINDOW, min_periods=GAS_BASELINE_MIN_ROLLS
+    )
+    # groupby().rolling() puts the group keys in front of the row index
+    frame['baseline'] = rolling.mean().droplevel([0, 1])
+    frame['baseline_std'] = rolling.std().droplevel([0, 1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        frame['z_score'] = (frame['gas_per_m2'] - frame['baseline']) / frame['baseline_std']
+    frame['z_score'] = frame['z_score'].replace([np.inf, -np.inf], np.nan)
+
+    summary = groups.agg(
+        rolls=("gas_per_m2", "size"),
+        total_gas_kg=("gas_consumption_kg", "sum"),
+        total_square_meters=("square_meters", "sum"),
+        mean_gas_per_m2=("gas_per_m2", "mean"),
+        std_gas_per_m2=("gas_per_m2", "std"),
+    )
+    summary['gas_per_m2'] = summary['total_gas_kg'] / summary['total_square_meters']
+    last = frame.groupby(GROUP_KEYS, observed=True, sort=True).tail(1).set_index(GROUP_KEYS)
+    summary['baseline_gas_per_m2'] = last['baseline']
+    outliers = frame[frame['z_score'].abs() >= z_threshold]
+    summary['outliers'] = outliers.groupby(GROUP_KEYS, observed=True).size()
+    summary['outliers'] = summary['outliers'].fillna(0).astype(int)
+
+    def records(df: pd.DataFrame) -> list:
+        # NaN (e.g. std of a single roll) -> None
+        return df.astype(object).where(df.notna(), None).to_dict("records")
+
+    return {
+        "rolls": int(len(frame)),
+        "groups": records(summary.reset_index()),
+        "outliers": records(outliers[[
+            "id", "production_date", "machine", "thickness_mm", "square_meters",
+            "gas_consumption_kg", "gas_per_m2", "baseline", "z_score",
+        ]].astype({"machine": str})),
+    }
+
+
+async def gas_efficiency(db, date_from: Optional[datetime] = None, date_to: Optional[datetime] = None,
+                         machine: Optional[str] = None, z_threshold: float = DEFAULT_Z_THRESHOLD) -> dict:
+    query = {}
+    if date_from or date_to:
+        query["production_date"] = {}
+        if date_from:
+            query["production_date"]["$gte"] = date_from
+        if date_to:
+            query["production_date"]["$lt"] = date_to
+    if machine:
+        query["machine"] = machine
+
+    count = await db.manufacturing_records.estimated_document_count()
+    key = (date_from, date_to, machine, z_threshold, count)
+    result = gas_analytics_cache.get(key)
+    if result is None:
+        frame = await load_frame(db, query)
+        # pandas work is CPU-bound; keep the event loop free
+        result = await asyncio.to_thread(analyze, frame, z_threshold)
+        gas_analytics_cache.set(key, result)
+    return result
@@ -0,0 +1,173 @@
+"""Declared MongoDB indexes and the query shapes they are meant to serve.
+
+``ensure_indexes`` creates every index in INDEXES at startup.
+create_index is a no-op for an index that already exists, so this is
+safe to run on every boot. ``advise`` runs ``explain()`` on each entry of
+QUERY_SHAPES and reports the ones whose winning plan is a COLLSCAN.
+"""
+import logging
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+ENTITY_COLLECTIONS = [
+    "users", "raw_materials", "products", "stock_transactions", "production_orders",
+    "consumptions", "shipments", "manufacturing_records",
+]
+
+# (collection, keys, options)
+INDEXES = [
+    *[(name, [("id", ASCENDING)], {"unique": True}) for name in ENTITY_COLLECTIONS],
+    ("users", [("username", ASCENDING)], {"unique": True}),
+    ("raw_materials", [("code", ASCENDING)], {"unique": True}),
+    ("raw_materials", [("name", ASCENDING)], {}),
+    ("products", [("code", ASCENDING)], {"unique": True}),
+    ("finished_stock", [("key", ASCENDING)], {"unique": True}),
+    ("production_rollups", [("key", ASCENDING)], {"unique": True}),
+    ("cost_layers", [("id", ASCENDING)], {"unique": True}),
+    ("cost_layers", [("material_id", ASCENDING), ("received_at", ASCENDING), ("id", ASCENDING)], {}),
+    ("cost_pools", [("material_id", ASCENDING)], {"unique": True}),
+    ("stock_snapshots", [("kind", ASCENDING), ("taken_at", ASCENDING)], {}),
+    ("finished_stock_movements", [("at", ASCENDING)], {}),
+    ("production_rollups", [("period", ASCENDING), ("start", ASCENDING)], {}),
+    ("production_orders", [("order_number", ASCENDING)], {"unique": True}),
+    ("shipments", [("shipment_number", ASCENDING)], {"unique": True}),
+    ("shipments", [("search_keys", ASCENDING)], {}),
+    ("raw_materials", [("search_keys", ASCENDING)], {}),
+
+    # Keyset pagination: (sort key, id)
+    ("users", [("created_at", ASCENDING), ("id", ASCENDING)], {}),
+    ("raw_materials", [("created_at", ASCENDING), ("id", ASCENDING)], {}),
+    ("products", [("created_at", ASCENDING), ("id", ASCENDING)], {}),
+    ("stock_transactions", [("created_at", ASCENDING), ("id", ASCENDING)], {}),
+    ("production_orders", [("created_at", ASCENDING), ("id", ASCENDING)], {}),
+    ("consumptions", [("created_at", ASCENDING), ("id", ASCENDING)], {}),
+    ("shipments", [("shipment_date", ASCENDING), ("id", ASCENDING)], {}),
+    ("manufacturing_records", [("production_date", ASCENDING), ("id", ASCENDING)], {}),
+
+    # Filtered list pages: equality fields, then (sort key, id). The
+    # dimension indexes also serve thickness alone and thickness + width.
+    ("manufacturing_records", [("machine", ASCENDING), ("production_date", ASCENDING), ("id", ASCENDING)], {}),
+    ("manufacturing_records", [("thickness_mm", ASCENDING), ("width_cm", ASCENDING), ("length_m", ASCENDING),
+                               ("color_name", ASCENDING), ("production_date", ASCENDING), ("id", ASCENDING)], {}),
+    ("manufacturing_records", [("color_name", ASCENDING), ("production_date", ASCENDING), ("id", ASCENDING)], {}),
+    ("manufacturing_records", [("masura_type", ASCENDING), ("production_date", ASCENDING), ("id", ASCENDING)], {}),
+    ("shipments", [("customer_company", ASCENDING), ("shipment_date", ASCENDING), ("id", ASCENDING)], {}),
+    ("shipments", [("thickness_mm", ASCENDING), ("width_cm", ASCENDING), ("length_m", ASCENDING),
+                   ("color_name", ASCENDING), ("shipment_date", ASCENDING), ("id", ASCENDING)], {}),
+    ("shipments", [("color_name", ASCENDING), ("shipment_date", ASCENDING), ("id", ASCENDING)], {}),
+    ("consumptions", [("material_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)], {}),
+    ("consumptions", [("production_order_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)], {}),
+]
+
+# Shapes of the hot queries in server.py, checked by the index advisor
+QUERY_SHAPES = [
+    *[{"name": f"{name} by id", "collection": name, "filter": {"id": "x"}} for name in ENTITY_COLLECTIONS],
+    {"name": "login by username", "collection": "users", "filter": {"username": "x"}},
+    {"name": "raw material by code", "collection": "raw_materials", "filter": {"code": "GAZ001"}},
+    {"name": "masura by name", "collection": "raw_materials", "filter": {"name": "Masura 100"}},
+    {"name": "product by code", "collection": "products", "filter": {"code": "x"}},
+    {"name": "finished stock by key", "collection": "finished_stock", "filter": {"key": "x"}},
+    {"name": "oldest cost layer", "collection": "cost_layers",
+     "filter": {"material_id": "x", "remaining": {"$gt": 0}}, "sort": [("received_at", ASCENDING), ("id", ASCENDING)]},
+    {"name": "cost pool by material", "collection": "cost_pools", "filter": {"material_id": "x"}},
+    {"name": "nearest stock snapshot", "collection": "stock_snapshots",
+     "filter": {"kind": "raw_materials", "taken_at": {"$lte": datetime(2025, 1, 31)}}, "sort": [("taken_at", DESCENDING)]},
+    {"name": "finished stock movements since snapshot", "collection": "finished_stock_movements",
+     "filter": {"at": {"$gt": datetime(2025, 1, 30), "$lte": datetime(2025, 1, 31)}}},
+    {"name": "production rollup by key", "collection": "production_rollups", "filter": {"key": "x"}},
+    {"name": "production rollups in range", "collection": "production_rollups",
+     "filter": {"period": "month", "start": {"$gte": datetime(2025, 1, 1), "$lt": datetime(2026, 1, 1)}}},
+    # seed_sequence's $match; the $group after it reads every match
+    {"name": "order numbers to seed from", "collection": "production_orders",
+     "filter": {"order_number": {"$regex": "^PRD-\\d+$"}}},
+    {"name": "shipment numbers to seed from", "collection": "shipments",
+     "filter": {"shipment_number": {"$regex": "^SEV-\\d+$"}}},
+    {"name": "users page", "collection": "users", "filter": {},
+     "sort": [("created_at", ASCENDING), ("id", ASCENDING)]},
+    {"name": "raw materials page", "collection": "raw_materials", "filter": {},
+     "sort": [("created_at", ASCENDING), ("id", ASCENDING)]},
+    {"name": "products page", "collection": "products", "filter": {},
+     "sort": [("created_at", ASCENDING), ("id", ASCENDING)]},
+    {"name": "stock transactions page", "collection": "stock_transactions", "filter": {},
+     "sort": [("created_at", DESCENDING), ("id", DESCENDING)]},
+    {"name": "production orders page", "collection": "production_orders", "filter": {},
+     "sort": [("created_at", DESCENDING), ("id", DESCENDING)]},
+    {"name": "consumptions page", "collection": "consumptions", "filter": {},
+     "sort": [("created_at", DESCENDING), ("id", DESCENDING)]},
+    {"name": "shipments page", "collection": "shipments", "filter": {},
+     "sort": [("shipment_date", DESCENDING), ("id", DESCENDING)]},
+    {"name": "manufacturing page", "collection": "manufacturing_records", "filter": {},
+     "sort": [("production_date", DESCENDING), ("id", DESCENDING)]},
+    {"name": "shipment search", "collection": "shipments", "filter": {"search_keys": {"$regex": "^abc"}},
+     "sort": [("shipment_date", DESCENDING), ("id", DESCENDING)]},
+    {"name": "raw material search", "collection": "raw_materials", "filter": {"search_keys": {"$regex": "^ren"}},
+     "sort": [("created_at", DESCENDING), ("id", DESCENDING)]},
+    {"name": "manufacturing page by machine and date", "collection": "manufacturing_records",
+     "filter": {"machine": "Makine 1", "production_date": {"$gte": datetime(2025, 1, 1), "$lt": datetime(2025, 2, 1)}},
+     "sort": [("production_date", DESCENDING), ("id", DESCENDING)]},
+    {"name": "manufacturing page by dimensions", "collection": "manufacturing_records",
+     "filter": {"thickness_mm": 2.0, "width_cm": 100.0}, "sort": [("production_date", DESCENDING), ("id", DESCENDING)]},
+    {"name": "manufacturing page by color", "collection": "manufacturing_records",
+     "filter": {"color_name": "Renk Mavi"}, "sort": [("production_date", DESCENDING), ("id", DESCENDING)]},
+    {"name": "manufacturing page by masura", "collection": "manufacturing_records",
+     "filter": {"masura_type": "Masura 100"}, "sort": [("production_date", DESCENDING), ("id", DESCENDING)]},
+    {"name": "shipments page by customer", "collection": "shipments",
+     "filter": {"customer_company": "x"}, "sort": [("shipment_date", DESCENDING), ("id", DESCENDING)]},
+    {"name": "shipments page by dimensions and color", "collection": "shipments",
+     "filter": {"thickness_mm": 2.0, "width_cm": 100.0, "length_m": 50.0, "color_name": "Renk Mavi"},
+     "sort": [("shipment_date", DESCENDING), ("id", DESCENDING)]},
+    {"name": "consumptions page by material", "collection": "consumptions",
+     "filter": {"material_id": "x"}, "sort": [("created_at", DESCENDING), ("id", DESCENDING)]},
+    {"name": "consumptions in date range", "collection": "consumptions",
+     "filter": {"created_at": {"$gte": datetime(2025, 1, 1), "$lt": datetime(2025, 2, 1)}}},
+]
+
+
+async def ensure_indexes(db):
+    """Create every declared index, logging (not raising) on conflicts.
+
+    A unique index fails to build while duplicates exist; that must not
+    keep the API from starting, so the error is logged for an admin to
+    clean up the data.
+    """
+    for collection, keys, options in INDEXES:
+        try:
+            await db[collection].create_index(keys, **options)
+        except OperationFailure as e:
+            logger.error(f"Could not create index {keys} on {collection}: {e}")
+
+
+def _plan_stages(plan) -> list:
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for key in ('queryPlan', 'inputStage', 'inputStages'):
+            if key in plan:
+                stages.extend(_plan_stages(plan[key]))
+    elif isinstance(plan, list):
+        for child in plan:
+            stages.extend(_plan_stages(child))
+    return stages
+
+
+async def explain_shape(db, shape: dict) -> dict:
+    command = {"find": shape['collection'], "filter": shape['filter'], "limit": 1}
+    if shape.get('sort'):
+        command['sort'] = dict(shape['sort'])
+    explained = await db.command("explain", command, verbosity="queryPlanner")
+    stages = _plan_stages(explained['queryPlanner']['winningPlan'])
+    return {
+        "name": shape['name'],
+        "collection": shape['collection'],
+        "stages": stages,
+        "collscan": "COLLSCAN" in stages,
+    }
+
+
+async def advise(db) -> list:
+    return [await explain_shape(db, shape) for shape in QUERY_SHAPES]
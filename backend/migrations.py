@@ -0,0 +1,253 @@
+"""One-time data migrations, run online in the background.
+
+``migrate_iso_dates`` converts the ISO-8601 strings that older versions
+wrote for created_at, production_date, shipment_date, planned_date and
+completed_date into native BSON dates. It walks each collection in _id
+order, in batches, sleeping between batches so it never competes with
+API traffic. Progress (the last _id converted) is saved after every
+batch, so a restart resumes where it stopped.
+
+``opening_cost_layers`` gives the stock on hand when costing was
+introduced a cost layer at each material's unit_price, and
+``consumption_costs`` stores the cost of every older consumption at
+that price, so cost reports only ever sum stored costs.
+
+``search_keys`` writes the folded search keys (see ``search``) on the
+shipments and raw materials created before search existed.
+
+Run one by hand with::
+
+    python migrations.py iso_dates
+"""
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+from pymongo import UpdateOne
+
+from cost_analysis import ROLLUP_STATE_ID
+from costing import seed_opening_layer
+from search import SEARCH_FIELDS, search_keys
+from stock_posting import supports_transactions
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_BATCH_SIZE = int(os.environ.get('MIGRATION_BATCH_SIZE', '500'))
+MIGRATION_PAUSE_SECONDS = float(os.environ.get('MIGRATION_PAUSE_SECONDS', '0.2'))
+
+DATE_FIELDS = {
+    "users": ["created_at"],
+    "raw_materials": ["created_at"],
+    "products": ["created_at"],
+    "stock_transactions": ["created_at"],
+    "production_orders": ["created_at", "planned_date", "completed_date"],
+    "consumptions": ["created_at"],
+    "shipments": ["created_at", "shipment_date"],
+    "manufacturing_records": ["created_at", "production_date"],
+}
+
+
+def parse_iso_date(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+async def migrate_iso_dates(db, batch_size: int = MIGRATION_BATCH_SIZE, pause: float = MIGRATION_PAUSE_SECONDS) -> int:
+    """Convert string dates to BSON dates; returns documents converted."""
+    state = await db.migrations.find_one({"_id": "iso_dates"}) or {}
+    if state.get('done'):
+        return 0
+
+    progress = state.get('progress', {})
+    converted = 0
+    for collection, fields in DATE_FIELDS.items():
+        pending = {"$or": [{field: {"$type": "string"}} for field in fields]}
+        last_id = progress.get(collection)
+        while True:
+            query = pending if last_id is None else {"$and": [pending, {"_id": {"$gt": last_id}}]}
+            docs = await db[collection].find(query, {field: 1 for field in fields}) \
+                .sort("_id", 1).limit(batch_size).to_list(batch_size)
+            if not docs:
+                break
+
+            ops = []
+            for doc in docs:
+                strings = {field: doc[field] for field in fields if isinstance(doc.get(field), str)}
+                try:
+                    dates = {field: parse_iso_date(value) for field, value in strings.items()}
+                except ValueError as e:
+                    logger.warning(f"Skipping {collection} {doc['_id']}: {e}")
+                    continue
+                # Match the old strings too, so a concurrent write is never overwritten
+                ops.append(UpdateOne({"_id": doc['_id'], **strings}, {"$set": dates}))
+            if ops:
+                result = await db[collection].bulk_write(ops, ordered=False)
+                converted += result.modified_count
+
+            last_id = docs[-1]['_id']
+            await db.migrations.update_one(
+                {"_id": "iso_dates"}, {"$set": {f"progress.{collection}": last_id}}, upsert=True
+            )
+            await asyncio.sleep(pause)
+
+    await db.migrations.update_one(
+        {"_id": "iso_dates"},
+        {"$set": {"done": True, "finished_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+    logger.info(f"ISO date migration finished: {converted} documents converted")
+    return converted
+
+
+async def seed_opening_cost_layers(db, batch_size: int = MIGRATION_BATCH_SIZE, pause: float = MIGRATION_PAUSE_SECONDS) -> int:
+    """Give each material's uncovered stock an opening layer.
+
+    Runs before the API serves (see server startup), and each material
+    is sized and seeded in one transaction where the server supports
+    them, so no draw ever sees stock without its opening layer.
+    """
+    state = await db.migrations.find_one({"_id": "opening_cost_layers"}) or {}
+    if state.get('done'):
+        return 0
+
+    transactional = await supports_transactions(db.client)
+    seeded = 0
+    async for material in db.raw_materials.find(
+        {"current_stock": {"$gt": 0}, "opening_cost_seeded": {"$ne": True}}, {"_id": 0, "id": 1}
+    ):
+        if transactional:
+            async def run(session, material_id=material['id']):
+                return await seed_opening_layer(db, material_id, session)
+
+            async with await db.client.start_session() as session:
+                opening = await session.with_transaction(run)
+        else:
+            opening = await seed_opening_layer(db, material['id'])
+        seeded += opening > 0
+    await db.migrations.update_one(
+        {"_id": "opening_cost_layers"},
+        {"$set": {"done": True, "finished_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+    logger.info(f"Opening cost layers seeded for {seeded} materials")
+    return seeded
+
+
+async def backfill_consumption_costs(db, batch_size: int = MIGRATION_BATCH_SIZE, pause: float = MIGRATION_PAUSE_SECONDS) -> int:
+    """Price consumptions posted before costing at the material's unit_price."""
+    state = await db.migrations.find_one({"_id": "consumption_costs"}) or {}
+    if state.get('done'):
+        return 0
+
+    prices = {
+        m['id']: m.get('unit_price', 0)
+        for m in await db.raw_materials.find({}, {"_id": 0, "id": 1, "unit_price": 1}).to_list(None)
+    }
+    pending = {"total_cost": {"$exists": False}}
+    last_id = state.get('progress')
+    priced = 0
+    while True:
+        query = pending if last_id is None else {"$and": [pending, {"_id": {"$gt": last_id}}]}
+        docs = await db.consumptions.find(query, {"material_id": 1, "quantity": 1}) \
+            .sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not docs:
+            break
+
+        ops = []
+        for doc in docs:
+            unit_price = prices.get(doc.get('material_id'), 0)
+            ops.append(UpdateOne(
+                {"_id": doc['_id'], "total_cost": {"$exists": False}},
+                {"$set": {"unit_cost": unit_price, "total_cost": (doc.get('quantity') or 0) * unit_price}}
+            ))
+        result = await db.consumptions.bulk_write(ops, ordered=False)
+        priced += result.modified_count
+
+        last_id = docs[-1]['_id']
+        await db.migrations.update_one(
+            {"_id": "consumption_costs"}, {"$set": {"progress": last_id}}, upsert=True
+        )
+        await asyncio.sleep(pause)
+
+    # Months rolled up before the backfill summed no cost: roll them up again
+    await db.rollup_state.delete_one({"_id": ROLLUP_STATE_ID})
+    await db.migrations.update_one(
+        {"_id": "consumption_costs"},
+        {"$set": {"done": True, "finished_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+    logger.info(f"Consumption cost backfill finished: {priced} consumptions priced")
+    return priced
+
+
+async def backfill_search_keys(db, batch_size: int = MIGRATION_BATCH_SIZE, pause: float = MIGRATION_PAUSE_SECONDS) -> int:
+    state = await db.migrations.find_one({"_id": "search_keys"}) or {}
+    if state.get('done'):
+        return 0
+
+    written = 0
+    pending = {"search_keys": {"$exists": False}}
+    for collection, fields in SEARCH_FIELDS.items():
+        projection = {name: 1 for name in fields}
+        while True:
+            docs = await db[collection].find(pending, projection).limit(batch_size).to_list(batch_size)
+            if not docs:
+                break
+            ops = [
+                UpdateOne({"_id": doc['_id']}, {"$set": {"search_keys": search_keys(doc, collection)}})
+                for doc in docs
+            ]
+            result = await db[collection].bulk_write(ops, ordered=False)
+            written += result.modified_count
+            await asyncio.sleep(pause)
+    await db.migrations.update_one(
+        {"_id": "search_keys"},
+        {"$set": {"done": True, "finished_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+    logger.info(f"Search keys written for {written} documents")
+    return written
+
+
+# Run in this order; opening layers first so early withdrawals draw FIFO
+MIGRATIONS = {
+    "opening_cost_layers": seed_opening_cost_layers,
+    "iso_dates": migrate_iso_dates,
+    "consumption_costs": backfill_consumption_costs,
+    "search_keys": backfill_search_keys,
+}
+
+
+async def run_pending_migrations(db):
+    for name, migration in MIGRATIONS.items():
+        try:
+            await migration(db)
+        except Exception as e:
+            # Resumable: the next start picks up from the saved progress
+            logger.error(f"Migration {name} failed: {e}")
+
+
+async def _main(name: str):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    try:
+        if name not in MIGRATIONS:
+            raise SystemExit(f"Unknown migration: {name}")
+        count = await MIGRATIONS[name](db, pause=0)
+        print(f"{name}: {count} documents converted")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else "iso_dates"))
@@ -0,0 +1,136 @@
+"""Keyset (cursor) pagination for the list endpoints.
+
+Pages are ordered by a sort key plus ``id`` as tie-breaker. The cursor
+is the opaque, base64-encoded (sort value, id) pair of the last row, so
+the next page is a single bounded range scan on the (sort key, id)
+index no matter how deep the client has paged.
+
+Set LEGACY_LIST_RESPONSES=true, or pass ``?legacy=true``, to get the
+old plain list of at most 1000 rows. With FAST_JSON_RESPONSES=true
+pages are encoded by ``fast_json`` rather than FastAPI (see there).
+
+Endpoints that take ``?fields=a,b`` read and return only those fields
+(plus ``id``). The field list becomes the Mongo projection, so the
+other fields are never read or serialized. Such partial documents do
+not fit the route's response_model, so they are always encoded by
+``fast_json``.
+"""
+import base64
+import os
+from typing import Generic, List, Optional, Tuple, TypeVar
+
+from bson import json_util
+from fastapi import HTTPException, Query
+from pydantic import BaseModel
+
+from fast_json import FAST_JSON_RESPONSES, encode_documents, encode_page, json_response
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+LEGACY_LIMIT = 1000
+LEGACY_LIST_RESPONSES = os.environ.get('LEGACY_LIST_RESPONSES', 'false').lower() == 'true'
+
+T = TypeVar("T")
+
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None
+
+
+class PageParams:
+    def __init__(
+        self,
+        limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+        after: Optional[str] = None,
+        legacy: bool = Query(LEGACY_LIST_RESPONSES),
+    ):
+        self.limit = limit
+        self.after = after
+        self.legacy = legacy
+
+
+class FieldParams:
+    def __init__(
+        self,
+        fields: Optional[str] = Query(None, description="Comma-separated fields to return; id is always included"),
+    ):
+        self.fields = fields
+
+    def select(self, model) -> Optional[Tuple[str, ...]]:
+        """The requested field names, in model order; None for all fields."""
+        if not self.fields:
+            return None
+        requested = {name.strip() for name in self.fields.split(",") if name.strip()}
+        unknown = requested - set(model.model_fields)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+        requested.add("id")
+        return tuple(name for name in model.model_fields if name in requested)
+
+
+def field_projection(fields: Optional[Tuple[str, ...]], sort_key: str) -> dict:
+    """Mongo projection for ``fields``; the sort key is read for the cursor."""
+    if fields is None:
+        return {"_id": 0}
+    return {"_id": 0, sort_key: 1, **{name: 1 for name in fields}}
+
+
+def encode_cursor(value, doc_id: str) -> str:
+    raw = json_util.dumps([value, doc_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, doc_id = json_util.loads(base64.urlsafe_b64decode(padded))
+        return value, doc_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_filter(sort_key: str, direction: int, value, doc_id: str) -> dict:
+    op = "$lt" if direction < 0 else "$gt"
+    return {"$or": [
+        {sort_key: {op: value}},
+        {sort_key: value, "id": {op: doc_id}},
+    ]}
+
+
+async def fetch_page(collection, query: dict, projection: dict, sort_key: str, direction: int, params: PageParams):
+    """Return (items, next_cursor) for one page of ``collection``.
+
+    In legacy mode the whole result (capped at LEGACY_LIMIT) is returned
+    and next_cursor is always None.
+    """
+    sort = [(sort_key, direction), ("id", direction)]
+    if params.legacy:
+        return await collection.find(query, projection).sort(sort).to_list(LEGACY_LIMIT), None
+
+    if params.after:
+        value, doc_id = decode_cursor(params.after)
+        after = keyset_filter(sort_key, direction, value, doc_id)
+        query = {"$and": [query, after]} if query else after
+
+    # One extra row tells us whether another page exists
+    items = await collection.find(query, projection).sort(sort).limit(params.limit + 1).to_list(params.limit + 1)
+    next_cursor = None
+    if len(items) > params.limit:
+        items = items[:params.limit]
+        last = items[-1]
+        next_cursor = encode_cursor(last.get(sort_key), last['id'])
+    return items, next_cursor
+
+
+def page_response(items: list, next_cursor: Optional[str], params: PageParams, model=None, fields=None):
+    """Build the list response; with FAST_JSON_RESPONSES set and a ``model``
+    given, the documents are encoded directly instead of being validated
+    through the route's response_model. So are ``fields`` selections."""
+    if model is not None and (FAST_JSON_RESPONSES or fields is not None):
+        if params.legacy:
+            return json_response(encode_documents(items, model, fields))
+        return json_response(encode_page(items, next_cursor, model, fields))
+    if params.legacy:
+        return items
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,67 @@
+"""bcrypt hashing run off the event loop.
+
+bcrypt is deliberately slow (~250 ms at the default cost), so calling it
+inline in an async handler stalls every other request on the worker.
+Hashes are computed in a bounded thread or process pool instead; a
+semaphore caps how many requests may wait on the pool so a login storm
+queues at the door rather than piling up work.
+
+Settings (environment):
+    BCRYPT_ROUNDS              cost factor for new hashes (default 12)
+    PASSWORD_HASH_EXECUTOR     "thread" (default) or "process"
+    PASSWORD_HASH_WORKERS      pool size (default 4)
+    PASSWORD_HASH_CONCURRENCY  max hashes in flight or queued (default 2 x workers)
+"""
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+PASSWORD_HASH_EXECUTOR = os.environ.get('PASSWORD_HASH_EXECUTOR', 'thread')
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '4'))
+PASSWORD_HASH_CONCURRENCY = int(os.environ.get('PASSWORD_HASH_CONCURRENCY', str(2 * PASSWORD_HASH_WORKERS)))
+
+_executor = None
+_semaphore = asyncio.Semaphore(PASSWORD_HASH_CONCURRENCY)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        if PASSWORD_HASH_EXECUTOR == 'process':
+            _executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+        else:
+            # bcrypt releases the GIL while hashing, so threads run in parallel
+            _executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+    return _executor
+
+
+def _hash(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _check(password: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed)
+
+
+async def _run(func, *args):
+    async with _semaphore:
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), func, *args)
+
+
+async def hash_password(password: str) -> str:
+    hashed = await _run(_hash, password.encode('utf-8'), BCRYPT_ROUNDS)
+    return hashed.decode('utf-8')
+
+
+async def verify_password(password: str, hashed: str) -> bool:
+    return await _run(_check, password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def shutdown_password_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
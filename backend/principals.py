@@ -0,0 +1,87 @@
+"""Verified-principal cache and token revocation list.
+
+Decoding and checking a JWT on every request is cheap but not free, and
+GET /auth/me used to read db.users each time. Verified token payloads
+are cached by token hash until the earlier of their ``exp`` and
+PRINCIPAL_CACHE_TTL; user profiles are cached by id.
+
+Revocations (e.g. a deleted user) live in the ``revocations``
+collection. Each worker keeps them in a dict so the per-request check is
+a single lookup, and reloads the dict when the version counter in
+``revocation_state`` changes. The counter is polled every
+REVOCATION_POLL_SECONDS, which bounds how long another worker can keep
+accepting a revoked token.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+TOKEN_TTL_SECONDS = int(os.environ.get('TOKEN_TTL_SECONDS', str(12 * 3600)))
+PRINCIPAL_CACHE_SIZE = int(os.environ.get('PRINCIPAL_CACHE_SIZE', '10000'))
+PRINCIPAL_CACHE_TTL = float(os.environ.get('PRINCIPAL_CACHE_TTL', '300'))
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', '60'))
+REVOCATION_POLL_SECONDS = float(os.environ.get('REVOCATION_POLL_SECONDS', '5'))
+
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+user_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+
+def token_key(token: str) -> str:
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class RevocationList:
+    STATE_ID = "revocations"
+
+    def __init__(self):
+        self.version = None
+        self._revoked_before = {}
+
+    def is_revoked(self, payload: dict) -> bool:
+        revoked_before = self._revoked_before.get(payload['user_id'])
+        return revoked_before is not None and payload['iat'] <= revoked_before
+
+    async def refresh(self, db):
+        state = await db.revocation_state.find_one({"_id": self.STATE_ID})
+        version = state['version'] if state else 0
+        if version == self.version:
+            return
+        # Entries older than the token lifetime can no longer match a valid token
+        horizon = time.time() - TOKEN_TTL_SECONDS
+        entries = await db.revocations.find(
+            {"revoked_before": {"$gte": horizon}}, {"_id": 0}
+        ).to_list(None)
+        self._revoked_before = {e['user_id']: e['revoked_before'] for e in entries}
+        self.version = version
+
+    async def revoke_user(self, db, user_id: str):
+        """Invalidate every token issued to ``user_id`` so far."""
+        revoked_before = time.time()
+        await db.revocations.update_one(
+            {"user_id": user_id},
+            {"$set": {"revoked_before": revoked_before}},
+            upsert=True
+        )
+        await db.revocation_state.update_one({"_id": self.STATE_ID}, {"$inc": {"version": 1}}, upsert=True)
+        self._revoked_before[user_id] = revoked_before
+        user_cache.pop(user_id)
+
+    async def prune(self, db):
+        await db.revocations.delete_many({"revoked_before": {"$lt": time.time() - TOKEN_TTL_SECONDS}})
+
+    async def poll(self, db):
+        while True:
+            try:
+                await self.refresh(db)
+            except Exception as e:
+                logger.warning(f"Revocation list refresh failed: {e}")
+            await asyncio.sleep(REVOCATION_POLL_SECONDS)
+
+
+revocations = RevocationList()
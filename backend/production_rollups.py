@@ -0,0 +1,239 @@
+"""Production rollups (üretim raporu) by day, week and month.
+
+``production_rollups`` holds one document per period bucket, machine,
+thickness and color with the summed square meters, quantity, gas and
+masura usage. The manufacturing handlers keep it current with ``$inc``
+deltas, the same way ``finished_stock`` is maintained, so a report never
+reads ``manufacturing_records``.
+
+A report over any day-aligned range is put together from whole buckets
+of the requested size, with daily buckets filling the partial weeks or
+months at either end. Buckets are in UTC; weeks are ISO weeks.
+
+Rebuild from scratch with::
+
+    python production_rollups.py rebuild
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+
+from pymongo import UpdateOne
+
+from indexes import ensure_indexes
+
+PERIODS = ("day", "week", "month")
+PERIOD_FORMATS = {
+    "day": "%Y-%m-%d",
+    "week": "%G-W%V",
+    "month": "%Y-%m",
+}
+METRICS = ("record_count", "quantity", "square_meters", "gas_consumption_kg", "masura_quantity")
+
+
+def _plain(value):
+    # Enum members from model_dump() -> their stored string
+    return getattr(value, 'value', value)
+
+
+def _as_utc(value) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def bucket_start(value: datetime, period: str) -> datetime:
+    value = _as_utc(value)
+    day = datetime(value.year, value.month, value.day, tzinfo=timezone.utc)
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start: datetime, period: str) -> datetime:
+    if period == "day":
+        return start + timedelta(days=1)
+    if period == "week":
+        return start + timedelta(weeks=1)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def _buckets(record: dict):
+    """(key, fields) for each bucket the record belongs to."""
+    machine = _plain(record['machine'])
+    color_name = record.get('color_name')
+    for period in PERIODS:
+        start = bucket_start(record['production_date'], period)
+        key = f"{period}|{start:%Y-%m-%d}|{machine}|{record['thickness_mm']}|{color_name or ''}"
+        yield key, {
+            "period": period,
+            "start": start,
+            "machine": machine,
+            "thickness_mm": record['thickness_mm'],
+            "color_name": color_name,
+        }
+
+
+def _increments(record: dict, sign: int) -> dict:
+    masura_type = _plain(record['masura_type'])
+    return {
+        "record_count": sign,
+        "quantity": sign * record['quantity'],
+        "square_meters": sign * record['square_meters'],
+        "gas_consumption_kg": sign * record['gas_consumption_kg'],
+        "masura_quantity": sign * record['masura_quantity'],
+        f"masura_by_type.{masura_type}": sign * record['masura_quantity'],
+    }
+
+
+def rollup_deltas(records: list, sign: int) -> list:
+    """One upsert per bucket touched by ``records`` (sign=1 add, -1 remove)."""
+    buckets = {}
+    for record in records:
+        increments = _increments(record, sign)
+        for key, fields in _buckets(record):
+            if key in buckets:
+                inc = buckets[key][1]
+                for name, value in increments.items():
+                    inc[name] = inc.get(name, 0) + value
+            else:
+                buckets[key] = (fields, dict(increments))
+    return [
+        UpdateOne({"key": key}, {"$inc": inc, "$setOnInsert": fields}, upsert=True)
+        for key, (fields, inc) in buckets.items()
+    ]
+
+
+async def post_production_rollups(db, records: list, sign: int, session=None):
+    deltas = rollup_deltas(records, sign)
+    if deltas:
+        await db.production_rollups.bulk_write(deltas, ordered=False, session=session)
+
+
+async def rebuild_production_rollups(db, session=None) -> int:
+    """Recompute every bucket from manufacturing_records.
+
+    Pass ``session`` to run it inside a transaction while the API is
+    live, as ``rebuild_finished_stock`` does. Without one, writes must be
+    paused while this runs, otherwise deltas posted in the middle of the
+    rebuild are lost.
+    """
+    rows = {}
+    async for record in db.manufacturing_records.find({}, {"_id": 0}, session=session):
+        increments = _increments(record, 1)
+        for key, fields in _buckets(record):
+            row = rows.setdefault(key, {"key": key, **fields, "masura_by_type": {}})
+            for name, value in increments.items():
+                if name.startswith("masura_by_type."):
+                    masura_type = name.split(".", 1)[1]
+                    row['masura_by_type'][masura_type] = row['masura_by_type'].get(masura_type, 0) + value
+                else:
+                    row[name] = row.get(name, 0) + value
+
+    await db.production_rollups.delete_many({}, session=session)
+    if rows:
+        await db.production_rollups.insert_many(list(rows.values()), session=session)
+    return len(rows)
+
+
+def _add(totals: dict, label: str, row: dict):
+    key = (label, row['machine'], row['thickness_mm'], row.get('color_name'))
+    total = totals.get(key)
+    if total is None:
+        total = totals[key] = {
+            "period": label,
+            "machine": row['machine'],
+            "thickness_mm": row['thickness_mm'],
+            "color_name": row.get('color_name'),
+            **{name: 0 for name in METRICS},
+            "masura_by_type": {},
+        }
+    for name in METRICS:
+        total[name] += row.get(name, 0)
+    for masura_type, quantity in (row.get('masura_by_type') or {}).items():
+        total['masura_by_type'][masura_type] = total['masura_by_type'].get(masura_type, 0) + quantity
+
+
+def _range_query(period: str, date_from: Optional[datetime], date_to: Optional[datetime], filters: dict) -> dict:
+    start = {}
+    if date_from is not None:
+        start["$gte"] = date_from
+    if date_to is not None:
+        start["$lt"] = date_to
+    query = {"period": period, **filters}
+    if start:
+        query["start"] = start
+    return query
+
+
+async def production_report(db, granularity: str = "day", date_from: Optional[datetime] = None,
+                            date_to: Optional[datetime] = None, filters: Optional[dict] = None) -> list:
+    """Totals per ``granularity`` bucket, machine, thickness and color in [from, to).
+
+    ``date_from`` and ``date_to`` are rounded down to whole UTC days.
+    """
+    filters = filters or {}
+    date_from = bucket_start(date_from, "day") if date_from else None
+    date_to = bucket_start(date_to, "day") if date_to else None
+
+    # Whole buckets of the requested size, daily buckets for the partial ends
+    ranges = [(granularity, date_from, date_to)]
+    if granularity != "day":
+        first = None
+        if date_from is not None:
+            first = bucket_start(date_from, granularity)
+            if first != date_from:
+                first = next_bucket(first, granularity)
+        last = bucket_start(date_to, granularity) if date_to is not None else None
+        if first is None or last is None or first < last:
+            ranges = [(granularity, first, last)]
+            if first is not None:
+                ranges.append(("day", date_from, first))
+            if last is not None:
+                ranges.append(("day", last, date_to))
+        else:
+            ranges = [("day", date_from, date_to)]
+
+    totals = {}
+    for period, start, end in ranges:
+        if start is not None and end is not None and start >= end:
+            continue
+        async for row in db.production_rollups.find(_range_query(period, start, end, filters), {"_id": 0}):
+            if row.get('record_count', 0) <= 0:
+                continue
+            _add(totals, bucket_start(row['start'], granularity).strftime(PERIOD_FORMATS[granularity]), row)
+    return sorted(
+        totals.values(),
+        key=lambda r: (r['period'], r['machine'], r['thickness_mm'], r['color_name'] or '')
+    )
+
+
+async def _main(command: str):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    try:
+        if command == "rebuild":
+            await ensure_indexes(db)
+            count = await rebuild_production_rollups(db)
+            print(f"production_rollups rebuilt: {count} buckets")
+        else:
+            raise SystemExit(f"Unknown command: {command}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else "rebuild"))
@@ -0,0 +1,93 @@
+"""Prefix search over shipments and raw materials.
+
+Every searchable document carries ``search_keys``: its searchable
+fields folded to lowercase ASCII with the Turkish rules (``İ``/``I`` ->
+``i``, ``ı`` -> ``i``, ``ş`` -> ``s``, ...). Each field contributes its
+whole value and every word and alphanumeric run in it, with punctuation
+and spaces removed. So "34 ABC 123" is found by "34abc" as well as by
+"abc", and "IRS-2024-001" by "001".
+
+A query is folded the same way. Each of its words must prefix-match a
+key. An anchored, case-sensitive regex (``^kelime``) on the multikey
+``search_keys`` index is a bounded index range scan; further words
+filter that scan. MongoDB collations are not used because a regex
+cannot use a collation.
+
+Results come newest first (SEARCH_DATES, then id), read off the
+``(date, id)`` index the list pages already use: a short, common prefix
+stops after ``limit`` matches, and for a rare one the query planner
+picks the ``search_keys`` range scan instead. Within those ``limit``
+candidates, documents where every word is a whole key ("abc" for
+"ABC") come before those that only share a prefix ("abcd").
+
+Keys are written with the document. The ``search_keys`` migration
+backfills documents written before search existed.
+"""
+import re
+import unicodedata
+
+SEARCH_FIELDS = {
+    "shipments": ("customer_company", "invoice_number", "vehicle_plate", "driver_name", "shipment_number"),
+    "raw_materials": ("name", "code"),
+}
+# Result order, newest first; served by the (date, id) list-page indexes
+SEARCH_DATES = {"shipments": "shipment_date", "raw_materials": "created_at"}
+DEFAULT_SEARCH_LIMIT = 10
+MAX_SEARCH_LIMIT = 50
+
+# Turkish dotted/dotless i; the rest is handled by stripping accents
+_TURKISH = str.maketrans({"İ": "i", "I": "i", "ı": "i"})
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def fold(text: str) -> str:
+    """Lowercase ASCII, Turkish-aware: "İRSALİYE Şoförü" -> "irsaliye soforu"."""
+    text = unicodedata.normalize("NFKD", text.translate(_TURKISH).lower())
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def _words(text: str) -> list:
+    return [word for word in (_NON_ALNUM.sub("", part) for part in fold(text).split()) if word]
+
+
+def search_keys(doc: dict, collection: str) -> list:
+    keys = set()
+    for field in SEARCH_FIELDS[collection]:
+        value = doc.get(field)
+        if not value:
+            continue
+        # Whole value, words, and the runs between punctuation ("IRS-2024-001")
+        words = _words(str(value))
+        keys.update(words)
+        keys.add("".join(words))
+        keys.update(run for run in _NON_ALNUM.split(fold(str(value))) if run)
+    return sorted(keys)
+
+
+def with_search_keys(doc: dict, collection: str) -> dict:
+    doc['search_keys'] = search_keys(doc, collection)
+    return doc
+
+
+def search_query(text: str) -> dict:
+    """Filter matching ``text``; None when it has nothing to search for."""
+    words = _words(text)
+    if not words:
+        return None
+    clauses = [{"search_keys": {"$regex": f"^{re.escape(word)}"}} for word in words]
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+async def search(db, collection: str, text: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list:
+    query = search_query(text)
+    if query is None:
+        return []
+    date = SEARCH_DATES[collection]
+    docs = await db[collection].find(query, {"_id": 0}) \
+        .sort([(date, -1), ("id", -1)]).limit(limit).to_list(limit)
+    # Stable sort: whole-word matches first, newest first within each
+    words = set(_words(text))
+    docs.sort(key=lambda doc: not words <= set(doc['search_keys']))
+    for doc in docs:
+        del doc['search_keys']
+    return docs
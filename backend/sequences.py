@@ -0,0 +1,96 @@
+"""Document number sequences (PRD-xxxxx, SEV-xxxxx).
+
+Numbers come from counters in the ``sequences`` collection, advanced
+with an atomic findOneAndUpdate ``$inc``, so two concurrent requests can
+never get the same number and deletes never cause reuse.
+
+Settings (environment):
+    SEQUENCE_BLOCK_SIZE            numbers reserved per round trip (default 1).
+                                   Values above 1 let a worker hand out numbers
+                                   from memory; numbers stay unique but are no
+                                   longer gap-free or in creation order across
+                                   workers.
+    DOCUMENT_NUMBER_YEARLY_RESET   "true" to restart numbering every year as
+                                   PRD-2026-00001
+"""
+import asyncio
+import os
+import re
+from datetime import datetime, timezone
+
+from pymongo import ReturnDocument
+
+SEQUENCE_BLOCK_SIZE = int(os.environ.get('SEQUENCE_BLOCK_SIZE', '1'))
+DOCUMENT_NUMBER_YEARLY_RESET = os.environ.get('DOCUMENT_NUMBER_YEARLY_RESET', 'false').lower() == 'true'
+
+
+async def _reserve(db, name: str, count: int) -> int:
+    """Advance ``name`` by ``count`` and return the new (last reserved) value."""
+    doc = await db.sequences.find_one_and_update(
+        {"_id": name},
+        {"$inc": {"value": count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return doc['value']
+
+
+class SequenceAllocator:
+    def __init__(self, block_size: int = 1):
+        self.block_size = block_size
+        self._blocks = {}
+        self._lock = asyncio.Lock()
+
+    async def next(self, db, name: str) -> int:
+        if self.block_size <= 1:
+            return await _reserve(db, name, 1)
+        async with self._lock:
+            block = self._blocks.get(name)
+            if block is None or block[0] > block[1]:
+                end = await _reserve(db, name, self.block_size)
+                block = self._blocks[name] = [end - self.block_size + 1, end]
+            value = block[0]
+            block[0] += 1
+            return value
+
+
+allocator = SequenceAllocator(SEQUENCE_BLOCK_SIZE)
+
+
+def _sequence_name(prefix: str, now: datetime) -> str:
+    return f"{prefix}-{now.year}" if DOCUMENT_NUMBER_YEARLY_RESET else prefix
+
+
+def _number_prefix(prefix: str, now: datetime) -> str:
+    return f"{prefix}-{now.year}-" if DOCUMENT_NUMBER_YEARLY_RESET else f"{prefix}-"
+
+
+async def next_document_number(db, prefix: str) -> str:
+    now = datetime.now(timezone.utc)
+    value = await allocator.next(db, _sequence_name(prefix, now))
+    return f"{_number_prefix(prefix, now)}{value:05d}"
+
+
+async def seed_sequence(db, prefix: str, collection: str, field: str):
+    """Start the sequence above the highest number already issued.
+
+    Numbers used to come from count_documents()+1, so existing documents
+    must not be handed out again. The highest is found by value, not by
+    string order: "PRD-100000" sorts below "PRD-99999". ``$max`` keeps
+    this safe to run on every startup and from several workers at once.
+    """
+    now = datetime.now(timezone.utc)
+    number_prefix = _number_prefix(prefix, now)
+    # The prefix is ASCII, so its byte length is where the digits start
+    rows = await db[collection].aggregate([
+        {"$match": {field: {"$regex": f"^{re.escape(number_prefix)}\\d+$"}}},
+        {"$group": {
+            "_id": None,
+            "highest": {"$max": {"$toLong": {"$substr": [f"${field}", len(number_prefix), 20]}}},
+        }},
+    ]).to_list(None)
+    highest = rows[0]['highest'] if rows else 0
+    if highest:
+        await db.sequences.update_one(
+            {"_id": _sequence_name(prefix, now)}, {"$max": {"value": highest}}, upsert=True
+        )
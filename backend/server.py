@@ -1,35 +1,69 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import os
+import asyncio
+import time
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from pydantic import BaseModel, Field, ConfigDict, ValidationError
+from typing import Dict, List, Optional, Union
 import uuid
-from datetime import datetime, timezone
-import bcrypt
+from datetime import datetime, timedelta, timezone
 import jwt
 from enum import Enum
+from finished_stock import post_finished_stock, rebuild_finished_stock, stock_delta, stock_key, stock_movement
+from gas_analytics import DEFAULT_Z_THRESHOLD, gas_analytics_cache, gas_efficiency
+from stock_history import HistoryPending, NoHistory, finished_stock_as_of, raw_stock_as_of, run_compaction, snapshot_finished_stock
+from production_rollups import post_production_rollups, production_report, rebuild_production_rollups
+from indexes import ensure_indexes, advise
+from stock_posting import post_stock, post_stock_batch, supports_transactions, MaterialNotFound, InsufficientStock
+from bulk_import import iter_csv, iter_ndjson, batched, format_validation_error
+from password_hashing import hash_password, verify_password, shutdown_password_pool
+from sequences import next_document_number, seed_sequence
+from cache import TTLCache
+from migrations import run_pending_migrations, seed_opening_cost_layers
+from catalog import catalog
+from principals import TOKEN_TTL_SECONDS, PRINCIPAL_CACHE_TTL, principal_cache, user_cache, token_key, revocations
+from cost_analysis import cost_analysis
+from costing import allocate, draw, restore, set_cost, stock_valuation
+from export import EXPORTS, Workbook, export_cursor, stream_csv, stream_xlsx
+from pagination import FieldParams, Page, PageParams, fetch_page, field_projection, page_response
+from events import events, stream as event_stream
+from versions import versions
+from compression import CompressionMiddleware
+from search import DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT, search, with_search_keys
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, tz_aware=True)
 db = client[os.environ['DB_NAME']]
 
 # JWT Settings
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
 
+# Dashboard snapshot, dropped by every write that changes a statistic
+DASHBOARD_CACHE_TTL = float(os.environ.get('DASHBOARD_CACHE_TTL', '10'))
+dashboard_cache = TTLCache(maxsize=1, ttl=DASHBOARD_CACHE_TTL)
+dashboard_lock = asyncio.Lock()
+
+# A first-start seeding lease older than this is taken to be abandoned
+SEED_LEASE_SECONDS = float(os.environ.get('SEED_LEASE_SECONDS', '600'))
+
 # Create the main app
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 # Enums
 class UserRole(str, Enum):
@@ -97,6 +131,8 @@ class StockTransaction(BaseModel):
     quantity: float
     reference: Optional[str] = None
     notes: Optional[str] = None
+    unit_cost: Optional[float] = None  # Birim maliyet: receipt price, or drawn cost for OUT
+    total_cost: Optional[float] = None
     created_by: str
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -106,6 +142,7 @@ class StockTransactionCreate(BaseModel):
     quantity: float
     reference: Optional[str] = None
     notes: Optional[str] = None
+    unit_cost: Optional[float] = Field(None, ge=0)  # IN only; defaults to the material's unit_price
 
 class Product(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -188,6 +225,8 @@ class Consumption(BaseModel):
     material_id: str
     material_name: str
     quantity: float
+    unit_cost: Optional[float] = None  # Priced from cost layers when posted
+    total_cost: Optional[float] = None
     created_by: str
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -226,12 +265,73 @@ class ShipmentCreate(BaseModel):
     vehicle_plate: str
     driver_name: str
 
+class CostPeriod(str, Enum):
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+
+class ExportCollection(str, Enum):
+    MANUFACTURING = "manufacturing"
+    SHIPMENTS = "shipments"
+    CONSUMPTIONS = "consumptions"
+
+class ExportFormat(str, Enum):
+    CSV = "csv"
+    XLSX = "xlsx"
+
 class CostAnalysis(BaseModel):
     material_id: str
+    period: Optional[str] = None  # day, week or month bucket when grouped
     material_name: str
     total_quantity: float
     total_cost: float
 
+class StockValuation(BaseModel):
+    material_id: str
+    material_name: str
+    quantity: float
+    value: float
+
+class ProductionReportRow(BaseModel):
+    period: str  # day, week (ISO) or month bucket
+    machine: MachineType
+    thickness_mm: float
+    color_name: Optional[str] = None
+    record_count: int
+    quantity: int
+    square_meters: float
+    gas_consumption_kg: float
+    masura_quantity: int
+    masura_by_type: Dict[str, int] = {}
+
+class GasEfficiencyGroup(BaseModel):
+    machine: MachineType
+    thickness_mm: float
+    rolls: int
+    total_gas_kg: float
+    total_square_meters: float
+    gas_per_m2: float  # sum of gas / sum of m²
+    mean_gas_per_m2: float
+    std_gas_per_m2: Optional[float] = None
+    baseline_gas_per_m2: Optional[float] = None  # latest rolling baseline
+    outliers: int
+
+class GasOutlier(BaseModel):
+    id: str
+    production_date: datetime
+    machine: MachineType
+    thickness_mm: float
+    square_meters: float
+    gas_consumption_kg: float
+    gas_per_m2: float
+    baseline: float
+    z_score: float
+
+class GasEfficiencyReport(BaseModel):
+    rolls: int
+    groups: List[GasEfficiencyGroup]
+    outliers: List[GasOutlier]
+
 class DashboardStats(BaseModel):
     total_raw_materials: int
     total_products: int
@@ -239,28 +339,153 @@ class DashboardStats(BaseModel):
     pending_shipments: int
     low_stock_materials: int
 
-# Auth Helper Functions
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+# List Filters
+def filter_query(date_field: str, date_from: Optional[datetime], date_to: Optional[datetime], **equals) -> dict:
+    # Equality fields first, then the date range: the (fields..., date, id) indexes serve both
+    query = {name: getattr(value, 'value', value) for name, value in equals.items() if value is not None}
+    if date_from and date_to and date_from >= date_to:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    if date_from or date_to:
+        query[date_field] = {}
+        if date_from:
+            query[date_field]["$gte"] = date_from
+        if date_to:
+            query[date_field]["$lt"] = date_to
+    return query
+
+class ManufacturingFilters:
+    def __init__(
+        self,
+        date_from: Optional[datetime] = Query(None, alias="from"),
+        date_to: Optional[datetime] = Query(None, alias="to"),
+        machine: Optional[MachineType] = None,
+        thickness_mm: Optional[float] = None,
+        width_cm: Optional[float] = None,
+        length_m: Optional[float] = None,
+        color_name: Optional[str] = None,
+        masura_type: Optional[MasuraType] = None,
+    ):
+        self.query = filter_query(
+            "production_date", date_from, date_to,
+            machine=machine, thickness_mm=thickness_mm, width_cm=width_cm, length_m=length_m,
+            color_name=color_name, masura_type=masura_type
+        )
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+class ShipmentFilters:
+    def __init__(
+        self,
+        date_from: Optional[datetime] = Query(None, alias="from"),
+        date_to: Optional[datetime] = Query(None, alias="to"),
+        customer_company: Optional[str] = None,
+        thickness_mm: Optional[float] = None,
+        width_cm: Optional[float] = None,
+        length_m: Optional[float] = None,
+        color_name: Optional[str] = None,
+    ):
+        self.query = filter_query(
+            "shipment_date", date_from, date_to,
+            customer_company=customer_company, thickness_mm=thickness_mm, width_cm=width_cm,
+            length_m=length_m, color_name=color_name
+        )
 
+class ConsumptionFilters:
+    def __init__(
+        self,
+        date_from: Optional[datetime] = Query(None, alias="from"),
+        date_to: Optional[datetime] = Query(None, alias="to"),
+        material_id: Optional[str] = None,
+        production_order_id: Optional[str] = None,
+    ):
+        self.query = filter_query(
+            "created_at", date_from, date_to,
+            material_id=material_id, production_order_id=production_order_id
+        )
+
+# Auth Helper Functions
 def create_token(user_id: str, username: str, role: str) -> str:
+    now = int(time.time())
     payload = {
         'user_id': user_id,
         'username': username,
-        'role': role
+        'role': role,
+        'iat': now,
+        'exp': now + TOKEN_TTL_SECONDS
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+def authenticate(token: str) -> dict:
+    key = token_key(token)
+    payload = principal_cache.get(key)
+    if payload is None:
+        try:
+            payload = jwt.decode(
+                token, JWT_SECRET, algorithms=[JWT_ALGORITHM],
+                options={"require": ["exp", "iat"]}
+            )
+        except jwt.PyJWTError:
+            raise HTTPException(status_code=401, detail="Invalid authentication")
+        # Never serve a cached principal past its token's expiry
+        principal_cache.set(key, payload, ttl=min(PRINCIPAL_CACHE_TTL, payload['exp'] - time.time()))
+    if revocations.is_revoked(payload):
+        raise HTTPException(status_code=401, detail="Invalid authentication")
+    return payload
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return authenticate(credentials.credentials)
+
+# Transaction Helpers
+async def in_transaction(fn):
+    """Run ``fn(session)`` in a transaction, or with ``session=None`` on a standalone server."""
+    if not await supports_transactions(client):
+        return await fn(None)
+    async with await client.start_session() as session:
+        return await session.with_transaction(fn)
+
+async def seed_once(name: str, rebuild) -> Optional[int]:
+    """Run the first-start ``rebuild(session)`` of ``name`` on one worker.
+
+    A lease in ``migrations`` picks the worker, and the rebuild runs in a
+    transaction, so a delta another worker posts meanwhile conflicts with
+    it and one of the two is retried. Returns None when another worker
+    holds the lease, or when the server cannot run transactions: then the
+    table is left to the command-line rebuild with the API stopped.
+    """
+    if not await supports_transactions(client):
+        logger.warning(f"{name} is not seeded: run `python {name}.py rebuild` with the API stopped")
+        return None
+    now = datetime.now(timezone.utc)
     try:
-        token = credentials.credentials
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
-    except:
-        raise HTTPException(status_code=401, detail="Invalid authentication")
+        await db.migrations.insert_one({"_id": name, "started_at": now})
+    except DuplicateKeyError:
+        # Take over a lease whose worker died part way
+        stale = now - timedelta(seconds=SEED_LEASE_SECONDS)
+        taken = await db.migrations.update_one(
+            {"_id": name, "done": {"$ne": True}, "started_at": {"$lt": stale}}, {"$set": {"started_at": now}}
+        )
+        if not taken.modified_count:
+            return None
+    try:
+        count = await in_transaction(rebuild)
+    except Exception:
+        await db.migrations.delete_one({"_id": name, "started_at": now})
+        raise
+    await db.migrations.update_one(
+        {"_id": name}, {"$set": {"done": True, "finished_at": datetime.now(timezone.utc)}}
+    )
+    return count
+
+# Conditional GET Helpers
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    if versions.matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+    return None
+
+def with_etag(result, response: Response, etag: str):
+    # page_response hands back a ready Response on the fast JSON path
+    target = result if isinstance(result, Response) else response
+    target.headers["ETag"] = etag
+    target.headers["Cache-Control"] = "private, no-cache"
+    return result
 
 # Auth Routes
 @api_router.post("/auth/register", response_model=User)
@@ -269,7 +494,7 @@ async def register(user_data: UserCreate):
     if existing:
         raise HTTPException(status_code=400, detail="Username already exists")
     
-    hashed_pw = hash_password(user_data.password)
+    hashed_pw = await hash_password(user_data.password)
     user_obj = User(
         username=user_data.username,
         email=user_data.email,
@@ -278,15 +503,15 @@ async def register(user_data: UserCreate):
     
     doc = user_obj.model_dump()
     doc['password'] = hashed_pw
-    doc['created_at'] = doc['created_at'].isoformat()
     
     await db.users.insert_one(doc)
+    await versions.bump(db, "users")
     return user_obj
 
 @api_router.post("/auth/login")
 async def login(credentials: UserLogin):
     user = await db.users.find_one({"username": credentials.username})
-    if not user or not verify_password(credentials.password, user['password']):
+    if not user or not await verify_password(credentials.password, user['password']):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     token = create_token(user['id'], user['username'], user['role'])
@@ -302,12 +527,14 @@ async def login(credentials: UserLogin):
 
 @api_router.get("/auth/me", response_model=User)
 async def get_me(current_user = Depends(get_current_user)):
-    user = await db.users.find_one({"id": current_user['user_id']}, {"_id": 0, "password": 0})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    if isinstance(user['created_at'], str):
-        user['created_at'] = datetime.fromisoformat(user['created_at'])
-    return User(**user)
+    user = user_cache.get(current_user['user_id'])
+    if user is None:
+        user = await db.users.find_one({"id": current_user['user_id']}, {"_id": 0, "password": 0})
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        user = User(**user)
+        user_cache.set(current_user['user_id'], user)
+    return user
 
 # Raw Material Routes
 @api_router.post("/raw-materials", response_model=RawMaterial)
@@ -320,27 +547,49 @@ async def create_raw_material(material_data: RawMaterialCreate, current_user = D
         raise HTTPException(status_code=400, detail="Material code already exists")
     
     material_obj = RawMaterial(**material_data.model_dump())
-    doc = material_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
+    doc = with_search_keys(material_obj.model_dump(), "raw_materials")
     
     await db.raw_materials.insert_one(doc)
+    await catalog.changed(db, doc)
+    await versions.bump(db, "raw_materials")
+    dashboard_cache.clear()
+    
     return material_obj
 
-@api_router.get("/raw-materials", response_model=List[RawMaterial])
-async def get_raw_materials(current_user = Depends(get_current_user)):
-    materials = await db.raw_materials.find({}, {"_id": 0}).to_list(1000)
-    for mat in materials:
-        if isinstance(mat['created_at'], str):
-            mat['created_at'] = datetime.fromisoformat(mat['created_at'])
-    return materials
+@api_router.get("/raw-materials", response_model=Union[Page[RawMaterial], List[RawMaterial]])
+async def get_raw_materials(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    as_of: Optional[datetime] = Query(None, description="Report current_stock as it stood at this time"),
+    current_user = Depends(get_current_user)
+):
+    # Stock postings bump raw_materials too, so this also covers as_of reads
+    etag = versions.etag(request, "raw_materials")
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    
+    if as_of is None:
+        materials, next_cursor = await fetch_page(db.raw_materials, {}, {"_id": 0}, "created_at", 1, page)
+        return with_etag(page_response(materials, next_cursor, page, RawMaterial), response, etag)
+    
+    try:
+        balances = await raw_stock_as_of(db, as_of)
+    except HistoryPending:
+        raise HTTPException(status_code=409, detail="Stock history is available once the date migration has finished")
+    materials, next_cursor = await fetch_page(
+        db.raw_materials, {"created_at": {"$lte": as_of}}, {"_id": 0}, "created_at", 1, page
+    )
+    for material in materials:
+        material['current_stock'] = balances.get(material['id'], 0)
+    return with_etag(page_response(materials, next_cursor, page, RawMaterial), response, etag)
 
 @api_router.get("/raw-materials/{material_id}", response_model=RawMaterial)
 async def get_raw_material(material_id: str, current_user = Depends(get_current_user)):
     material = await db.raw_materials.find_one({"id": material_id}, {"_id": 0})
     if not material:
         raise HTTPException(status_code=404, detail="Material not found")
-    if isinstance(material['created_at'], str):
-        material['created_at'] = datetime.fromisoformat(material['created_at'])
     return RawMaterial(**material)
 
 # Stock Transaction Routes
@@ -349,40 +598,39 @@ async def create_stock_transaction(transaction_data: StockTransactionCreate, cur
     if current_user['role'] == 'viewer':
         raise HTTPException(status_code=403, detail="Permission denied")
     
-    material = await db.raw_materials.find_one({"id": transaction_data.material_id})
-    if not material:
-        raise HTTPException(status_code=404, detail="Material not found")
-    
     transaction_obj = StockTransaction(
         **transaction_data.model_dump(),
         created_by=current_user['username']
     )
     
     doc = transaction_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    await db.stock_transactions.insert_one(doc)
     
-    # Update material stock
-    new_stock = material['current_stock']
-    if transaction_data.transaction_type == TransactionType.IN:
-        new_stock += transaction_data.quantity
-    else:
-        new_stock -= transaction_data.quantity
+    # Update material stock and write the transaction atomically
+    delta = transaction_data.quantity
+    if transaction_data.transaction_type == TransactionType.OUT:
+        delta = -delta
+    try:
+        material = await post_stock(db, transaction_data.material_id, delta, ledger=("stock_transactions", doc))
+    except MaterialNotFound:
+        raise HTTPException(status_code=404, detail="Material not found")
+    except InsufficientStock:
+        raise HTTPException(status_code=400, detail="Insufficient stock")
     
-    await db.raw_materials.update_one(
-        {"id": transaction_data.material_id},
-        {"$set": {"current_stock": new_stock}}
-    )
+    await versions.bump(db, "raw_materials")
+    dashboard_cache.clear()
     
-    return transaction_obj
+    # post_stock filled in the cost
+    transaction = StockTransaction(**doc)
+    await events.publish("stock_transaction.created", {
+        "transaction": transaction.model_dump(),
+        "current_stock": material['current_stock'],
+    })
+    return transaction
 
-@api_router.get("/stock-transactions", response_model=List[StockTransaction])
-async def get_stock_transactions(current_user = Depends(get_current_user)):
-    transactions = await db.stock_transactions.find({}, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    for trans in transactions:
-        if isinstance(trans['created_at'], str):
-            trans['created_at'] = datetime.fromisoformat(trans['created_at'])
-    return transactions
+@api_router.get("/stock-transactions", response_model=Union[Page[StockTransaction], List[StockTransaction]])
+async def get_stock_transactions(page: PageParams = Depends(), current_user = Depends(get_current_user)):
+    transactions, next_cursor = await fetch_page(db.stock_transactions, {}, {"_id": 0}, "created_at", -1, page)
+    return page_response(transactions, next_cursor, page, StockTransaction)
 
 # Product Routes
 @api_router.post("/products", response_model=Product)
@@ -396,18 +644,22 @@ async def create_product(product_data: ProductCreate, current_user = Depends(get
     
     product_obj = Product(**product_data.model_dump())
     doc = product_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     
     await db.products.insert_one(doc)
+    await versions.bump(db, "products")
+    dashboard_cache.clear()
+    
     return product_obj
 
-@api_router.get("/products", response_model=List[Product])
-async def get_products(current_user = Depends(get_current_user)):
-    products = await db.products.find({}, {"_id": 0}).to_list(1000)
-    for prod in products:
-        if isinstance(prod['created_at'], str):
-            prod['created_at'] = datetime.fromisoformat(prod['created_at'])
-    return products
+@api_router.get("/products", response_model=Union[Page[Product], List[Product]])
+async def get_products(request: Request, response: Response, page: PageParams = Depends(), current_user = Depends(get_current_user)):
+    etag = versions.etag(request, "products")
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    
+    products, next_cursor = await fetch_page(db.products, {}, {"_id": 0}, "created_at", 1, page)
+    return with_etag(page_response(products, next_cursor, page, Product), response, etag)
 
 # Production Order Routes
 @api_router.post("/production-orders", response_model=ProductionOrder)
@@ -420,8 +672,7 @@ async def create_production_order(order_data: ProductionOrderCreate, current_use
         raise HTTPException(status_code=404, detail="Product not found")
     
     # Generate order number
-    count = await db.production_orders.count_documents({}) + 1
-    order_number = f"PRD-{count:05d}"
+    order_number = await next_document_number(db, "PRD")
     
     order_obj = ProductionOrder(
         order_number=order_number,
@@ -434,23 +685,16 @@ async def create_production_order(order_data: ProductionOrderCreate, current_use
     )
     
     doc = order_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    doc['planned_date'] = doc['planned_date'].isoformat()
     
     await db.production_orders.insert_one(doc)
+    dashboard_cache.clear()
+    
     return order_obj
 
-@api_router.get("/production-orders", response_model=List[ProductionOrder])
-async def get_production_orders(current_user = Depends(get_current_user)):
-    orders = await db.production_orders.find({}, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    for order in orders:
-        if isinstance(order['created_at'], str):
-            order['created_at'] = datetime.fromisoformat(order['created_at'])
-        if isinstance(order['planned_date'], str):
-            order['planned_date'] = datetime.fromisoformat(order['planned_date'])
-        if order.get('completed_date') and isinstance(order['completed_date'], str):
-            order['completed_date'] = datetime.fromisoformat(order['completed_date'])
-    return orders
+@api_router.get("/production-orders", response_model=Union[Page[ProductionOrder], List[ProductionOrder]])
+async def get_production_orders(page: PageParams = Depends(), current_user = Depends(get_current_user)):
+    orders, next_cursor = await fetch_page(db.production_orders, {}, {"_id": 0}, "created_at", -1, page)
+    return page_response(orders, next_cursor, page, ProductionOrder)
 
 @api_router.patch("/production-orders/{order_id}/status")
 async def update_production_status(order_id: str, status: ProductionStatus, current_user = Depends(get_current_user)):
@@ -463,14 +707,23 @@ async def update_production_status(order_id: str, status: ProductionStatus, curr
     
     update_data = {"status": status}
     if status == ProductionStatus.COMPLETED:
-        update_data['completed_date'] = datetime.now(timezone.utc).isoformat()
+        update_data['completed_date'] = datetime.now(timezone.utc)
         # Update product stock
         await db.products.update_one(
             {"id": order['product_id']},
             {"$inc": {"current_stock": order['quantity']}}
         )
+        await versions.bump(db, "products")
     
     await db.production_orders.update_one({"id": order_id}, {"$set": update_data})
+    dashboard_cache.clear()
+    await events.publish("production_order.status_changed", {
+        "id": order_id,
+        "product_id": order['product_id'],
+        "status": status,
+        "completed_date": update_data.get('completed_date'),
+    })
+    
     return {"message": "Status updated successfully"}
 
 # Consumption Routes
@@ -483,9 +736,6 @@ async def create_consumption(consumption_data: ConsumptionCreate, current_user =
     if not material:
         raise HTTPException(status_code=404, detail="Material not found")
     
-    if material['current_stock'] < consumption_data.quantity:
-        raise HTTPException(status_code=400, detail="Insufficient stock")
-    
     consumption_obj = Consumption(
         **consumption_data.model_dump(),
         material_name=material['name'],
@@ -493,24 +743,33 @@ async def create_consumption(consumption_data: ConsumptionCreate, current_user =
     )
     
     doc = consumption_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    await db.consumptions.insert_one(doc)
     
-    # Update material stock
-    await db.raw_materials.update_one(
-        {"id": consumption_data.material_id},
-        {"$inc": {"current_stock": -consumption_data.quantity}}
-    )
+    # Update material stock; the guard rejects the posting if stock is short
+    try:
+        material = await post_stock(db, consumption_data.material_id, -consumption_data.quantity, ledger=("consumptions", doc))
+    except MaterialNotFound:
+        raise HTTPException(status_code=404, detail="Material not found")
+    except InsufficientStock:
+        raise HTTPException(status_code=400, detail="Insufficient stock")
     
-    return consumption_obj
+    await versions.bump(db, "raw_materials")
+    dashboard_cache.clear()
+    
+    consumption = Consumption(**doc)
+    await events.publish("consumption.created", {
+        "consumption": consumption.model_dump(),
+        "current_stock": material['current_stock'],
+    })
+    return consumption
 
-@api_router.get("/consumptions", response_model=List[Consumption])
-async def get_consumptions(current_user = Depends(get_current_user)):
-    consumptions = await db.consumptions.find({}, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    for cons in consumptions:
-        if isinstance(cons['created_at'], str):
-            cons['created_at'] = datetime.fromisoformat(cons['created_at'])
-    return consumptions
+@api_router.get("/consumptions", response_model=Union[Page[Consumption], List[Consumption]])
+async def get_consumptions(
+    page: PageParams = Depends(),
+    filters: ConsumptionFilters = Depends(),
+    current_user = Depends(get_current_user)
+):
+    consumptions, next_cursor = await fetch_page(db.consumptions, filters.query, {"_id": 0}, "created_at", -1, page)
+    return page_response(consumptions, next_cursor, page, Consumption)
 
 # Shipment Routes
 @api_router.post("/shipments", response_model=Shipment)
@@ -524,13 +783,12 @@ async def create_shipment(shipment_data: ShipmentCreate, current_user = Depends(
     # Get color name if color selected
     color_name = None
     if shipment_data.color_material_id:
-        color_material = await db.raw_materials.find_one({"id": shipment_data.color_material_id})
+        color_material = await catalog.by_id(db, shipment_data.color_material_id)
         if color_material:
             color_name = color_material['name']
     
     # Generate shipment number
-    count = await db.shipments.count_documents({}) + 1
-    shipment_number = f"SEV-{count:05d}"
+    shipment_number = await next_document_number(db, "SEV")
     
     shipment_obj = Shipment(
         shipment_number=shipment_number,
@@ -548,75 +806,144 @@ async def create_shipment(shipment_data: ShipmentCreate, current_user = Depends(
         created_by=current_user['username']
     )
     
-    doc = shipment_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    doc['shipment_date'] = doc['shipment_date'].isoformat()
-    await db.shipments.insert_one(doc)
+    doc = with_search_keys(shipment_obj.model_dump(), "shipments")
+    
+    # Shipment and stock delta commit together, so a stock rebuild never
+    # sees one without the other
+    async def save(session):
+        await db.shipments.insert_one(doc, session=session)
+        await post_finished_stock(db, doc, -1, session=session)
+    
+    await in_transaction(save)
+    await versions.bump(db, "finished_stock")
+    
+    dashboard_cache.clear()
+    await events.publish("shipment.created", {"shipment": shipment_obj.model_dump()})
     
     return shipment_obj
 
-@api_router.get("/shipments", response_model=List[Shipment])
-async def get_shipments(current_user = Depends(get_current_user)):
-    shipments = await db.shipments.find({}, {"_id": 0}).sort("shipment_date", -1).to_list(1000)
-    for ship in shipments:
-        if isinstance(ship['created_at'], str):
-            ship['created_at'] = datetime.fromisoformat(ship['created_at'])
-        if isinstance(ship['shipment_date'], str):
-            ship['shipment_date'] = datetime.fromisoformat(ship['shipment_date'])
-    return shipments
+@api_router.get("/shipments", response_model=Union[Page[Shipment], List[Shipment]])
+async def get_shipments(
+    page: PageParams = Depends(),
+    select: FieldParams = Depends(),
+    filters: ShipmentFilters = Depends(),
+    current_user = Depends(get_current_user)
+):
+    fields = select.select(Shipment)
+    shipments, next_cursor = await fetch_page(
+        db.shipments, filters.query, field_projection(fields, "shipment_date"), "shipment_date", -1, page
+    )
+    return page_response(shipments, next_cursor, page, Shipment, fields)
 
 @api_router.delete("/shipments/{shipment_id}")
 async def delete_shipment(shipment_id: str, current_user = Depends(get_current_user)):
     if current_user['role'] not in ['admin', 'user']:
         raise HTTPException(status_code=403, detail="Permission denied")
     
-    result = await db.shipments.delete_one({"id": shipment_id})
-    if result.deleted_count == 0:
+    async def remove(session):
+        shipment = await db.shipments.find_one_and_delete({"id": shipment_id}, session=session)
+        if shipment:
+            await post_finished_stock(db, shipment, 1, session=session)
+        return shipment
+    
+    shipment = await in_transaction(remove)
+    if not shipment:
         raise HTTPException(status_code=404, detail="Shipment not found")
+    await versions.bump(db, "finished_stock")
+    
+    dashboard_cache.clear()
+    await events.publish("shipment.deleted", {"shipment": Shipment(**shipment).model_dump()})
     
     return {"message": "Shipment deleted successfully"}
 
 # Cost Analysis Routes
 @api_router.get("/costs/analysis", response_model=List[CostAnalysis])
-async def get_cost_analysis(current_user = Depends(get_current_user)):
-    consumptions = await db.consumptions.find({}, {"_id": 0}).to_list(10000)
-    materials = await db.raw_materials.find({}, {"_id": 0}).to_list(1000)
-    
-    material_map = {m['id']: m for m in materials}
-    cost_data = {}
-    
-    for cons in consumptions:
-        mat_id = cons['material_id']
-        if mat_id not in cost_data:
-            material = material_map.get(mat_id)
-            if material:
-                cost_data[mat_id] = {
-                    'material_id': mat_id,
-                    'material_name': material['name'],
-                    'total_quantity': 0,
-                    'total_cost': 0
-                }
-        
-        if mat_id in cost_data:
-            material = material_map[mat_id]
-            cost_data[mat_id]['total_quantity'] += cons['quantity']
-            cost_data[mat_id]['total_cost'] += cons['quantity'] * material['unit_price']
-    
-    return list(cost_data.values())
+async def get_cost_analysis(
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    group_by: Optional[CostPeriod] = None,
+    current_user = Depends(get_current_user)
+):
+    if date_from and date_to and date_from >= date_to:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    
+    return await cost_analysis(db, date_from, date_to, group_by.value if group_by else None)
+
+@api_router.get("/costs/valuation", response_model=List[StockValuation])
+async def get_stock_valuation(current_user = Depends(get_current_user)):
+    rows = await stock_valuation(db)
+    for row in rows:
+        material = await catalog.by_id(db, row['material_id'])
+        row['material_name'] = material['name'] if material else ""
+    return sorted(rows, key=lambda r: r['material_name'])
+
+# Report Routes
+@api_router.get("/reports/production", response_model=List[ProductionReportRow])
+async def get_production_report(
+    granularity: CostPeriod = CostPeriod.DAY,
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    machine: Optional[MachineType] = None,
+    thickness_mm: Optional[float] = None,
+    color_name: Optional[str] = None,
+    current_user = Depends(get_current_user)
+):
+    if date_from and date_to and date_from >= date_to:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    
+    filters = {}
+    if machine:
+        filters["machine"] = machine.value
+    if thickness_mm is not None:
+        filters["thickness_mm"] = thickness_mm
+    if color_name is not None:
+        filters["color_name"] = color_name
+    
+    return await production_report(db, granularity.value, date_from, date_to, filters)
+
+@api_router.get("/analytics/gas-efficiency", response_model=GasEfficiencyReport)
+async def get_gas_efficiency(
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    machine: Optional[MachineType] = None,
+    z_threshold: float = Query(DEFAULT_Z_THRESHOLD, gt=0),
+    current_user = Depends(get_current_user)
+):
+    if date_from and date_to and date_from >= date_to:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    
+    return await gas_efficiency(db, date_from, date_to, machine.value if machine else None, z_threshold)
 
 # Dashboard Routes
 @api_router.get("/dashboard/stats", response_model=DashboardStats)
 async def get_dashboard_stats(current_user = Depends(get_current_user)):
-    total_raw_materials = await db.raw_materials.count_documents({})
-    total_products = await db.products.count_documents({})
-    active_productions = await db.production_orders.count_documents({
-        "status": {"$in": ["planned", "in_progress"]}
-    })
-    pending_shipments = await db.shipments.count_documents({"status": "pending"})
-    
-    # Low stock materials
-    materials = await db.raw_materials.find({}, {"_id": 0}).to_list(1000)
-    low_stock_materials = sum(1 for m in materials if m['current_stock'] <= m['min_stock_level'])
+    stats = dashboard_cache.get("stats")
+    if stats is not None:
+        return stats
+    
+    async with dashboard_lock:
+        # Another request may have filled the snapshot while we waited
+        stats = dashboard_cache.get("stats")
+        if stats is None:
+            stats = await compute_dashboard_stats()
+            dashboard_cache.set("stats", stats)
+    return stats
+
+async def compute_dashboard_stats() -> DashboardStats:
+    (
+        total_raw_materials,
+        total_products,
+        active_productions,
+        pending_shipments,
+        low_stock_materials
+    ) = await asyncio.gather(
+        db.raw_materials.count_documents({}),
+        db.products.count_documents({}),
+        db.production_orders.count_documents({"status": {"$in": ["planned", "in_progress"]}}),
+        # Shipments have no status; pending ones are those dated in the future
+        db.shipments.count_documents({"shipment_date": {"$gt": datetime.now(timezone.utc)}}),
+        db.raw_materials.count_documents({"$expr": {"$lte": ["$current_stock", "$min_stock_level"]}})
+    )
     
     return DashboardStats(
         total_raw_materials=total_raw_materials,
@@ -627,90 +954,285 @@ async def get_dashboard_stats(current_user = Depends(get_current_user)):
     )
 
 # Manufacturing Routes
-@api_router.post("/manufacturing", response_model=ManufacturingRecord)
-async def create_manufacturing_record(record_data: ManufacturingRecordCreate, current_user = Depends(get_current_user)):
-    if current_user['role'] == 'viewer':
-        raise HTTPException(status_code=403, detail="Permission denied")
-    
+def build_manufacturing_record(record_data: ManufacturingRecordCreate, color_name: Optional[str], username: str) -> ManufacturingRecord:
     # Calculate square meters
     square_meters = (record_data.width_cm / 100) * record_data.length_m * record_data.quantity
     
     # Generate model description
     model = f"{record_data.thickness_mm} mm x {int(record_data.width_cm)} cm x {int(record_data.length_m)} m"
     
-    # Get color name if color selected
-    color_name = None
-    if record_data.color_material_id:
-        color_material = await db.raw_materials.find_one({"id": record_data.color_material_id})
-        if color_material:
-            color_name = color_material['name']
-    
-    record_obj = ManufacturingRecord(
+    return ManufacturingRecord(
         **record_data.model_dump(),
         square_meters=square_meters,
         model=model,
         color_name=color_name,
-        created_by=current_user['username']
+        created_by=username
+    )
+
+def manufacturing_doc(record_obj: ManufacturingRecord) -> dict:
+    return record_obj.model_dump()
+
+def record_consumption_doc(record_id: str, material: dict, quantity: float, username: str) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "production_order_id": record_id,
+        "material_id": material['id'],
+        "material_name": material['name'],
+        "quantity": quantity,
+        "created_by": username,
+        "created_at": datetime.now(timezone.utc)
+    }
+
+async def price_consumption_docs(rows: list, session=None) -> dict:
+    """Price ``(material, consumption_doc)`` rows with one layer draw per
+    material. Returns material id -> the slices drawn, for ``restore``."""
+    by_material = {}
+    for material, doc in rows:
+        by_material.setdefault(material['id'], (material, []))[1].append(doc)
+    drawn = {}
+    try:
+        for material, docs in by_material.values():
+            quantities = [doc['quantity'] for doc in docs]
+            slices = drawn[material['id']] = await draw(db, material, sum(quantities), session=session)
+            for doc, cost in zip(docs, allocate(slices, quantities)):
+                set_cost(doc, cost)
+    except Exception:
+        if session is None:
+            for material_id, slices in drawn.items():
+                await restore(db, material_id, slices)
+        raise
+    return drawn
+
+async def unpost_consumptions(totals: dict, drawn: dict, consumption_docs: list):
+    """Undo applied withdrawals by hand: stock, cost layers and any rows written."""
+    if totals:
+        await db.raw_materials.bulk_write([
+            UpdateOne({"id": material_id}, {"$inc": {"current_stock": -delta}})
+            for material_id, delta in totals.items()
+        ])
+    for material_id, slices in drawn.items():
+        await restore(db, material_id, slices)
+    if consumption_docs:
+        await db.consumptions.delete_many({"id": {"$in": [c['id'] for c in consumption_docs]}})
+
+async def save_manufacturing_record(doc: dict, postings: list, username: str, session=None) -> list:
+    """Write a record with its finished stock, masura/gas decrements and
+    consumption rows.
+
+    ``postings`` is a list of ``(material, quantity)`` withdrawals. Those
+    the stock on hand cannot cover are skipped and the record is kept
+    without them. Returns the consumption rows written. Without a
+    ``session`` the writes already made are undone by hand on failure.
+
+    Round trips: one guarded update per material withdrawn (masura and
+    gas, so at most two), a read and an update per cost layer the draw
+    reaches (one of each for an average pool), then one write each for
+    the record, finished stock, rollups and consumption rows.
+    """
+    totals = {}
+    for material, quantity in postings:
+        totals[material['id']] = totals.get(material['id'], 0) - quantity
+    applied = set()
+    drawn = {}
+    consumption_docs = []
+    stock_posted = rolled_up = False
+    try:
+        applied = await post_stock_batch(db, totals, session=session)
+        priced = [
+            (material, record_consumption_doc(doc['id'], material, quantity, username))
+            for material, quantity in postings if material['id'] in applied
+        ]
+        consumption_docs = [consumption for _, consumption in priced]
+        drawn = await price_consumption_docs(priced, session=session)
+        await db.manufacturing_records.insert_one(doc, session=session)
+        await post_finished_stock(db, doc, 1, session=session)
+        stock_posted = True
+        await post_production_rollups(db, [doc], 1, session=session)
+        rolled_up = True
+        if consumption_docs:
+            await db.consumptions.insert_many(consumption_docs, session=session)
+    except Exception:
+        if session is None:
+            await unpost_consumptions({m: totals[m] for m in applied}, drawn, consumption_docs)
+            await db.manufacturing_records.delete_one({"id": doc['id']})
+            if stock_posted:
+                await post_finished_stock(db, doc, -1)
+            if rolled_up:
+                await post_production_rollups(db, [doc], -1)
+        raise
+    return consumption_docs
+
+async def write_manufacturing_record(doc: dict, postings: list, username: str) -> list:
+    async def run(session):
+        return await save_manufacturing_record(doc, postings, username, session)
+    
+    return await in_transaction(run)
+
+@api_router.post("/manufacturing", response_model=ManufacturingRecord)
+async def create_manufacturing_record(record_data: ManufacturingRecordCreate, current_user = Depends(get_current_user)):
+    if current_user['role'] == 'viewer':
+        raise HTTPException(status_code=403, detail="Permission denied")
+    
+    # Color, masura and gas materials are independent lookups
+    color_material, masura_material, gaz_material = await asyncio.gather(
+        catalog.by_id(db, record_data.color_material_id) if record_data.color_material_id else asyncio.sleep(0),
+        catalog.by_name(db, record_data.masura_type.value) if record_data.masura_type != MasuraType.NO_MASURA else asyncio.sleep(0),
+        catalog.by_code(db, "GAZ001")
     )
+    color_name = color_material['name'] if color_material else None
     
-    doc = record_obj.model_dump()
-    doc['production_date'] = doc['production_date'].isoformat()
-    doc['created_at'] = doc['created_at'].isoformat()
+    record_obj = build_manufacturing_record(record_data, color_name, current_user['username'])
+    doc = manufacturing_doc(record_obj)
     
-    await db.manufacturing_records.insert_one(doc)
+    # Masura and gas consumption; a withdrawal the stock cannot cover is skipped
+    postings = []
+    if masura_material:
+        postings.append((masura_material, record_data.masura_quantity))
+    if gaz_material:
+        postings.append((gaz_material, record_data.gas_consumption_kg))
     
-    # Update masura stock if not "Masura Yok"
-    if record_data.masura_type != MasuraType.NO_MASURA:
-        masura_material = await db.raw_materials.find_one({"name": record_data.masura_type})
-        if masura_material and masura_material['current_stock'] >= record_data.masura_quantity:
-            await db.raw_materials.update_one(
-                {"id": masura_material['id']},
-                {"$inc": {"current_stock": -record_data.masura_quantity}}
-            )
-            
-            # Create consumption record for masura
-            consumption_doc = {
-                "id": str(uuid.uuid4()),
-                "production_order_id": record_obj.id,
-                "material_id": masura_material['id'],
-                "material_name": masura_material['name'],
-                "quantity": record_data.masura_quantity,
-                "created_by": current_user['username'],
-                "created_at": datetime.now(timezone.utc).isoformat()
-            }
-            await db.consumptions.insert_one(consumption_doc)
-    
-    # Update gas consumption (Gaz material)
-    gaz_material = await db.raw_materials.find_one({"code": "GAZ001"})
-    if gaz_material and gaz_material['current_stock'] >= record_data.gas_consumption_kg:
-        await db.raw_materials.update_one(
-            {"id": gaz_material['id']},
-            {"$inc": {"current_stock": -record_data.gas_consumption_kg}}
-        )
-        
-        # Create consumption record for gas
-        gas_consumption_doc = {
-            "id": str(uuid.uuid4()),
-            "production_order_id": record_obj.id,
-            "material_id": gaz_material['id'],
-            "material_name": gaz_material['name'],
-            "quantity": record_data.gas_consumption_kg,
-            "created_by": current_user['username'],
-            "created_at": datetime.now(timezone.utc).isoformat()
-        }
-        await db.consumptions.insert_one(gas_consumption_doc)
+    await write_manufacturing_record(doc, postings, current_user['username'])
+    await versions.bump(db, "raw_materials", "finished_stock")
+    dashboard_cache.clear()
+    gas_analytics_cache.clear()
+    await events.publish("manufacturing.created", {"record": record_obj.model_dump()})
     
     return record_obj
 
-@api_router.get("/manufacturing", response_model=List[ManufacturingRecord])
-async def get_manufacturing_records(current_user = Depends(get_current_user)):
-    records = await db.manufacturing_records.find({}, {"_id": 0}).sort("production_date", -1).to_list(1000)
-    for record in records:
-        if isinstance(record['production_date'], str):
-            record['production_date'] = datetime.fromisoformat(record['production_date'])
-        if isinstance(record['created_at'], str):
-            record['created_at'] = datetime.fromisoformat(record['created_at'])
-    return records
+async def import_manufacturing_batch(batch: list, gaz_material: Optional[dict], username: str, errors: list) -> int:
+    valid = []
+    for row_number, data, error in batch:
+        if error:
+            errors.append({"row": row_number, "error": error})
+            continue
+        try:
+            valid.append((row_number, ManufacturingRecordCreate.model_validate(data)))
+        except ValidationError as e:
+            errors.append({"row": row_number, "error": format_validation_error(e)})
+    if not valid:
+        return 0
+    
+    # Resolve colors and masura materials once for the whole batch
+    color_ids = list({r.color_material_id for _, r in valid if r.color_material_id})
+    masura_names = list({r.masura_type.value for _, r in valid if r.masura_type != MasuraType.NO_MASURA})
+    colors, masuras = await asyncio.gather(
+        asyncio.gather(*[catalog.by_id(db, color_id) for color_id in color_ids]),
+        asyncio.gather(*[catalog.by_name(db, name) for name in masura_names])
+    )
+    color_names = {m['id']: m['name'] for m in colors if m}
+    masura_by_name = {m['name']: m for m in masuras if m}
+    
+    rows = []
+    docs = []
+    for row_number, record_data in valid:
+        record_obj = build_manufacturing_record(record_data, color_names.get(record_data.color_material_id), username)
+        rows.append(row_number)
+        docs.append(manufacturing_doc(record_obj))
+    
+    try:
+        await db.manufacturing_records.insert_many(docs, ordered=False)
+        inserted = docs
+    except BulkWriteError as e:
+        failed = {err['index']: err['errmsg'] for err in e.details['writeErrors']}
+        errors.extend({"row": rows[index], "error": message} for index, message in failed.items())
+        inserted = [doc for index, doc in enumerate(docs) if index not in failed]
+    if not inserted:
+        return 0
+    
+    # Finished stock: one aggregated delta per dimension/color key
+    stock_items = {}
+    for doc in inserted:
+        key = stock_key(doc['thickness_mm'], doc['width_cm'], doc['length_m'], doc['color_name'])
+        if key in stock_items:
+            stock_items[key]['quantity'] += doc['quantity']
+            stock_items[key]['square_meters'] += doc['square_meters']
+        else:
+            stock_items[key] = dict(doc)
+    await db.finished_stock.bulk_write([stock_delta(item, 1) for item in stock_items.values()], ordered=False)
+    await db.finished_stock_movements.insert_many([stock_movement(item, 1) for item in stock_items.values()])
+    await post_production_rollups(db, inserted, 1)
+    
+    # Masura and gas: one aggregated, guarded decrement per material
+    postings = []
+    for doc in inserted:
+        masura = masura_by_name.get(doc['masura_type'])
+        if masura and doc['masura_quantity']:
+            postings.append((masura, doc['masura_quantity'], doc['id']))
+        if gaz_material and doc['gas_consumption_kg']:
+            postings.append((gaz_material, doc['gas_consumption_kg'], doc['id']))
+    totals = {}
+    for material, quantity, _ in postings:
+        totals[material['id']] = totals.get(material['id'], 0) - quantity
+    applied = await post_stock_batch(db, totals)
+    
+    priced = []
+    for material, quantity, record_id in postings:
+        if material['id'] in applied:
+            priced.append((material, record_consumption_doc(record_id, material, quantity, username)))
+        else:
+            # Not enough stock for the whole batch: fall back to row by row,
+            # which skips only the rows that no longer fit
+            try:
+                await post_stock(db, material['id'], -quantity,
+                                 ledger=("consumptions", record_consumption_doc(record_id, material, quantity, username)))
+            except (MaterialNotFound, InsufficientStock):
+                pass
+    if priced:
+        drawn = {}
+        consumption_docs = [consumption for _, consumption in priced]
+        try:
+            drawn = await price_consumption_docs(priced)
+            await db.consumptions.insert_many(consumption_docs)
+        except Exception:
+            # The records stay imported, without these withdrawals
+            await unpost_consumptions({m: totals[m] for m in applied}, drawn, consumption_docs)
+            raise
+    
+    return len(inserted)
+
+@api_router.post("/manufacturing/import")
+async def import_manufacturing_records(request: Request, format: Optional[str] = None, current_user = Depends(get_current_user)):
+    if current_user['role'] == 'viewer':
+        raise HTTPException(status_code=403, detail="Permission denied")
+    
+    if format is None:
+        format = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    if format == "csv":
+        rows = iter_csv(request.stream())
+    elif format == "ndjson":
+        rows = iter_ndjson(request.stream())
+    else:
+        raise HTTPException(status_code=400, detail="Format must be csv or ndjson")
+    
+    gaz_material = await catalog.by_code(db, "GAZ001")
+    imported = 0
+    errors = []
+    async for batch in batched(rows):
+        imported += await import_manufacturing_batch(batch, gaz_material, current_user['username'], errors)
+    
+    errors.sort(key=lambda e: e['row'])
+    if imported:
+        await versions.bump(db, "raw_materials", "finished_stock")
+    dashboard_cache.clear()
+    gas_analytics_cache.clear()
+    if imported:
+        # Too many rows to patch one by one: clients refetch
+        await events.publish("manufacturing.imported", {"imported": imported})
+    
+    return {"imported": imported, "failed": len(errors), "errors": errors}
+
+@api_router.get("/manufacturing", response_model=Union[Page[ManufacturingRecord], List[ManufacturingRecord]])
+async def get_manufacturing_records(
+    page: PageParams = Depends(),
+    select: FieldParams = Depends(),
+    filters: ManufacturingFilters = Depends(),
+    current_user = Depends(get_current_user)
+):
+    fields = select.select(ManufacturingRecord)
+    records, next_cursor = await fetch_page(
+        db.manufacturing_records, filters.query, field_projection(fields, "production_date"), "production_date", -1, page
+    )
+    return page_response(records, next_cursor, page, ManufacturingRecord, fields)
 
 @api_router.put("/manufacturing/{record_id}", response_model=ManufacturingRecord)
 async def update_manufacturing_record(record_id: str, record_data: ManufacturingRecordCreate, current_user = Depends(get_current_user)):
@@ -731,13 +1253,13 @@ async def update_manufacturing_record(record_id: str, record_data: Manufacturing
     # Get color name if color selected
     color_name = None
     if record_data.color_material_id:
-        color_material = await db.raw_materials.find_one({"id": record_data.color_material_id})
+        color_material = await catalog.by_id(db, record_data.color_material_id)
         if color_material:
             color_name = color_material['name']
     
     # Update record
     update_data = {
-        "production_date": record_data.production_date.isoformat(),
+        "production_date": record_data.production_date,
         "machine": record_data.machine,
         "thickness_mm": record_data.thickness_mm,
         "width_cm": record_data.width_cm,
@@ -752,28 +1274,94 @@ async def update_manufacturing_record(record_id: str, record_data: Manufacturing
         "gas_consumption_kg": record_data.gas_consumption_kg
     }
     
-    await db.manufacturing_records.update_one({"id": record_id}, {"$set": update_data})
-    
-    # Get updated record
-    updated = await db.manufacturing_records.find_one({"id": record_id}, {"_id": 0})
-    if isinstance(updated['production_date'], str):
-        updated['production_date'] = datetime.fromisoformat(updated['production_date'])
-    if isinstance(updated['created_at'], str):
-        updated['created_at'] = datetime.fromisoformat(updated['created_at'])
+    # Get updated record and move its stock from the old key to the new one
+    async def save(session):
+        before = await db.manufacturing_records.find_one_and_update(
+            {"id": record_id},
+            {"$set": update_data},
+            projection={"_id": 0},
+            return_document=ReturnDocument.BEFORE,
+            session=session
+        )
+        if before:
+            after = {**before, **update_data}
+            await post_finished_stock(db, before, -1, session=session)
+            await post_production_rollups(db, [before], -1, session=session)
+            await post_finished_stock(db, after, 1, session=session)
+            await post_production_rollups(db, [after], 1, session=session)
+        return before
+    
+    updated = await in_transaction(save)
+    if not updated:
+        raise HTTPException(status_code=404, detail="Record not found")
+    previous = ManufacturingRecord(**updated)
+    updated.update(update_data)
+    await versions.bump(db, "finished_stock")
+    dashboard_cache.clear()
+    gas_analytics_cache.clear()
     
-    return ManufacturingRecord(**updated)
+    record = ManufacturingRecord(**updated)
+    await events.publish("manufacturing.updated", {"record": record.model_dump(), "previous": previous.model_dump()})
+    return record
 
 @api_router.delete("/manufacturing/{record_id}")
 async def delete_manufacturing_record(record_id: str, current_user = Depends(get_current_user)):
     if current_user['role'] not in ['admin', 'user']:
         raise HTTPException(status_code=403, detail="Permission denied")
     
-    result = await db.manufacturing_records.delete_one({"id": record_id})
-    if result.deleted_count == 0:
+    async def remove(session):
+        record = await db.manufacturing_records.find_one_and_delete({"id": record_id}, session=session)
+        if record:
+            await post_finished_stock(db, record, -1, session=session)
+            await post_production_rollups(db, [record], -1, session=session)
+        return record
+    
+    record = await in_transaction(remove)
+    if not record:
         raise HTTPException(status_code=404, detail="Record not found")
+    await versions.bump(db, "finished_stock")
+    dashboard_cache.clear()
+    gas_analytics_cache.clear()
+    await events.publish("manufacturing.deleted", {"record": ManufacturingRecord(**record).model_dump()})
     
     return {"message": "Record deleted successfully"}
 
+# Export Routes
+@api_router.get("/export/{collection}")
+async def export_collection(
+    collection: ExportCollection,
+    format: ExportFormat = ExportFormat.CSV,
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    columns: Optional[str] = Query(None, description="Comma-separated column names"),
+    current_user = Depends(get_current_user)
+):
+    available = EXPORTS[collection.value][2]
+    if columns:
+        selected = tuple(c.strip() for c in columns.split(",") if c.strip())
+        unknown = [c for c in selected if c not in available]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown columns: {', '.join(unknown)}. Available: {', '.join(available)}")
+        if not selected:
+            raise HTTPException(status_code=400, detail="No columns selected")
+    else:
+        selected = available
+    
+    # Same range semantics as the list endpoints: [from, to)
+    query = filter_query(EXPORTS[collection.value][1], date_from, date_to)
+    cursor = export_cursor(db, collection.value, selected, query)
+    filename = f"{collection.value}.{format.value}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if format == ExportFormat.XLSX:
+        if Workbook is None:
+            raise HTTPException(status_code=400, detail="XLSX export is not available on this server")
+        return StreamingResponse(
+            stream_xlsx(cursor, selected, collection.value),
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            headers=headers
+        )
+    return StreamingResponse(stream_csv(cursor, selected), media_type="text/csv; charset=utf-8", headers=headers)
+
 # Stock Management Routes
 class StockItem(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -785,60 +1373,67 @@ class StockItem(BaseModel):
     total_square_meters: float
 
 @api_router.get("/stock", response_model=List[StockItem])
-async def get_stock(current_user = Depends(get_current_user)):
-    # Get all manufacturing records
-    manufacturing = await db.manufacturing_records.find({}, {"_id": 0}).to_list(10000)
-    
-    # Get all shipments
-    shipments = await db.shipments.find({}, {"_id": 0}).to_list(10000)
+async def get_stock(
+    request: Request,
+    response: Response,
+    as_of: Optional[datetime] = Query(None, description="Report stock as it stood at this time"),
+    current_user = Depends(get_current_user)
+):
+    etag = versions.etag(request, "finished_stock")
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    
+    if as_of is None:
+        # finished_stock is kept current by the manufacturing and shipment handlers
+        rows = await db.finished_stock.find(
+            {"total_quantity": {"$gt": 0}}, {"_id": 0, "key": 0}
+        ).to_list(None)
+        return with_etag(rows, response, etag)
     
-    # Group by model (thickness, width, length, AND color if present)
-    stock_dict = {}
-    
-    # Add manufacturing (production)
-    for record in manufacturing:
-        # Key includes color if present, empty string if not
-        color_key = record.get('color_name', '') or ''
-        key = f"{record['thickness_mm']}|{record['width_cm']}|{record['length_m']}|{color_key}"
-        
-        if key not in stock_dict:
-            stock_dict[key] = {
-                'thickness_mm': record['thickness_mm'],
-                'width_cm': record['width_cm'],
-                'length_m': record['length_m'],
-                'color_name': record.get('color_name'),
-                'total_quantity': 0,
-                'total_square_meters': 0
-            }
-        
-        stock_dict[key]['total_quantity'] += record['quantity']
-        stock_dict[key]['total_square_meters'] += record['square_meters']
+    try:
+        rows = await finished_stock_as_of(db, as_of)
+    except NoHistory as e:
+        start = e.args[0]
+        detail = f"Stock history starts at {start.isoformat()}" if start else "No stock history yet"
+        raise HTTPException(status_code=400, detail=detail)
+    return with_etag([row for row in rows if row['total_quantity'] > 0], response, etag)
+
+@api_router.post("/stock/rebuild")
+async def rebuild_stock(current_user = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
     
-    # Subtract shipments
-    for shipment in shipments:
-        color_key = shipment.get('color_name', '') or ''
-        key = f"{shipment['thickness_mm']}|{shipment['width_cm']}|{shipment['length_m']}|{color_key}"
-        
-        if key in stock_dict:
-            stock_dict[key]['total_quantity'] -= shipment['quantity']
-            stock_dict[key]['total_square_meters'] -= shipment['square_meters']
+    # Rebuilding outside a transaction would drop deltas posted meanwhile
+    if not await supports_transactions(client):
+        raise HTTPException(
+            status_code=409,
+            detail="Stock rebuild needs a replica set; run `python finished_stock.py rebuild` with the API stopped"
+        )
     
-    # Filter out items with zero or negative stock
-    result = [item for item in stock_dict.values() if item['total_quantity'] > 0]
+    async def rebuild(session):
+        rows = await rebuild_finished_stock(db, session)
+        # Movements before the rebuild no longer add up to the table
+        await snapshot_finished_stock(db, session)
+        return rows
     
-    return result
+    rows = await in_transaction(rebuild)
+    await versions.bump(db, "finished_stock")
+    return {"message": "Stock rebuilt successfully", "rows": rows}
 
 # User Management Routes
-@api_router.get("/users", response_model=List[User])
-async def get_users(current_user = Depends(get_current_user)):
+@api_router.get("/users", response_model=Union[Page[User], List[User]])
+async def get_users(request: Request, response: Response, page: PageParams = Depends(), current_user = Depends(get_current_user)):
     if current_user['role'] != 'admin':
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    users = await db.users.find({}, {"_id": 0, "password": 0}).to_list(1000)
-    for user in users:
-        if isinstance(user['created_at'], str):
-            user['created_at'] = datetime.fromisoformat(user['created_at'])
-    return users
+    etag = versions.etag(request, "users")
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    
+    users, next_cursor = await fetch_page(db.users, {}, {"_id": 0, "password": 0}, "created_at", 1, page)
+    return with_etag(page_response(users, next_cursor, page, User), response, etag)
 
 @api_router.delete("/users/{user_id}")
 async def delete_user(user_id: str, current_user = Depends(get_current_user)):
@@ -851,12 +1446,83 @@ async def delete_user(user_id: str, current_user = Depends(get_current_user)):
     result = await db.users.delete_one({"id": user_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
+    await versions.bump(db, "users")
+    
+    # Tokens already handed out to this user stop working
+    await revocations.revoke_user(db, user_id)
     
     return {"message": "User deleted successfully"}
 
+# Search Routes
+class SearchResults(BaseModel):
+    shipments: List[Shipment] = []
+    raw_materials: List[RawMaterial] = []
+
+@api_router.get("/search", response_model=SearchResults)
+async def search_records(
+    q: str = Query(..., min_length=1, description="Prefix of a customer, invoice, plate, driver or material"),
+    types: Optional[str] = Query(None, description="Comma-separated: shipments, raw_materials"),
+    limit: int = Query(DEFAULT_SEARCH_LIMIT, ge=1, le=MAX_SEARCH_LIMIT),
+    current_user = Depends(get_current_user)
+):
+    wanted = set(types.split(",")) if types else {"shipments", "raw_materials"}
+    unknown = wanted - {"shipments", "raw_materials"}
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown types: {', '.join(sorted(unknown))}")
+    
+    shipments, raw_materials = await asyncio.gather(
+        search(db, "shipments", q, limit) if "shipments" in wanted else asyncio.sleep(0, []),
+        search(db, "raw_materials", q, limit) if "raw_materials" in wanted else asyncio.sleep(0, [])
+    )
+    return {"shipments": shipments, "raw_materials": raw_materials}
+
+# Event Routes
+@api_router.get("/events")
+async def stream_events(
+    request: Request,
+    types: Optional[str] = None,
+    token: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+):
+    # EventSource cannot set headers, so browsers pass the token in the query
+    if credentials:
+        token = credentials.credentials
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    authenticate(token)
+    
+    # Checked again before every write: a stream must not outlive its token
+    def authorized() -> bool:
+        try:
+            authenticate(token)
+        except HTTPException:
+            return False
+        return True
+    
+    subscriber = events.subscribe(types.split(",") if types else None)
+    return StreamingResponse(
+        event_stream(events, subscriber, request, request.headers.get("last-event-id"), authorized),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Admin Routes
+@api_router.get("/admin/index-advisor")
+async def get_index_advice(current_user = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    shapes = await advise(db)
+    return {
+        "collscan_count": sum(1 for shape in shapes if shape['collscan']),
+        "shapes": shapes
+    }
+
 # Include router
 app.include_router(api_router)
 
+app.add_middleware(CompressionMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -871,6 +1537,77 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    await ensure_indexes(db)
+
+@app.on_event("startup")
+async def seed_document_sequences():
+    await seed_sequence(db, "PRD", "production_orders", "order_number")
+    await seed_sequence(db, "SEV", "shipments", "shipment_number")
+
+@app.on_event("startup")
+async def prepare_finished_stock():
+    # First start after the ledger was introduced: seed it from history
+    if not await db.finished_stock.find_one({}) and await db.manufacturing_records.find_one({}):
+        async def seed(session):
+            rows = await rebuild_finished_stock(db, session)
+            await snapshot_finished_stock(db, session)
+            return rows
+        
+        rows = await seed_once("finished_stock", seed)
+        if rows is not None:
+            logger.info(f"finished_stock seeded with {rows} rows")
+
+@app.on_event("startup")
+async def start_stock_compaction():
+    # History starts from a seeded table; the seeding snapshots it itself
+    unseeded = not await db.finished_stock.find_one({}) and await db.manufacturing_records.find_one({})
+    if not unseeded and not await db.stock_snapshots.find_one({"kind": "finished_stock"}):
+        await snapshot_finished_stock(db)
+    app.state.stock_compaction = asyncio.create_task(run_compaction(db))
+
+@app.on_event("startup")
+async def prepare_production_rollups():
+    if not await db.production_rollups.find_one({}) and await db.manufacturing_records.find_one({}):
+        buckets = await seed_once("production_rollups", lambda session: rebuild_production_rollups(db, session))
+        if buckets is not None:
+            logger.info(f"production_rollups seeded with {buckets} buckets")
+
+@app.on_event("startup")
+async def start_background_migrations():
+    # Draws price withdrawals from the layers: seed the opening ones first
+    await seed_opening_cost_layers(db)
+    app.state.migrations = asyncio.create_task(run_pending_migrations(db))
+
+@app.on_event("startup")
+async def load_material_catalog():
+    await catalog.load(db)
+    app.state.catalog_follower = asyncio.create_task(catalog.follow(db))
+
+@app.on_event("startup")
+async def follow_collection_versions():
+    await versions.load(db)
+    app.state.version_follower = asyncio.create_task(versions.follow(db))
+
+@app.on_event("startup")
+async def start_event_tail():
+    await events.start(db)
+    app.state.event_tail = asyncio.create_task(events.tail())
+
+@app.on_event("startup")
+async def start_revocation_polling():
+    await revocations.prune(db)
+    await revocations.refresh(db)
+    app.state.revocation_poller = asyncio.create_task(revocations.poll(db))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    app.state.revocation_poller.cancel()
+    app.state.catalog_follower.cancel()
+    app.state.event_tail.cancel()
+    app.state.version_follower.cancel()
+    app.state.stock_compaction.cancel()
+    app.state.migrations.cancel()
+    client.close()
+    shutdown_password_pool()
\ No newline at end of file
@@ -0,0 +1,248 @@
+"""Point-in-time raw-material and finished-goods stock.
+
+A balance at time ``t`` is the nearest snapshot taken at or before ``t``
+plus the ledger rows between that snapshot and ``t``. Snapshots are
+taken every STOCK_SNAPSHOT_INTERVAL seconds, so an ``as_of`` query
+replays at most one interval of ledger rows however long the history
+is.
+
+Ledgers:
+
+* raw materials: ``stock_transactions`` (IN adds, OUT subtracts) and
+  ``consumptions`` (subtract), by ``created_at``;
+* finished goods: ``finished_stock_movements``, which
+  ``post_finished_stock`` appends to on every delta, by ``at``.
+
+Compaction folds the ledger rows since the last snapshot into a new
+snapshot at each interval boundary; it lags STOCK_SNAPSHOT_LAG seconds
+behind the clock so in-flight postings have landed. Raw-material
+snapshots and ``as_of`` reads wait for the ``iso_dates`` migration:
+until it has finished, ledger rows may still hold string dates, which a
+date range skips (reads raise HistoryPending). Rows whose date never
+parsed stay strings and are left out. Snapshot ids are
+derived from their boundary, so several workers compacting at once
+write the same documents. The first finished-goods snapshot is the
+``finished_stock`` table itself, taken when the history starts; a
+raw-material history is replayed from the very first ledger row.
+
+Run a compaction by hand with::
+
+    python stock_history.py compact
+"""
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+
+from indexes import ensure_indexes
+
+logger = logging.getLogger(__name__)
+
+STOCK_SNAPSHOT_INTERVAL = int(os.environ.get('STOCK_SNAPSHOT_INTERVAL', str(24 * 3600)))
+STOCK_SNAPSHOT_LAG = int(os.environ.get('STOCK_SNAPSHOT_LAG', '300'))
+
+RAW = "raw_materials"
+FINISHED = "finished_stock"
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class NoHistory(Exception):
+    pass
+
+
+class HistoryPending(Exception):
+    """Ledger rows may still hold string dates, which a date range skips."""
+
+
+def _as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _range(field: str, after: Optional[datetime], until: datetime) -> dict:
+    bounds = {"$lte": until}
+    if after is not None:
+        bounds["$gt"] = after
+    return {"$match": {field: bounds}}
+
+
+async def _raw_movements(db, after: Optional[datetime], until: datetime) -> dict:
+    signed = {"$cond": [{"$eq": ["$transaction_type", "out"]}, {"$multiply": ["$quantity", -1]}, "$quantity"]}
+    transactions, consumptions = await asyncio.gather(
+        db.stock_transactions.aggregate([
+            _range("created_at", after, until),
+            {"$group": {"_id": "$material_id", "quantity": {"$sum": signed}}},
+        ]).to_list(None),
+        db.consumptions.aggregate([
+            _range("created_at", after, until),
+            {"$group": {"_id": "$material_id", "quantity": {"$sum": "$quantity"}}},
+        ]).to_list(None),
+    )
+    movements = {}
+    for row in transactions:
+        movements[row['_id']] = movements.get(row['_id'], 0) + row['quantity']
+    for row in consumptions:
+        movements[row['_id']] = movements.get(row['_id'], 0) - row['quantity']
+    return movements
+
+
+async def _finished_movements(db, after: Optional[datetime], until: datetime) -> list:
+    return await db.finished_stock_movements.aggregate([
+        _range("at", after, until),
+        {"$group": {
+            "_id": "$key",
+            "thickness_mm": {"$first": "$thickness_mm"},
+            "width_cm": {"$first": "$width_cm"},
+            "length_m": {"$first": "$length_m"},
+            "color_name": {"$first": "$color_name"},
+            "total_quantity": {"$sum": "$quantity"},
+            "total_square_meters": {"$sum": "$square_meters"},
+        }},
+    ]).to_list(None)
+
+
+def _apply_raw(balances: list, movements: dict) -> list:
+    totals = {row['material_id']: row['quantity'] for row in balances}
+    for material_id, quantity in movements.items():
+        totals[material_id] = totals.get(material_id, 0) + quantity
+    return [{"material_id": k, "quantity": v} for k, v in totals.items()]
+
+
+def _apply_finished(balances: list, movements: list) -> list:
+    rows = {row['key']: dict(row) for row in balances}
+    for movement in movements:
+        row = rows.get(movement['_id'])
+        if row is None:
+            row = rows[movement['_id']] = {
+                "key": movement['_id'],
+                **{k: movement[k] for k in ("thickness_mm", "width_cm", "length_m", "color_name")},
+                "total_quantity": 0,
+                "total_square_meters": 0,
+            }
+        row['total_quantity'] += movement['total_quantity']
+        row['total_square_meters'] += movement['total_square_meters']
+    return list(rows.values())
+
+
+async def _latest_snapshot(db, kind: str, at: Optional[datetime] = None) -> Optional[dict]:
+    query = {"kind": kind}
+    if at is not None:
+        query["taken_at"] = {"$lte": at}
+    return await db.stock_snapshots.find_one(query, sort=[("taken_at", -1)])
+
+
+async def _write_snapshot(db, kind: str, taken_at: datetime, balances: list, session=None):
+    await db.stock_snapshots.replace_one(
+        {"_id": f"{kind}|{taken_at.isoformat()}"},
+        {"kind": kind, "taken_at": taken_at, "balances": balances},
+        upsert=True,
+        session=session
+    )
+
+
+async def snapshot_finished_stock(db, session=None):
+    """Start (or restart, after a rebuild) finished-goods history from the table."""
+    balances = await db.finished_stock.find({}, {"_id": 0}, session=session).to_list(None)
+    await _write_snapshot(db, FINISHED, datetime.now(timezone.utc), balances, session)
+
+
+async def compact(db, now: Optional[datetime] = None) -> int:
+    """Write every snapshot due up to now - STOCK_SNAPSHOT_LAG; returns how many."""
+    cutoff = (now or datetime.now(timezone.utc)) - timedelta(seconds=STOCK_SNAPSHOT_LAG)
+    interval = timedelta(seconds=STOCK_SNAPSHOT_INTERVAL)
+    iso_dates = await db.migrations.find_one({"_id": "iso_dates", "done": True})
+    written = 0
+    for kind in (RAW, FINISHED):
+        if kind == RAW and not iso_dates:
+            continue
+        latest = await _latest_snapshot(db, kind)
+        if latest is None and kind == FINISHED:
+            continue
+        taken_at = _as_utc(latest['taken_at']) if latest else EPOCH
+        balances = latest['balances'] if latest else []
+        boundary = EPOCH + ((taken_at - EPOCH) // interval + 1) * interval
+        if latest is None:
+            # Skip the empty years before the first ledger row
+            dated = {"created_at": {"$type": "date"}}
+            firsts = [
+                row['created_at'] for row in await asyncio.gather(
+                    db.stock_transactions.find_one(dated, {"created_at": 1}, sort=[("created_at", 1)]),
+                    db.consumptions.find_one(dated, {"created_at": 1}, sort=[("created_at", 1)]),
+                ) if row
+            ]
+            if not firsts:
+                continue
+            first = min(_as_utc(value) for value in firsts)
+            boundary = EPOCH + ((first - EPOCH) // interval + 1) * interval
+            taken_at = None
+        while boundary <= cutoff:
+            if kind == RAW:
+                balances = _apply_raw(balances, await _raw_movements(db, taken_at, boundary))
+            else:
+                balances = _apply_finished(balances, await _finished_movements(db, taken_at, boundary))
+            await _write_snapshot(db, kind, boundary, balances)
+            written += 1
+            taken_at = boundary
+            boundary += interval
+    return written
+
+
+async def raw_stock_as_of(db, as_of: datetime) -> dict:
+    """material_id -> quantity on hand at ``as_of``."""
+    if not await db.migrations.find_one({"_id": "iso_dates", "done": True}):
+        raise HistoryPending()
+    as_of = _as_utc(as_of)
+    snapshot = await _latest_snapshot(db, RAW, as_of)
+    after = _as_utc(snapshot['taken_at']) if snapshot else None
+    balances = _apply_raw(snapshot['balances'] if snapshot else [], await _raw_movements(db, after, as_of))
+    return {row['material_id']: row['quantity'] for row in balances}
+
+
+async def finished_stock_as_of(db, as_of: datetime) -> list:
+    """finished_stock rows as they stood at ``as_of``."""
+    as_of = _as_utc(as_of)
+    snapshot = await _latest_snapshot(db, FINISHED, as_of)
+    if snapshot is None:
+        # Finished-goods history starts with its first snapshot
+        first = await db.stock_snapshots.find_one({"kind": FINISHED}, sort=[("taken_at", 1)])
+        raise NoHistory(_as_utc(first['taken_at']) if first else None)
+    return _apply_finished(
+        snapshot['balances'], await _finished_movements(db, _as_utc(snapshot['taken_at']), as_of)
+    )
+
+
+async def run_compaction(db):
+    while True:
+        try:
+            written = await compact(db)
+            if written:
+                logger.info(f"Stock compaction wrote {written} snapshots")
+        except Exception as e:
+            logger.warning(f"Stock compaction failed: {e}")
+        await asyncio.sleep(min(STOCK_SNAPSHOT_INTERVAL, 3600))
+
+
+async def _main(command: str):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    try:
+        if command == "compact":
+            await ensure_indexes(db)
+            count = await compact(db)
+            print(f"stock_snapshots: {count} written")
+        else:
+            raise SystemExit(f"Unknown command: {command}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else "compact"))
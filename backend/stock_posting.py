@@ -0,0 +1,151 @@
+"""Atomic raw-material stock posting.
+
+Every change to ``raw_materials.current_stock`` goes through
+``post_stock``. The balance is changed with a conditional
+findOneAndUpdate (``$inc`` guarded by ``current_stock >= qty`` for
+withdrawals), so concurrent postings can neither lose updates nor drive
+the stock negative. The matching ledger row (stock transaction or
+consumption) is written in the same transaction when the server is a
+replica set. On a standalone server the stock change, and any cost
+layers drawn for it, are put back by hand if the ledger write fails.
+
+Ledger rows are priced on the way through: a receipt adds a cost layer
+and a withdrawal draws from the layers (see ``costing``), and the
+resulting ``unit_cost``/``total_cost`` are stored on the row.
+"""
+from pymongo import ReturnDocument
+
+from costing import draw, receive, restore, set_cost
+
+
+class MaterialNotFound(Exception):
+    pass
+
+
+class InsufficientStock(Exception):
+    pass
+
+
+_transactions_supported = {}
+
+
+async def supports_transactions(client) -> bool:
+    """True when connected to a replica set or mongos (cached per client)."""
+    key = id(client)
+    if key not in _transactions_supported:
+        hello = await client.admin.command("hello")
+        _transactions_supported[key] = 'setName' in hello or hello.get('msg') == 'isdbgrid'
+    return _transactions_supported[key]
+
+
+async def _apply(db, material_id: str, delta: float, allow_negative: bool, session=None) -> dict:
+    query = {"id": material_id}
+    if delta < 0 and not allow_negative:
+        query["current_stock"] = {"$gte": -delta}
+
+    material = await db.raw_materials.find_one_and_update(
+        query,
+        {"$inc": {"current_stock": delta}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+        session=session
+    )
+    if material is None:
+        if await db.raw_materials.find_one({"id": material_id}, {"_id": 1}, session=session):
+            raise InsufficientStock(material_id)
+        raise MaterialNotFound(material_id)
+    return material
+
+
+def _receipt_cost(material: dict, doc: dict) -> float:
+    unit_cost = doc.get('unit_cost')
+    return material.get('unit_price', 0) if unit_cost is None else unit_cost
+
+
+async def _post_ledger(db, material: dict, delta: float, ledger: tuple, session=None):
+    """Price and insert the ledger row; returns the layer slices drawn."""
+    collection, doc = ledger
+    if delta > 0:
+        unit_cost = _receipt_cost(material, doc)
+        set_cost(doc, delta * unit_cost)
+        await db[collection].insert_one(doc, session=session)
+        # After the row, so a failed insert leaves no layer behind
+        try:
+            await receive(db, material['id'], delta, unit_cost, doc.get('id'), session=session)
+        except Exception:
+            if session is None:
+                await db[collection].delete_one({"_id": doc['_id']})
+            raise
+        return []
+    slices = await draw(db, material, -delta, session=session)
+    set_cost(doc, sum(quantity * unit_cost for quantity, unit_cost, _ in slices))
+    try:
+        await db[collection].insert_one(doc, session=session)
+    except Exception:
+        if session is None:
+            await restore(db, material['id'], slices)
+        raise
+    return slices
+
+
+async def post_stock(db, material_id: str, delta: float, ledger: tuple = None,
+                     allow_negative: bool = False, session=None) -> dict:
+    """Add ``delta`` to a material's stock and write its ledger row.
+
+    ``ledger`` is an optional ``(collection_name, document)`` pair that is
+    inserted together with the stock change, after its cost has been
+    set. Returns the material after the update. Raises MaterialNotFound
+    or InsufficientStock.
+
+    Pass ``session`` to join a transaction the caller already started.
+    """
+    if session is not None:
+        material = await _apply(db, material_id, delta, allow_negative, session)
+        if ledger:
+            await _post_ledger(db, material, delta, ledger, session)
+        return material
+
+    if await supports_transactions(db.client):
+        async def run(session):
+            return await post_stock(db, material_id, delta, ledger, allow_negative, session)
+
+        async with await db.client.start_session() as session:
+            return await session.with_transaction(run)
+
+    material = await _apply(db, material_id, delta, allow_negative)
+    if ledger:
+        try:
+            await _post_ledger(db, material, delta, ledger)
+        except Exception:
+            # No transaction to roll back: undo the stock change by hand
+            # (_post_ledger has already put back any layers it drew)
+            await db.raw_materials.update_one({"id": material_id}, {"$inc": {"current_stock": -delta}})
+            raise
+    return material
+
+
+async def post_stock_batch(db, deltas: dict, session=None) -> set:
+    """Apply aggregated per-material deltas, one guarded update each.
+
+    Each withdrawal carries the same ``current_stock >= qty`` guard as
+    ``post_stock``, and the update's match count says whether it was
+    applied. Returns the ids of the materials whose delta was applied;
+    the caller decides what to do with the rest. Ledger rows are the
+    caller's job. Pass ``session`` to run inside a transaction; without
+    one, a failure part way puts back the deltas already applied.
+    """
+    applied = set()
+    try:
+        for material_id, delta in deltas.items():
+            query = {"id": material_id}
+            if delta < 0:
+                query["current_stock"] = {"$gte": -delta}
+            result = await db.raw_materials.update_one(query, {"$inc": {"current_stock": delta}}, session=session)
+            if result.matched_count:
+                applied.add(material_id)
+    except Exception:
+        if session is None:
+            for material_id in applied:
+                await db.raw_materials.update_one({"id": material_id}, {"$inc": {"current_stock": -deltas[material_id]}})
+        raise
+    return applied
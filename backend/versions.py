@@ -0,0 +1,104 @@
+"""Per-collection version counters for conditional GETs.
+
+``collection_versions`` holds one counter per collection. The write
+handlers bump it after a change, and the list endpoints turn it into an
+ETag. A request whose ``If-None-Match`` still matches gets a 304 from
+the worker's in-memory copy of the counters, without a MongoDB query
+or any serialization.
+
+The worker that made a write knows the new version at once. Other
+workers follow a change stream on ``collection_versions`` when the
+server is a replica set. Otherwise they poll the counters every
+VERSION_POLL_SECONDS, so a write made on another worker can take that
+long to invalidate a client's copy.
+
+Each counter document also carries a generation id, created with the
+document. If the collection is wiped and the counters start again from
+1, old ETags still no longer match.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+from stock_posting import supports_transactions
+
+logger = logging.getLogger(__name__)
+
+VERSION_POLL_SECONDS = float(os.environ.get('VERSION_POLL_SECONDS', '1'))
+
+
+class CollectionVersions:
+    def __init__(self):
+        self._versions = {}
+
+    def _put(self, doc: dict):
+        self._versions[doc['_id']] = f"{doc['generation']}.{doc['version']}"
+
+    async def load(self, db):
+        self._versions = {}
+        async for doc in db.collection_versions.find({}):
+            self._put(doc)
+
+    async def bump(self, db, *names: str):
+        for name in names:
+            doc = await db.collection_versions.find_one_and_update(
+                {"_id": name},
+                {"$inc": {"version": 1}, "$setOnInsert": {"generation": uuid.uuid4().hex[:8]}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            self._put(doc)
+
+    def etag(self, request, *names: str) -> str:
+        """ETag for a read of ``names``; the query string is part of it."""
+        parts = [f"{name}:{self._versions.get(name, '0')}" for name in names]
+        parts.append(request.url.query)
+        digest = hashlib.blake2b("|".join(parts).encode("utf-8"), digest_size=12).hexdigest()
+        return f'W/"{digest}"'
+
+    def matches(self, request, etag: str) -> bool:
+        header = request.headers.get("if-none-match")
+        if not header:
+            return False
+        candidates = {tag.strip() for tag in header.split(",")}
+        # Weak comparison: a proxy may have stripped the W/ prefix
+        return "*" in candidates or etag in candidates or etag[2:] in candidates
+
+    async def _poll(self, db):
+        while True:
+            await asyncio.sleep(VERSION_POLL_SECONDS)
+            try:
+                await self.load(db)
+            except PyMongoError as e:
+                logger.warning(f"Version refresh failed: {e}")
+
+    async def _watch(self, db):
+        async with db.collection_versions.watch(full_document="updateLookup") as stream:
+            # Reload once the stream is open so nothing between the two is missed
+            await self.load(db)
+            async for change in stream:
+                if change.get('fullDocument'):
+                    self._put(change['fullDocument'])
+
+    async def follow(self, db):
+        """Keep the counters in step with other workers until cancelled."""
+        while True:
+            try:
+                if not await supports_transactions(db.client):
+                    return await self._poll(db)
+                await self._watch(db)
+            except PyMongoError as e:
+                logger.warning(f"Version change stream failed, reloading: {e}")
+                await asyncio.sleep(VERSION_POLL_SECONDS)
+                try:
+                    await self.load(db)
+                except PyMongoError:
+                    pass
+
+
+versions = CollectionVersions()
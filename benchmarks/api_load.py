@@ -0,0 +1,528 @@
+"""API load benchmark: throughput and p50/p95/p99 latency per endpoint
+under mixed read/write workloads, checked against a stored baseline.
+
+The app is started in this process, served by uvicorn on --port (or
+called directly with ``--transport asgi``). It runs against either
+
+* ``--backend mongod``: a scratch database on MONGO_URL (default
+  mongodb://localhost:27017), dropped afterwards unless --keep-db; or
+* ``--backend mongomock``: an in-process stand-in (``mongomock_motor``,
+  not a runtime dependency). It needs no server, but it measures the API
+  layer only; its numbers say nothing about MongoDB.
+
+The database is seeded through the API with --materials, --records
+(one bulk import) and --shipments. Then every mix in --mixes runs at
+every level in --concurrency. Each run is a closed loop of that many
+workers, picking operations by the mix's weights with a fixed seed, for
+--duration seconds after --warmup. Results are printed as JSON and
+written to --output.
+
+Every run is checked against a baseline (default
+benchmarks/baselines/<backend>.json) and fails when, for any mix and
+concurrency, p95 grows or throughput drops by more than --tolerance, or
+errors appear. Latency is allowed --slack-ms on top, so sub-millisecond
+noise does not count. A missing baseline fails the run, and so does one
+recorded with a different backend, transport, seed sizes, --seed,
+--warmup or --duration: those numbers are not comparable. Baselines are
+machine specific: record one on the machine that runs the check with
+--save-baseline. The committed mongomock baseline is the ASGI transport
+with the defaults below.
+
+    python benchmarks/api_load.py --backend mongod --records 20000 --concurrency 1,16,64
+    python benchmarks/api_load.py --backend mongomock --transport asgi --save-baseline
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+
+MACHINES = ["Makine 1", "Makine 2"]
+THICKNESSES = [1.0, 1.5, 2.0, 3.0]
+WIDTHS = [100.0, 120.0, 150.0]
+LENGTHS = [25.0, 50.0]
+MASURAS = ["Masura 100", "Masura 120", "Masura Yok"]
+CUSTOMERS = [f"{name} {kind}" for name in ("Çağlar", "Işık", "Öztürk", "Şahin", "Yıldız", "Güneş", "Aydın", "Koç")
+             for kind in ("İnşaat", "Yalıtım", "Ambalaj", "Plastik")]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples: list, seconds: float) -> dict:
+    if not samples:
+        return {"requests": 0, "throughput": 0.0, "p50_ms": None, "p95_ms": None, "p99_ms": None}
+    return {
+        "requests": len(samples),
+        "throughput": round(len(samples) / seconds, 1),
+        "p50_ms": round(statistics.median(samples), 2),
+        "p95_ms": round(percentile(samples, 95), 2),
+        "p99_ms": round(percentile(samples, 99), 2),
+    }
+
+
+# Backends
+
+def import_server(mongo_url: str, db_name: str):
+    os.environ["MONGO_URL"] = mongo_url
+    os.environ["DB_NAME"] = db_name
+    sys.path.insert(0, str(BACKEND_DIR))
+    import server
+    return server
+
+
+def use_mongomock(server):
+    """Point the app at an in-process mongomock database."""
+    import mongomock.collection
+    import mongomock.database
+    from mongomock_motor import AsyncMongoMockClient
+
+    import stock_posting
+
+    # Not in mongomock: capped collections and tailable cursors. The event
+    # log becomes a plain collection that the tail loop polls.
+    create_collection = mongomock.database.Database.create_collection
+    mongomock.database.Database.create_collection = \
+        lambda self, name, **options: create_collection(self, name)
+    find = mongomock.collection.Collection.find
+    mongomock.collection.Collection.find = \
+        lambda self, *args, cursor_type=None, **kwargs: find(self, *args, **kwargs)
+
+    client = AsyncMongoMockClient(tz_aware=True)
+    server.client = client
+    server.db = client[os.environ["DB_NAME"]]
+    stock_posting._transactions_supported[id(server.db.client)] = False
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class App:
+    """The app served in-process, over uvicorn or directly over ASGI."""
+
+    def __init__(self, server, transport: str, port: int, concurrency: int):
+        self.server = server
+        self.transport = transport
+        self.port = port or free_port()
+        self.limits = httpx.Limits(max_connections=concurrency * 2, max_keepalive_connections=concurrency * 2)
+        self._uvicorn = None
+        self._task = None
+
+    async def __aenter__(self):
+        if self.transport == "asgi":
+            await self.server.app.router.startup()
+            return self
+        import uvicorn
+
+        config = uvicorn.Config(self.server.app, host="127.0.0.1", port=self.port, log_level="warning")
+        self._uvicorn = uvicorn.Server(config)
+        self._task = asyncio.create_task(self._uvicorn.serve())
+        while not self._uvicorn.started:
+            if self._task.done():
+                self._task.result()
+            await asyncio.sleep(0.05)
+        return self
+
+    async def __aexit__(self, *exc):
+        if self.transport == "asgi":
+            await self.server.app.router.shutdown()
+            return
+        self._uvicorn.should_exit = True
+        await self._task
+
+    def client(self) -> httpx.AsyncClient:
+        if self.transport == "asgi":
+            transport = httpx.ASGITransport(app=self.server.app)
+            return httpx.AsyncClient(transport=transport, base_url="http://bench/api", timeout=120)
+        return httpx.AsyncClient(base_url=f"http://127.0.0.1:{self.port}/api", timeout=120, limits=self.limits)
+
+
+# Seeding
+
+class Context:
+    def __init__(self):
+        self.colors = []
+        self.masuras = {}
+        self.gas = None
+        self.etags = {}
+        self.start = datetime.now(timezone.utc) - timedelta(days=365)
+
+
+def manufacturing_row(rng: random.Random, ctx: Context, when: datetime) -> dict:
+    masura_type = rng.choice(MASURAS)
+    return {
+        "production_date": when.isoformat(),
+        "machine": rng.choice(MACHINES),
+        "thickness_mm": rng.choice(THICKNESSES),
+        "width_cm": rng.choice(WIDTHS),
+        "length_m": rng.choice(LENGTHS),
+        "quantity": rng.randint(1, 40),
+        "masura_type": masura_type,
+        "masura_quantity": 0 if masura_type == "Masura Yok" else rng.randint(1, 40),
+        "color_material_id": rng.choice(ctx.colors + [None]),
+        "gas_consumption_kg": round(rng.uniform(5, 40), 2),
+    }
+
+
+def shipment_row(rng: random.Random, when: datetime) -> dict:
+    return {
+        "shipment_date": when.isoformat(),
+        "customer_company": rng.choice(CUSTOMERS),
+        "thickness_mm": rng.choice(THICKNESSES),
+        "width_cm": rng.choice(WIDTHS),
+        "length_m": rng.choice(LENGTHS),
+        "quantity": rng.randint(1, 10),
+        "invoice_number": f"IRS-{rng.randint(1, 999999):06d}",
+        "vehicle_plate": f"{rng.randint(1, 81):02d} {rng.choice('ABCDEFGHKLMNPRSTUVYZ')}{rng.choice('ABCDEFGHKLMNPRSTUVYZ')} {rng.randint(100, 9999)}",
+        "driver_name": rng.choice(["Ahmet Yılmaz", "Işıl Öztürk", "Mehmet Şahin", "Ayşe Güneş"]),
+    }
+
+
+async def check(response: httpx.Response) -> httpx.Response:
+    if response.status_code >= 400:
+        raise SystemExit(f"Seeding failed: {response.request.method} {response.request.url} "
+                         f"{response.status_code} {response.text[:200]}")
+    return response
+
+
+async def seed(client: httpx.AsyncClient, ctx: Context, args, rng: random.Random):
+    username = f"bench_{uuid.uuid4().hex[:8]}"
+    await check(await client.post("/auth/register", json={
+        "username": username, "email": f"{username}@bench.local", "password": "bench-password", "role": "admin"
+    }))
+    response = await check(await client.post("/auth/login", json={"username": username, "password": "bench-password"}))
+    client.headers["Authorization"] = f"Bearer {response.json()['token']}"
+
+    async def material(name, code):
+        response = await check(await client.post("/raw-materials", json={
+            "name": name, "code": code, "unit": "kg", "unit_price": round(rng.uniform(1, 50), 2), "min_stock_level": 10
+        }))
+        return response.json()['id']
+
+    ctx.gas = await material("Gaz", "GAZ001")
+    for name in MASURAS[:-1]:
+        ctx.masuras[name] = await material(name, name.replace(" ", "").upper())
+    for i in range(args.materials):
+        ctx.colors.append(await material(f"Renk {i + 1}", f"RNK{i + 1:03d}"))
+    # Enough stock that no withdrawal is ever short during the run
+    for material_id in [ctx.gas, *ctx.masuras.values()]:
+        await check(await client.post("/stock-transactions", json={
+            "material_id": material_id, "transaction_type": "in", "quantity": 1e9
+        }))
+
+    step = timedelta(days=365) / max(args.records, 1)
+    body = "\n".join(
+        json.dumps(manufacturing_row(rng, ctx, ctx.start + i * step)) for i in range(args.records)
+    )
+    if body:
+        await check(await client.post("/manufacturing/import", params={"format": "ndjson"}, content=body.encode()))
+
+    step = timedelta(days=365) / max(args.shipments, 1)
+    for start in range(0, args.shipments, 32):
+        rows = [shipment_row(rng, ctx.start + i * step) for i in range(start, min(start + 32, args.shipments))]
+        for response in await asyncio.gather(*(client.post("/shipments", json=row) for row in rows)):
+            await check(response)
+
+
+# Operations: (client, ctx, rng) -> response
+
+async def op_raw_materials(client, ctx, rng):
+    return await client.get("/raw-materials")
+
+
+async def op_raw_materials_304(client, ctx, rng):
+    # A polling client revalidating its copy
+    headers = {"If-None-Match": ctx.etags["raw_materials"]} if "raw_materials" in ctx.etags else {}
+    response = await client.get("/raw-materials", headers=headers)
+    if "etag" in response.headers:
+        ctx.etags["raw_materials"] = response.headers["etag"]
+    return response
+
+
+async def op_manufacturing_page(client, ctx, rng):
+    return await client.get("/manufacturing", params={"limit": 100})
+
+
+async def op_manufacturing_filtered(client, ctx, rng):
+    start = ctx.start + timedelta(days=rng.randint(0, 330))
+    return await client.get("/manufacturing", params={
+        "machine": rng.choice(MACHINES),
+        "from": start.isoformat(),
+        "to": (start + timedelta(days=30)).isoformat(),
+        "limit": 100,
+    })
+
+
+async def op_shipments_fields(client, ctx, rng):
+    return await client.get("/shipments", params={
+        "limit": 100, "fields": "shipment_date,customer_company,quantity,square_meters",
+    })
+
+
+async def op_stock(client, ctx, rng):
+    return await client.get("/stock")
+
+
+async def op_dashboard(client, ctx, rng):
+    return await client.get("/dashboard/stats")
+
+
+async def op_search(client, ctx, rng):
+    return await client.get("/search", params={"q": rng.choice(CUSTOMERS)[:rng.randint(2, 5)]})
+
+
+async def op_production_report(client, ctx, rng):
+    return await client.get("/reports/production", params={"granularity": "month"})
+
+
+async def op_create_manufacturing(client, ctx, rng):
+    return await client.post("/manufacturing", json=manufacturing_row(rng, ctx, datetime.now(timezone.utc)))
+
+
+async def op_create_shipment(client, ctx, rng):
+    return await client.post("/shipments", json=shipment_row(rng, datetime.now(timezone.utc)))
+
+
+async def op_stock_in(client, ctx, rng):
+    return await client.post("/stock-transactions", json={
+        "material_id": rng.choice(ctx.colors or [ctx.gas]), "transaction_type": "in", "quantity": rng.randint(1, 100)
+    })
+
+
+OPERATIONS = {
+    "raw_materials": op_raw_materials,
+    "raw_materials_304": op_raw_materials_304,
+    "manufacturing_page": op_manufacturing_page,
+    "manufacturing_filtered": op_manufacturing_filtered,
+    "shipments_fields": op_shipments_fields,
+    "stock": op_stock,
+    "dashboard": op_dashboard,
+    "search": op_search,
+    "production_report": op_production_report,
+    "create_manufacturing": op_create_manufacturing,
+    "create_shipment": op_create_shipment,
+    "stock_in": op_stock_in,
+}
+
+# Operation weights per mix
+MIXES = {
+    "read": {
+        "raw_materials": 2, "raw_materials_304": 10, "manufacturing_page": 10, "manufacturing_filtered": 10,
+        "shipments_fields": 8, "stock": 10, "dashboard": 10, "search": 15, "production_report": 5,
+    },
+    "mixed": {
+        "raw_materials_304": 10, "manufacturing_page": 10, "manufacturing_filtered": 10, "shipments_fields": 5,
+        "stock": 10, "dashboard": 10, "search": 10, "production_report": 5,
+        "create_manufacturing": 15, "create_shipment": 10, "stock_in": 5,
+    },
+    "write": {
+        "create_manufacturing": 50, "create_shipment": 30, "stock_in": 20,
+        "stock": 5, "dashboard": 5,
+    },
+}
+
+
+# Running
+
+async def run_phase(client, ctx, mix: str, concurrency: int, warmup: float, duration: float, seed: int) -> dict:
+    names = list(MIXES[mix])
+    weights = [MIXES[mix][name] for name in names]
+    samples = {name: [] for name in names}
+    errors = {}
+    measuring = False
+    stop = False
+
+    async def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        while not stop:
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                response = await OPERATIONS[name](client, ctx, rng)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            elapsed = (time.perf_counter() - started) * 1000
+            if not measuring:
+                continue
+            if failed:
+                errors[name] = errors.get(name, 0) + 1
+            else:
+                samples[name].append(elapsed)
+
+    workers = [asyncio.create_task(worker(i)) for i in range(concurrency)]
+    await asyncio.sleep(warmup)
+    measuring = True
+    measured_from = time.perf_counter()
+    await asyncio.sleep(duration)
+    measuring = False
+    seconds = time.perf_counter() - measured_from
+    stop = True
+    await asyncio.gather(*workers)
+
+    overall = summarize([s for values in samples.values() for s in values], seconds)
+    return {
+        "mix": mix,
+        "concurrency": concurrency,
+        **overall,
+        "errors": sum(errors.values()),
+        "operations": {
+            name: {**summarize(values, seconds), "errors": errors.get(name, 0)}
+            for name, values in samples.items()
+        },
+    }
+
+
+# What a run measured under; results are only comparable when all of it matches
+SETUP_KEYS = ["backend", "transport", "seed", "warmup_seconds", "duration_seconds"]
+
+
+def setup(report: dict) -> dict:
+    fields = {key: report.get(key) for key in SETUP_KEYS}
+    # Seeding time is a result, not part of the setup
+    fields['seed'] = {key: value for key, value in (fields['seed'] or {}).items() if key != "seconds"}
+    return fields
+
+
+def mismatches(report: dict, baseline: dict) -> list:
+    ours, theirs = setup(report), setup(baseline)
+    return [f"{key}: {ours[key]} vs baseline {theirs[key]}" for key in SETUP_KEYS if ours[key] != theirs[key]]
+
+
+def compare(results: list, baseline: dict, tolerance: float, slack_ms: float) -> list:
+    expected = {(row['mix'], row['concurrency']): row for row in baseline['results']}
+    regressions = []
+    for row in results:
+        base = expected.get((row['mix'], row['concurrency']))
+        label = f"{row['mix']} @ {row['concurrency']}"
+        if base is None:
+            regressions.append(f"{label}: not in the baseline")
+            continue
+        if row['errors'] > base.get('errors', 0):
+            regressions.append(f"{label}: {row['errors']} errors (baseline {base.get('errors', 0)})")
+        if base['p95_ms'] is not None and row['p95_ms'] is not None \
+                and row['p95_ms'] > base['p95_ms'] * (1 + tolerance) + slack_ms:
+            regressions.append(f"{label}: p95 {row['p95_ms']}ms vs baseline {base['p95_ms']}ms")
+        if row['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(f"{label}: throughput {row['throughput']}/s vs baseline {base['throughput']}/s")
+    return regressions
+
+
+async def run(args) -> int:
+    db_name = f"bench_api_{uuid.uuid4().hex[:8]}"
+    server = import_server(args.mongo_url, db_name)
+    # server.py logs at INFO; a line per request would dominate the run
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    if args.backend == "mongomock":
+        use_mongomock(server)
+    rng = random.Random(args.seed)
+    ctx = Context()
+    levels = [int(level) for level in args.concurrency.split(",")]
+    mixes = args.mixes.split(",")
+    unknown = [mix for mix in mixes if mix not in MIXES]
+    if unknown:
+        raise SystemExit(f"Unknown mixes: {', '.join(unknown)}")
+
+    results = []
+    try:
+        async with App(server, args.transport, args.port, max(levels)) as app:
+            async with app.client() as client:
+                seeded_from = time.perf_counter()
+                await seed(client, ctx, args, rng)
+                seed_seconds = time.perf_counter() - seeded_from
+                for mix in mixes:
+                    for level in levels:
+                        row = await run_phase(client, ctx, mix, level, args.warmup, args.duration, args.seed)
+                        results.append(row)
+                        print(f"{mix:<6} c={level:<4} {row['throughput']:>8}/s p50={row['p50_ms']}ms "
+                              f"p95={row['p95_ms']}ms p99={row['p99_ms']}ms errors={row['errors']}",
+                              file=sys.stderr)
+    finally:
+        if args.backend == "mongod" and not args.keep_db:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            cleanup = AsyncIOMotorClient(args.mongo_url)
+            await cleanup.drop_database(db_name)
+            cleanup.close()
+
+    report = {
+        "backend": args.backend,
+        "transport": args.transport,
+        "seed": {"materials": args.materials, "records": args.records, "shipments": args.shipments,
+                 "random": args.seed, "seconds": round(seed_seconds, 1)},
+        "warmup_seconds": args.warmup,
+        "duration_seconds": args.duration,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+
+    baseline_path = Path(args.baseline or BASELINE_DIR / f"{args.backend}.json")
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(text + "\n", encoding="utf-8")
+        print(f"Baseline saved to {baseline_path}", file=sys.stderr)
+        return 0
+    if not baseline_path.exists():
+        print(f"❌ No baseline at {baseline_path}; record one with --save-baseline", file=sys.stderr)
+        return 1
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    differences = mismatches(report, baseline)
+    if differences:
+        for difference in differences:
+            print(f"❌ Not comparable with {baseline_path}: {difference}", file=sys.stderr)
+        return 1
+    regressions = compare(results, baseline, args.tolerance, args.slack_ms)
+    for regression in regressions:
+        print(f"❌ {regression}", file=sys.stderr)
+    if not regressions:
+        print(f"✅ No regressions against {baseline_path}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API throughput and latency benchmark")
+    parser.add_argument("--backend", choices=["mongod", "mongomock"], default="mongod")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--keep-db", action="store_true", help="keep the scratch database (mongod)")
+    parser.add_argument("--transport", choices=["uvicorn", "asgi"], default="uvicorn")
+    parser.add_argument("--port", type=int, default=0, help="uvicorn port (default: a free one)")
+    parser.add_argument("--materials", type=int, default=20, help="color materials to seed")
+    parser.add_argument("--records", type=int, default=5000, help="manufacturing records to seed")
+    parser.add_argument("--shipments", type=int, default=2000, help="shipments to seed")
+    parser.add_argument("--mixes", default="read,mixed,write", help=f"comma-separated: {', '.join(MIXES)}")
+    parser.add_argument("--concurrency", default="1,16", help="comma-separated worker counts")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds before measuring")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds measured per mix and level")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the JSON report here")
+    parser.add_argument("--baseline", help="baseline JSON (default: benchmarks/baselines/<backend>.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative p95/throughput change")
+    parser.add_argument("--slack-ms", type=float, default=2.0, help="absolute p95 allowance on top")
+    args = parser.parse_args()
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
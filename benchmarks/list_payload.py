@@ -0,0 +1,135 @@
+"""List-payload benchmark: bytes on the wire and latency of the shipment
+and manufacturing lists, with and without ``?fields=`` and compression.
+
+Each list is fetched in four variants:
+
+* ``full``: every field, uncompressed (the behaviour before projection
+  and compression);
+* ``fields``: only the columns a table view needs, uncompressed;
+* ``full+gzip`` / ``fields+gzip``: the same, compressed (``br`` is used
+  instead with ``--encoding br``).
+
+It seeds ``--records`` manufacturing records and shipments first unless
+``--no-seed`` is given. The seeding user is an admin, so run it against
+a scratch database.
+
+    python benchmarks/list_payload.py --base-url http://localhost:8001 --records 1000
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+import uuid
+
+import httpx
+
+VIEWS = {
+    "/manufacturing": "production_date,machine,thickness_mm,width_cm,length_m,quantity,square_meters,color_name",
+    "/shipments": "shipment_date,customer_company,thickness_mm,width_cm,length_m,quantity,square_meters",
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def seed(client, records):
+    for start in range(0, records, 50):
+        batch = range(start, min(start + 50, records))
+        await asyncio.gather(*(client.post("/manufacturing", json={
+            "production_date": "2026-01-15T08:00:00Z",
+            "machine": "Makine 1",
+            "thickness_mm": 2,
+            "width_cm": 100,
+            "length_m": 50,
+            "quantity": 20,
+            "masura_type": "Masura Yok",
+            "masura_quantity": 0,
+            "gas_consumption_kg": 12.5,
+        }) for _ in batch))
+        await asyncio.gather(*(client.post("/shipments", json={
+            "shipment_date": "2026-01-20T08:00:00Z",
+            "customer_company": f"Musteri {i % 40}",
+            "thickness_mm": 2,
+            "width_cm": 100,
+            "length_m": 50,
+            "quantity": 1,
+            "invoice_number": f"FTR-{i:06d}",
+            "vehicle_plate": "34 ABC 123",
+            "driver_name": "Ahmet Yilmaz",
+        }) for i in batch))
+
+
+async def measure(client, path, params, encoding, requests):
+    latencies = []
+    wire = body = 0
+    for _ in range(requests):
+        started = time.perf_counter()
+        response = await client.get(path, params=params, headers={"Accept-Encoding": encoding})
+        latencies.append((time.perf_counter() - started) * 1000)
+        response.raise_for_status()
+        wire = response.num_bytes_downloaded
+        body = len(response.content)
+    return {
+        "wire_bytes": wire,
+        "body_bytes": body,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": percentile(latencies, 95),
+    }
+
+
+async def run(base_url, records, limit, requests, encoding, do_seed):
+    api = f"{base_url}/api"
+    username = f"bench_{uuid.uuid4().hex[:8]}"
+    password = "bench-password"
+    async with httpx.AsyncClient(base_url=api, timeout=120) as client:
+        await client.post("/auth/register", json={
+            "username": username, "email": f"{username}@bench.local", "password": password, "role": "admin"
+        })
+        response = await client.post("/auth/login", json={"username": username, "password": password})
+        response.raise_for_status()
+        client.headers["Authorization"] = f"Bearer {response.json()['token']}"
+
+        if do_seed:
+            await seed(client, records)
+
+        results = []
+        for path, fields in VIEWS.items():
+            variants = [
+                ("full", {"limit": limit}, "identity"),
+                ("fields", {"limit": limit, "fields": fields}, "identity"),
+                (f"full+{encoding}", {"limit": limit}, encoding),
+                (f"fields+{encoding}", {"limit": limit, "fields": fields}, encoding),
+            ]
+            for name, params, accept in variants:
+                result = await measure(client, path, params, accept, requests)
+                results.append((path, name, result))
+
+    print(f"{'endpoint':<16} {'variant':<14} {'wire':>10} {'body':>10} {'saved':>7} {'p50':>8} {'p95':>8}")
+    baselines = {}
+    for path, name, result in results:
+        baseline = baselines.setdefault(path, result['wire_bytes'])
+        saved = 1 - result['wire_bytes'] / baseline if baseline else 0
+        print(f"{path:<16} {name:<14} {result['wire_bytes']:>10} {result['body_bytes']:>10} "
+              f"{saved:>6.0%} {result['p50_ms']:>6.1f}ms {result['p95_ms']:>6.1f}ms")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List payload size and latency benchmark")
+    parser.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--records", type=int, default=1000, help="manufacturing records and shipments to seed")
+    parser.add_argument("--limit", type=int, default=1000, help="page size requested")
+    parser.add_argument("--requests", type=int, default=20, help="requests per variant")
+    parser.add_argument("--encoding", default="gzip", choices=["gzip", "br"])
+    parser.add_argument("--no-seed", action="store_true")
+    args = parser.parse_args()
+    ok = asyncio.run(run(args.base_url, args.records, args.limit, args.requests, args.encoding, not args.no_seed))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
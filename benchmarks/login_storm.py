@@ -0,0 +1,102 @@
+"""Login-storm benchmark: unrelated endpoints must stay fast while
+many users log in at once (shift change).
+
+Measures p50/p99 latency of an unrelated endpoint first on a quiet
+server, then while a storm of concurrent logins is running, and fails
+when the p99 during the storm exceeds the quiet p99 by more than the
+allowed factor.
+
+    python benchmarks/login_storm.py --base-url http://localhost:8001 --logins 40
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+import uuid
+
+import httpx
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def probe(client, endpoint, token, stop, samples):
+    headers = {"Authorization": f"Bearer {token}"}
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get(endpoint, headers=headers)
+        samples.append((time.perf_counter() - started) * 1000)
+
+
+async def measure(client, endpoint, token, duration, probes=4):
+    samples = []
+    stop = asyncio.Event()
+    tasks = [asyncio.create_task(probe(client, endpoint, token, stop, samples)) for _ in range(probes)]
+    await asyncio.sleep(duration)
+    stop.set()
+    await asyncio.gather(*tasks)
+    return samples
+
+
+async def run(base_url, endpoint, logins, rounds, duration, max_factor):
+    api = f"{base_url}/api"
+    username = f"bench_{uuid.uuid4().hex[:8]}"
+    password = "bench-password"
+    async with httpx.AsyncClient(base_url=api, timeout=60) as client:
+        await client.post("/auth/register", json={
+            "username": username, "email": f"{username}@bench.local", "password": password, "role": "viewer"
+        })
+        response = await client.post("/auth/login", json={"username": username, "password": password})
+        response.raise_for_status()
+        token = response.json()['token']
+
+        quiet = await measure(client, endpoint, token, duration)
+
+        async def storm():
+            for _ in range(rounds):
+                await asyncio.gather(*(
+                    client.post("/auth/login", json={"username": username, "password": password})
+                    for _ in range(logins)
+                ))
+
+        storm_started = time.perf_counter()
+        storm_task = asyncio.create_task(storm())
+        loaded = []
+        stop = asyncio.Event()
+        probes = [asyncio.create_task(probe(client, endpoint, token, stop, loaded)) for _ in range(4)]
+        await storm_task
+        storm_seconds = time.perf_counter() - storm_started
+        stop.set()
+        await asyncio.gather(*probes)
+
+    quiet_p99 = percentile(quiet, 99)
+    loaded_p99 = percentile(loaded, 99)
+    print(f"Endpoint under test: {endpoint}")
+    print(f"Quiet:  n={len(quiet)} p50={statistics.median(quiet):.1f}ms p99={quiet_p99:.1f}ms")
+    print(f"Storm:  n={len(loaded)} p50={statistics.median(loaded):.1f}ms p99={loaded_p99:.1f}ms")
+    print(f"Logins: {logins * rounds} in {storm_seconds:.2f}s ({logins * rounds / storm_seconds:.1f}/s)")
+
+    ok = loaded_p99 <= quiet_p99 * max_factor + 20
+    print("✅ p99 stable during login storm" if ok else f"❌ p99 grew more than {max_factor}x during login storm")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Login-storm latency benchmark")
+    parser.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--endpoint", default="/stock")
+    parser.add_argument("--logins", type=int, default=40, help="concurrent logins per round")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds of quiet measurement")
+    parser.add_argument("--max-factor", type=float, default=2.0)
+    args = parser.parse_args()
+    ok = asyncio.run(run(args.base_url, args.endpoint, args.logins, args.rounds, args.duration, args.max_factor))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""Concurrency benchmark for the stock-posting primitive.
+
+Fires thousands of parallel withdrawals and receipts at a single raw
+material and checks that the final balance and the ledger are exact:
+no lost updates and no negative stock.
+
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/stock_posting.py --postings 5000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+
+from stock_posting import post_stock, InsufficientStock  # noqa: E402
+
+
+async def run(mongo_url: str, postings: int, initial_stock: int) -> bool:
+    client = AsyncIOMotorClient(mongo_url, maxPoolSize=200)
+    db = client[f"bench_stock_posting_{uuid.uuid4().hex[:8]}"]
+    material_id = str(uuid.uuid4())
+    await db.raw_materials.insert_one({"id": material_id, "name": "Bench", "code": "BENCH", "current_stock": initial_stock})
+
+    # Two withdrawals of 1 for every receipt of 1: demand exceeds supply
+    deltas = [1 if i % 3 == 0 else -1 for i in range(postings)]
+
+    async def one(delta):
+        ledger = ("consumptions", {"id": str(uuid.uuid4()), "material_id": material_id, "quantity": delta})
+        try:
+            await post_stock(db, material_id, delta, ledger=ledger)
+            return delta
+        except InsufficientStock:
+            return None
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(d) for d in deltas))
+    elapsed = time.perf_counter() - started
+
+    applied = [d for d in results if d is not None]
+    expected = initial_stock + sum(applied)
+    material = await db.raw_materials.find_one({"id": material_id})
+    ledger_rows = await db.consumptions.count_documents({})
+    ledger_sum = (await db.consumptions.aggregate([{"$group": {"_id": None, "sum": {"$sum": "$quantity"}}}]).to_list(1))[0]['sum']
+
+    print(f"Postings: {postings} in {elapsed:.2f}s ({postings / elapsed:.0f}/s)")
+    print(f"Applied: {len(applied)}, rejected (insufficient): {postings - len(applied)}")
+    print(f"Final stock: {material['current_stock']} (expected {expected})")
+    print(f"Ledger rows: {ledger_rows}, ledger sum: {ledger_sum}")
+
+    ok = (
+        material['current_stock'] == expected
+        and material['current_stock'] >= 0
+        and ledger_rows == len(applied)
+        and initial_stock + ledger_sum == material['current_stock']
+    )
+    print("✅ Balance exact" if ok else "❌ Balance mismatch")
+
+    await client.drop_database(db.name)
+    client.close()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--postings", type=int, default=5000)
+    parser.add_argument("--initial-stock", type=int, default=100)
+    args = parser.parse_args()
+    ok = asyncio.run(run(args.mongo_url, args.postings, args.initial_stock))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
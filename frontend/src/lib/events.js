@@ -0,0 +1,27 @@
+import { API } from '@/App';
+
+// Subscribe to server change events. `handlers` maps event type -> callback(data);
+// 'resync' fires when events were dropped and the caller should refetch.
+// EventSource reconnects on its own and resumes from the last event id.
+// The returned function unsubscribes; its `live()` tells whether the stream
+// is open, so a caller can refetch after its own writes when it is not.
+export function subscribeEvents(handlers) {
+  const token = localStorage.getItem('token');
+  const types = Object.keys(handlers).filter((type) => type !== 'resync').join(',');
+  const source = new EventSource(
+    `${API}/events?${new URLSearchParams({ token, types })}`
+  );
+  Object.entries(handlers).forEach(([type, handler]) => {
+    source.addEventListener(type, (event) => handler(JSON.parse(event.data)));
+  });
+  const unsubscribe = () => source.close();
+  unsubscribe.live = () => source.readyState === EventSource.OPEN;
+  return unsubscribe;
+}
+
+// Replace or insert an item by id, keeping the list's order key.
+export function upsertById(items, item, compare) {
+  const next = items.filter((existing) => existing.id !== item.id);
+  next.push(item);
+  return compare ? next.sort(compare) : next;
+}
@@ -0,0 +1,13 @@
+import axios from 'axios';
+
+// List endpoints return { items, next_cursor }; follow the cursor to load everything.
+export async function fetchAllPages(url, params = {}) {
+  const items = [];
+  let after;
+  do {
+    const response = await axios.get(url, { params: { ...params, limit: 1000, after } });
+    items.push(...response.data.items);
+    after = response.data.next_cursor;
+  } while (after);
+  return items;
+}
@@ -1,6 +1,7 @@
 import { useState, useEffect } from 'react';
 import axios from 'axios';
 import { API } from '@/App';
+import { fetchAllPages } from '@/lib/pagination';
 import { toast } from 'sonner';
 import { Button } from '@/components/ui/button';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
@@ -34,8 +35,8 @@ export default function Consumption({ user }) {
 
   const fetchConsumptions = async () => {
     try {
-      const response = await axios.get(`${API}/consumptions`);
-      setConsumptions(response.data);
+      const items = await fetchAllPages(`${API}/consumptions`);
+      setConsumptions(items);
     } catch (error) {
       toast.error('Tüketimler yüklenemedi');
     } finally {
@@ -45,8 +46,8 @@ export default function Consumption({ user }) {
 
   const fetchMaterials = async () => {
     try {
-      const response = await axios.get(`${API}/raw-materials`);
-      setMaterials(response.data);
+      const items = await fetchAllPages(`${API}/raw-materials`);
+      setMaterials(items);
     } catch (error) {
       toast.error('Hammaddeler yüklenemedi');
     }
@@ -54,8 +55,8 @@ export default function Consumption({ user }) {
 
   const fetchProductionOrders = async () => {
     try {
-      const response = await axios.get(`${API}/production-orders`);
-      const activeOrders = response.data.filter(
+      const items = await fetchAllPages(`${API}/production-orders`);
+      const activeOrders = items.filter(
         (order) => order.status === 'planned' || order.status === 'in_progress'
       );
       setProductionOrders(activeOrders);
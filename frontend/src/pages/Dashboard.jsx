@@ -1,6 +1,7 @@
 import { useState, useEffect } from 'react';
 import axios from 'axios';
 import { API } from '@/App';
+import { subscribeEvents } from '@/lib/events';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
 import { Boxes, Package, Factory, Truck, AlertTriangle } from 'lucide-react';
 
@@ -12,6 +13,30 @@ export default function Dashboard() {
     fetchStats();
   }, []);
 
+  // Counts change with most writes; refetch once per burst of events
+  useEffect(() => {
+    let timer;
+    const refresh = () => {
+      clearTimeout(timer);
+      timer = setTimeout(fetchStats, 1000);
+    };
+    const unsubscribe = subscribeEvents({
+      'manufacturing.created': refresh,
+      'manufacturing.deleted': refresh,
+      'manufacturing.imported': refresh,
+      'shipment.created': refresh,
+      'shipment.deleted': refresh,
+      'stock_transaction.created': refresh,
+      'consumption.created': refresh,
+      'production_order.status_changed': refresh,
+      resync: refresh
+    });
+    return () => {
+      clearTimeout(timer);
+      unsubscribe();
+    };
+  }, []);
+
   const fetchStats = async () => {
     try {
       const response = await axios.get(`${API}/dashboard/stats`);
@@ -1,6 +1,8 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import { API } from '@/App';
+import { fetchAllPages } from '@/lib/pagination';
+import { subscribeEvents, upsertById } from '@/lib/events';
 import { toast } from 'sonner';
 import { Button } from '@/components/ui/button';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
@@ -38,10 +40,31 @@ export default function Manufacturing({ user }) {
     fetchColors();
   }, []);
 
+  // Patch the list from server events instead of refetching after every change
+  const events = useRef(null);
+  useEffect(() => {
+    const byDateDesc = (a, b) => new Date(b.production_date) - new Date(a.production_date);
+    events.current = subscribeEvents({
+      'manufacturing.created': ({ record }) => setRecords((items) => upsertById(items, record, byDateDesc)),
+      'manufacturing.updated': ({ record }) => setRecords((items) => upsertById(items, record, byDateDesc)),
+      'manufacturing.deleted': ({ record }) => setRecords((items) => items.filter((item) => item.id !== record.id)),
+      'manufacturing.imported': () => fetchRecords(),
+      resync: () => fetchRecords()
+    });
+    return events.current;
+  }, []);
+
+  // Without the event stream (blocked, or signed out) nothing patches the list
+  const refetchUnlessLive = () => {
+    if (!events.current?.live()) {
+      fetchRecords();
+    }
+  };
+
   const fetchRecords = async () => {
     try {
-      const response = await axios.get(`${API}/manufacturing`);
-      setRecords(response.data);
+      const items = await fetchAllPages(`${API}/manufacturing`);
+      setRecords(items);
     } catch (error) {
       toast.error('Üretim kayıtları yüklenemedi');
     } finally {
@@ -51,9 +74,9 @@ export default function Manufacturing({ user }) {
 
   const fetchColors = async () => {
     try {
-      const response = await axios.get(`${API}/raw-materials`);
+      const items = await fetchAllPages(`${API}/raw-materials`);
       // Filter materials that contain "Renk" in their name
-      const colorMaterials = response.data.filter(m => m.name.toLowerCase().includes('renk'));
+      const colorMaterials = items.filter(m => m.name.toLowerCase().includes('renk'));
       setColors(colorMaterials);
     } catch (error) {
       console.error('Renkler yüklenemedi:', error);
@@ -123,11 +146,7 @@ export default function Manufacturing({ user }) {
         color_material_id: '',
         gas_consumption_kg: ''
       });
-      
-      // Biraz bekle sonra kayıtları yükle
-      setTimeout(() => {
-        fetchRecords();
-      }, 300);
+      refetchUnlessLive();
       
     } catch (error) {
       toast.error(error.response?.data?.detail || 'Hata oluştu');
@@ -142,7 +161,7 @@ export default function Manufacturing({ user }) {
     try {
       await axios.delete(`${API}/manufacturing/${recordId}`);
       toast.success('Kayıt silindi');
-      fetchRecords();
+      refetchUnlessLive();
     } catch (error) {
       toast.error(error.response?.data?.detail || 'Hata oluştu');
     }
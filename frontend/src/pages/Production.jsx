@@ -1,6 +1,7 @@
 import { useState, useEffect } from 'react';
 import axios from 'axios';
 import { API } from '@/App';
+import { fetchAllPages } from '@/lib/pagination';
 import { toast } from 'sonner';
 import { Button } from '@/components/ui/button';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
@@ -32,8 +33,8 @@ export default function Production({ user }) {
 
   const fetchOrders = async () => {
     try {
-      const response = await axios.get(`${API}/production-orders`);
-      setOrders(response.data);
+      const items = await fetchAllPages(`${API}/production-orders`);
+      setOrders(items);
     } catch (error) {
       toast.error('Üretim emirleri yüklenemedi');
     } finally {
@@ -43,8 +44,8 @@ export default function Production({ user }) {
 
   const fetchProducts = async () => {
     try {
-      const response = await axios.get(`${API}/products`);
-      setProducts(response.data);
+      const items = await fetchAllPages(`${API}/products`);
+      setProducts(items);
     } catch (error) {
       toast.error('Ürünler yüklenemedi');
     }
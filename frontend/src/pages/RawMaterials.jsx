@@ -1,6 +1,7 @@
 import { useState, useEffect } from 'react';
 import axios from 'axios';
 import { API } from '@/App';
+import { fetchAllPages } from '@/lib/pagination';
 import { toast } from 'sonner';
 import { Button } from '@/components/ui/button';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
@@ -38,8 +39,8 @@ export default function RawMaterials({ user }) {
 
   const fetchMaterials = async () => {
     try {
-      const response = await axios.get(`${API}/raw-materials`);
-      setMaterials(response.data);
+      const items = await fetchAllPages(`${API}/raw-materials`);
+      setMaterials(items);
     } catch (error) {
       toast.error('Hammaddeler yüklenemedi');
     } finally {
@@ -1,6 +1,7 @@
 import { useState, useEffect } from 'react';
 import axios from 'axios';
 import { API } from '@/App';
+import { fetchAllPages } from '@/lib/pagination';
 import { toast } from 'sonner';
 import { Button } from '@/components/ui/button';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
@@ -8,7 +9,7 @@ import { Dialog, DialogContent, DialogHeader, DialogTitle, DialogTrigger } from
 import { Input } from '@/components/ui/input';
 import { Label } from '@/components/ui/label';
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@/components/ui/select';
-import { Plus, Trash2, Truck } from 'lucide-react';
+import { Plus, Trash2, Truck, Search } from 'lucide-react';
 import { format } from 'date-fns';
 import { tr } from 'date-fns/locale';
 
@@ -17,6 +18,8 @@ export default function Shipments({ user }) {
   const [colors, setColors] = useState([]);
   const [loading, setLoading] = useState(true);
   const [dialogOpen, setDialogOpen] = useState(false);
+  const [query, setQuery] = useState('');
+  const [results, setResults] = useState(null);
   const [formData, setFormData] = useState({
     shipment_date: '',
     customer_company: '',
@@ -39,8 +42,8 @@ export default function Shipments({ user }) {
 
   const fetchShipments = async () => {
     try {
-      const response = await axios.get(`${API}/shipments`);
-      setShipments(response.data);
+      const items = await fetchAllPages(`${API}/shipments`);
+      setShipments(items);
     } catch (error) {
       toast.error('Sevkiyatlar yüklenemedi');
     } finally {
@@ -48,10 +51,31 @@ export default function Shipments({ user }) {
     }
   };
 
+  // Search on the server: customer, irsaliye, plate or driver prefix
+  useEffect(() => {
+    if (!query.trim()) {
+      setResults(null);
+      return;
+    }
+    const timer = setTimeout(async () => {
+      try {
+        const response = await axios.get(`${API}/search`, {
+          params: { q: query, types: 'shipments', limit: 50 }
+        });
+        setResults(response.data.shipments);
+      } catch (error) {
+        toast.error('Arama yapılamadı');
+      }
+    }, 250);
+    return () => clearTimeout(timer);
+  }, [query]);
+
+  const visibleShipments = results ?? shipments;
+
   const fetchColors = async () => {
     try {
-      const response = await axios.get(`${API}/raw-materials`);
-      const colorMaterials = response.data.filter(m => m.name.toLowerCase().includes('renk'));
+      const items = await fetchAllPages(`${API}/raw-materials`);
+      const colorMaterials = items.filter(m => m.name.toLowerCase().includes('renk'));
       setColors(colorMaterials);
     } catch (error) {
       console.error('Renkler yüklenemedi:', error);
@@ -97,6 +121,7 @@ export default function Shipments({ user }) {
     try {
       await axios.delete(`${API}/shipments/${shipmentId}`);
       toast.success('Sevkiyat kaydı silindi');
+      setResults((items) => items && items.filter((item) => item.id !== shipmentId));
       fetchShipments();
     } catch (error) {
       toast.error(error.response?.data?.detail || 'Hata oluştu');
@@ -281,8 +306,18 @@ export default function Shipments({ user }) {
       </div>
 
       <Card>
-        <CardHeader>
+        <CardHeader className="flex flex-row items-center justify-between gap-4">
           <CardTitle>Sevkiyat Listesi</CardTitle>
+          <div className="relative w-72">
+            <Search className="absolute left-2 top-2.5 h-4 w-4 text-gray-400" />
+            <Input
+              value={query}
+              onChange={(e) => setQuery(e.target.value)}
+              placeholder="Firma, irsaliye, plaka, şoför..."
+              className="pl-8"
+              data-testid="shipment-search"
+            />
+          </div>
         </CardHeader>
         <CardContent>
           <div className="overflow-x-auto">
@@ -304,7 +339,7 @@ export default function Shipments({ user }) {
                 </tr>
               </thead>
               <tbody>
-                {shipments.map((shipment, index) => (
+                {visibleShipments.map((shipment, index) => (
                   <tr key={shipment.id} className="border-b hover:bg-gray-50" data-testid={`shipment-row-${index}`}>
                     <td className="p-2">{format(new Date(shipment.shipment_date), 'dd.MM.yyyy', { locale: tr })}</td>
                     <td className="p-2 font-medium">{shipment.customer_company}</td>
@@ -342,9 +377,9 @@ export default function Shipments({ user }) {
                 ))}
               </tbody>
             </table>
-            {shipments.length === 0 && (
+            {visibleShipments.length === 0 && (
               <div className="text-center py-8 text-gray-500">
-                Henüz sevkiyat kaydı bulunmuyor.
+                {results ? 'Aramaya uyan sevkiyat bulunamadı.' : 'Henüz sevkiyat kaydı bulunmuyor.'}
               </div>
             )}
           </div>
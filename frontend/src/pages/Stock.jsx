@@ -1,6 +1,7 @@
 import { useState, useEffect } from 'react';
 import axios from 'axios';
 import { API } from '@/App';
+import { subscribeEvents } from '@/lib/events';
 import { toast } from 'sonner';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
 import { Package } from 'lucide-react';
@@ -13,6 +14,38 @@ export default function Stock() {
     fetchStock();
   }, []);
 
+  // Rolls in add to the matching stock row, shipments take from it
+  useEffect(() => {
+    const post = (item, sign) => setStockItems((items) => {
+      const key = (row) => `${row.thickness_mm}|${row.width_cm}|${row.length_m}|${row.color_name || ''}`;
+      const next = items.map((row) => ({ ...row }));
+      let row = next.find((existing) => key(existing) === key(item));
+      if (!row) {
+        row = {
+          thickness_mm: item.thickness_mm,
+          width_cm: item.width_cm,
+          length_m: item.length_m,
+          color_name: item.color_name,
+          total_quantity: 0,
+          total_square_meters: 0
+        };
+        next.push(row);
+      }
+      row.total_quantity += sign * item.quantity;
+      row.total_square_meters += sign * item.square_meters;
+      return next.filter((r) => r.total_quantity > 0).sort((a, b) => b.total_quantity - a.total_quantity);
+    });
+    return subscribeEvents({
+      'manufacturing.created': ({ record }) => post(record, 1),
+      'manufacturing.updated': ({ record, previous }) => { post(previous, -1); post(record, 1); },
+      'manufacturing.deleted': ({ record }) => post(record, -1),
+      'shipment.created': ({ shipment }) => post(shipment, -1),
+      'shipment.deleted': ({ shipment }) => post(shipment, 1),
+      'manufacturing.imported': () => fetchStock(),
+      resync: () => fetchStock()
+    });
+  }, []);
+
   const fetchStock = async () => {
     try {
       const response = await axios.get(`${API}/stock`);
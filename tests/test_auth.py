@@ -0,0 +1,86 @@
+"""Bearer tokens: expiry, revocation of cached principals, cross-worker refresh."""
+import time
+from types import SimpleNamespace
+
+import jwt
+import pytest
+
+import cache
+import server
+from principals import RevocationList, principal_cache, user_cache
+
+pytestmark = pytest.mark.anyio
+
+ADMIN = {"id": "u-admin", "username": "admin", "email": "admin@example.com", "role": "admin",
+         "created_at": "2025-01-01T00:00:00+00:00"}
+CLERK = {"id": "u-clerk", "username": "clerk", "email": "clerk@example.com", "role": "user",
+         "created_at": "2025-01-01T00:00:00+00:00"}
+
+
+@pytest.fixture
+async def client(api, db, monkeypatch):
+    """The app with real bearer authentication and a revocation list of its own."""
+    server.app.dependency_overrides.clear()
+    monkeypatch.setattr(server, "revocations", RevocationList())
+    principal_cache.clear()
+    user_cache.clear()
+    await db.users.insert_many([dict(ADMIN), dict(CLERK)])
+    yield api
+    principal_cache.clear()
+    user_cache.clear()
+
+
+def bearer(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def token_for(user: dict, **claims) -> str:
+    now = int(time.time())
+    payload = {"user_id": user['id'], "username": user['username'], "role": user['role'],
+               "iat": now, "exp": now + 3600, **claims}
+    return jwt.encode(payload, server.JWT_SECRET, algorithm=server.JWT_ALGORITHM)
+
+
+async def test_expired_token_is_rejected(client):
+    token = token_for(CLERK, iat=int(time.time()) - 7200, exp=int(time.time()) - 60)
+
+    response = await client.get("/auth/me", headers=bearer(token))
+
+    assert response.status_code == 401
+
+
+async def test_cached_principal_expires_with_its_token(client, monkeypatch):
+    token = token_for(CLERK, exp=int(time.time()) + 30)
+    assert (await client.get("/auth/me", headers=bearer(token))).status_code == 200
+    assert principal_cache.get(server.token_key(token)) is not None
+
+    # Past the token's expiry but well inside PRINCIPAL_CACHE_TTL
+    later = time.monotonic() + 31
+    monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=lambda: later))
+
+    assert principal_cache.get(server.token_key(token)) is None
+
+
+async def test_deleted_users_cached_token_is_rejected(client):
+    token = token_for(CLERK)
+    assert (await client.get("/auth/me", headers=bearer(token))).status_code == 200
+    assert principal_cache.get(server.token_key(token)) is not None
+
+    response = await client.delete(f"/users/{CLERK['id']}", headers=bearer(token_for(ADMIN)))
+    assert response.status_code == 200
+
+    assert (await client.get("/auth/me", headers=bearer(token))).status_code == 401
+
+
+async def test_refresh_picks_up_another_workers_revocation(db):
+    this_worker, other_worker = RevocationList(), RevocationList()
+    await this_worker.refresh(db)
+    issued = {"user_id": CLERK['id'], "iat": int(time.time())}
+
+    await other_worker.revoke_user(db, CLERK['id'])
+    assert not this_worker.is_revoked(issued)
+
+    await this_worker.refresh(db)
+    assert this_worker.is_revoked(issued)
+    # Tokens issued after the revocation are accepted again
+    assert not this_worker.is_revoked({**issued, "iat": int(time.time()) + 1})
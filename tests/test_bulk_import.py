@@ -0,0 +1,72 @@
+"""Bulk manufacturing import: good rows land, bad rows are reported by number."""
+import json
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+ROW = {
+    "production_date": "2026-03-02T08:00:00+00:00",
+    "machine": "Makine 1",
+    "thickness_mm": 2,
+    "width_cm": 100,
+    "length_m": 50,
+    "quantity": 4,
+    "masura_type": "Masura 100",
+    "masura_quantity": 4,
+    "gas_consumption_kg": 10,
+}
+
+
+async def seed_materials(db):
+    await db.raw_materials.insert_many([
+        {"id": "gas", "name": "Gaz", "code": "GAZ001", "unit": "kg", "unit_price": 1.0, "current_stock": 100.0},
+        {"id": "m100", "name": "Masura 100", "code": "M100", "unit": "adet", "unit_price": 3.0, "current_stock": 100.0},
+    ])
+
+
+async def test_ndjson_rows_fail_one_by_one(db, api):
+    await seed_materials(db)
+    lines = [
+        json.dumps(ROW),
+        "{not json",
+        json.dumps({**ROW, "quantity": "many"}),
+        "[1, 2]",
+        "",
+        json.dumps({**ROW, "machine": "Makine 2", "quantity": 2, "masura_quantity": 2}),
+    ]
+
+    response = await api.post("/manufacturing/import", params={"format": "ndjson"}, content="\n".join(lines))
+
+    result = response.json()
+    assert response.status_code == 200
+    assert result['imported'] == 2
+    assert [error['row'] for error in result['errors']] == [2, 3, 4]
+    assert result['errors'][0]['error'].startswith("Invalid JSON")
+    assert result['errors'][1]['error'].startswith("quantity:")
+    assert await db.manufacturing_records.count_documents({}) == 2
+
+    stock = await db.finished_stock.find_one({})
+    assert (stock['total_quantity'], stock['total_square_meters']) == (6, 300.0)
+    masura = await db.raw_materials.find_one({"id": "m100"})
+    gas = await db.raw_materials.find_one({"id": "gas"})
+    assert (masura['current_stock'], gas['current_stock']) == (94, 80)
+    assert await db.consumptions.count_documents({}) == 4
+
+
+async def test_csv_rows_with_the_wrong_shape_are_reported(db, api):
+    await seed_materials(db)
+    header = ",".join(ROW)
+    good = ",".join(str(value) for value in ROW.values())
+    body = "\n".join([header, good, "2026-03-02,Makine 1", good.replace("Makine 1", "Makine 9")])
+
+    response = await api.post("/manufacturing/import", params={"format": "csv"}, content=body)
+
+    result = response.json()
+    assert result['imported'] == 1
+    assert [(error['row'], error['error'][:8]) for error in result['errors']] == [(3, "Expected"), (4, "machine:")]
+
+
+async def test_unknown_format_is_rejected(api):
+    response = await api.post("/manufacturing/import", params={"format": "xml"}, content="<rows/>")
+    assert response.status_code == 400
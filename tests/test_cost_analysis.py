@@ -0,0 +1,39 @@
+"""Cost analysis: stored costs summed raw or from the monthly rollup."""
+from datetime import datetime, timezone
+
+import pytest
+
+from cost_analysis import ROLLUP_STATE_ID, consumption_pipeline, refresh_monthly_rollup
+
+pytestmark = pytest.mark.anyio
+
+
+def consumption(material_id, name, quantity, unit_cost, created_at):
+    return {"material_id": material_id, "material_name": name, "quantity": quantity,
+            "unit_cost": unit_cost, "total_cost": quantity * unit_cost, "created_at": created_at}
+
+
+async def test_rollup_waits_for_the_iso_date_migration(db):
+    await db.consumptions.insert_many([
+        consumption("m1", "Gaz", 10, 2, datetime(2026, 2, 3, tzinfo=timezone.utc)),
+        consumption("m1", "Gaz", 5, 2, "2026-03-04T00:00:00+00:00"),
+    ])
+    await db.migrations.insert_one({"_id": "iso_dates", "progress": {}})
+
+    assert await refresh_monthly_rollup(db, datetime(2026, 5, 15, tzinfo=timezone.utc)) is None
+    assert await db.rollup_state.find_one({"_id": ROLLUP_STATE_ID}) is None
+    assert await db.consumption_monthly.count_documents({}) == 0
+
+
+async def test_material_is_named_by_its_latest_consumption(db):
+    # Newest first in insertion order, so only a sort picks the right name
+    await db.consumptions.insert_many([
+        consumption("m1", "Renk Lacivert", 1, 4, datetime(2026, 4, 20, tzinfo=timezone.utc)),
+        consumption("m1", "Renk Mavi", 2, 3, datetime(2026, 4, 2, tzinfo=timezone.utc)),
+        consumption("m2", "Gaz", 7, 1, datetime(2026, 3, 1, tzinfo=timezone.utc)),
+    ])
+    ranges = [(datetime(2026, 4, 1, tzinfo=timezone.utc), datetime(2026, 5, 1, tzinfo=timezone.utc))]
+
+    rows = await db.consumptions.aggregate(consumption_pipeline(ranges, None)).to_list(None)
+
+    assert [(r['material_name'], r['total_quantity'], r['total_cost']) for r in rows] == [("Renk Lacivert", 3, 10)]
@@ -0,0 +1,152 @@
+"""Cost layers: FIFO and average draws, restores, allocation, opening layers."""
+from datetime import datetime
+
+import pytest
+from pymongo.errors import OperationFailure
+
+import costing
+from costing import allocate, draw, receive, restore, seed_opening_layer, stock_valuation
+from migrations import seed_opening_cost_layers
+
+pytestmark = pytest.mark.anyio
+
+MATERIAL = {"id": "m1", "unit_price": 9.0}
+
+
+@pytest.fixture(params=["fifo", "average"])
+def method(request, monkeypatch):
+    monkeypatch.setattr(costing, "COSTING_METHOD", request.param)
+    return request.param
+
+
+@pytest.fixture
+def fifo(monkeypatch):
+    monkeypatch.setattr(costing, "COSTING_METHOD", "fifo")
+
+
+async def receive_two(db):
+    await receive(db, "m1", 10, 2.0, "r1")
+    await receive(db, "m1", 10, 4.0, "r2")
+    # Both land in the same millisecond; keep r1 the older layer
+    await db.cost_layers.update_one({"source_id": "r1"}, {"$set": {"received_at": datetime(2025, 1, 1)}})
+
+
+async def test_fifo_draw_spans_layers_oldest_first(db, fifo):
+    await receive_two(db)
+
+    slices = await draw(db, MATERIAL, 15)
+
+    assert [(quantity, unit_cost) for quantity, unit_cost, _ in slices] == [(10, 2.0), (5, 4.0)]
+    remaining = {layer['source_id']: layer['remaining'] async for layer in db.cost_layers.find({})}
+    assert remaining == {"r1": 0, "r2": 5}
+
+
+async def test_average_draw_prices_at_the_pool_mean(db, monkeypatch):
+    monkeypatch.setattr(costing, "COSTING_METHOD", "average")
+    await receive_two(db)
+
+    slices = await draw(db, MATERIAL, 15)
+
+    assert slices == [(15, 3.0, "m1")]
+    pool = await db.cost_pools.find_one({"material_id": "m1"})
+    assert (pool['quantity'], pool['value']) == (5, 15.0)
+
+
+async def test_short_layers_price_the_rest_at_unit_price(db, method):
+    await receive(db, "m1", 4, 2.0, "r1")
+
+    slices = await draw(db, MATERIAL, 6)
+
+    assert slices[-1] == (2, 9.0, None)
+    assert sum(quantity * unit_cost for quantity, unit_cost, _ in slices) == 4 * 2.0 + 2 * 9.0
+    assert await draw(db, MATERIAL, 1) == [(1, 9.0, None)]
+
+
+async def test_restore_puts_a_draw_back(db, method):
+    await receive_two(db)
+    before = await stock_valuation(db)
+
+    await restore(db, "m1", await draw(db, MATERIAL, 25))
+
+    assert await stock_valuation(db) == before == [{"material_id": "m1", "quantity": 20, "value": 60.0}]
+
+
+async def test_allocate_splits_slices_over_rows_in_order():
+    slices = [(10, 2.0, "a"), (5, 4.0, "b"), (3, 9.0, None)]
+
+    assert allocate(slices, [4, 8, 6]) == [8.0, 12.0 + 8.0, 12.0 + 27.0]
+    assert allocate(slices, [20]) == [20.0 + 20.0 + 27.0]
+
+
+async def test_valuation_counts_only_what_remains(db, fifo):
+    await receive_two(db)
+    await receive(db, "m2", 3, 1.5, "r3")
+    await draw(db, MATERIAL, 12)
+
+    valuation = sorted(await stock_valuation(db), key=lambda row: row['material_id'])
+
+    assert valuation == [
+        {"material_id": "m1", "quantity": 8, "value": 32.0},
+        {"material_id": "m2", "quantity": 3, "value": 4.5},
+    ]
+
+
+async def test_opening_layer_covers_only_unlayered_stock(db, method):
+    await db.raw_materials.insert_one({"id": "m1", "current_stock": 25, "unit_price": 9.0})
+    await receive(db, "m1", 10, 2.0, "r1")
+
+    assert await seed_opening_layer(db, "m1") == 15
+    assert await seed_opening_layer(db, "m1") == 0
+
+    assert await stock_valuation(db) == [{"material_id": "m1", "quantity": 25, "value": 20.0 + 135.0}]
+
+
+async def test_opening_layer_is_sized_from_the_stock_it_marks(db, fifo, monkeypatch):
+    await db.raw_materials.insert_one({"id": "m1", "current_stock": 25, "unit_price": 9.0})
+    collection = type(db.raw_materials)
+    update_one = collection.update_one
+    marks = []
+
+    async def withdraw_before_the_first_mark(self, query, update, **kwargs):
+        if self.name == "raw_materials" and not marks:
+            marks.append(query['current_stock'])
+            await update_one(self, {"id": "m1"}, {"$inc": {"current_stock": -5}})
+        return await update_one(self, query, update, **kwargs)
+
+    monkeypatch.setattr(collection, "update_one", withdraw_before_the_first_mark)
+
+    assert await seed_opening_layer(db, "m1") == 20
+    assert marks == [25]
+
+
+async def test_migration_seeds_each_material_once(db, fifo):
+    await db.raw_materials.insert_many([
+        {"id": "m1", "current_stock": 5, "unit_price": 2.0},
+        {"id": "m2", "current_stock": 0, "unit_price": 3.0},
+    ])
+
+    assert await seed_opening_cost_layers(db) == 1
+    await db.migrations.delete_many({})
+    assert await seed_opening_cost_layers(db) == 0
+
+    assert await db.cost_layers.count_documents({"source_id": "opening"}) == 1
+
+
+async def test_failed_draw_puts_back_the_layers_it_took(db, fifo, monkeypatch):
+    await receive_two(db)
+    collection = type(db.cost_layers)
+    update_one = collection.update_one
+    updates = []
+
+    async def fail_on_the_second_layer(self, query, update, **kwargs):
+        updates.append(query)
+        if len(updates) == 2:
+            raise OperationFailure("lost the connection")
+        return await update_one(self, query, update, **kwargs)
+
+    monkeypatch.setattr(collection, "update_one", fail_on_the_second_layer)
+
+    with pytest.raises(OperationFailure):
+        await draw(db, MATERIAL, 15)
+
+    assert await stock_valuation(db) == [{"material_id": "m1", "quantity": 20, "value": 60.0}]
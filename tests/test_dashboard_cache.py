@@ -0,0 +1,24 @@
+"""Every manufacturing write drops the cached dashboard snapshot."""
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+RECORD = {
+    "production_date": "2026-03-02T08:00:00+00:00", "machine": "Makine 1", "thickness_mm": 2,
+    "width_cm": 100, "length_m": 50, "quantity": 4, "masura_type": "Masura Yok",
+    "masura_quantity": 0, "gas_consumption_kg": 0,
+}
+
+
+async def test_manufacturing_writes_invalidate_the_dashboard(api):
+    created = (await api.post("/manufacturing", json=RECORD)).json()
+
+    server.dashboard_cache.set("stats", "stale")
+    assert (await api.put(f"/manufacturing/{created['id']}", json={**RECORD, "quantity": 6})).status_code == 200
+    assert server.dashboard_cache.get("stats") is None
+
+    server.dashboard_cache.set("stats", "stale")
+    assert (await api.delete(f"/manufacturing/{created['id']}")).status_code == 200
+    assert server.dashboard_cache.get("stats") is None
@@ -0,0 +1,59 @@
+"""Conditional GETs: 304 on a matching ETag, invalidation on write, query sensitivity."""
+import pytest
+
+import server
+from versions import CollectionVersions
+
+pytestmark = pytest.mark.anyio
+
+MATERIAL = {"name": "Renk Mavi", "code": "RMAVI", "unit": "kg", "unit_price": 12.5}
+
+
+@pytest.fixture
+def fresh_versions(monkeypatch):
+    monkeypatch.setattr(server, "versions", CollectionVersions())
+    return server.versions
+
+
+async def test_matching_etag_gets_304(api, fresh_versions):
+    await api.post("/raw-materials", json=MATERIAL)
+    first = await api.get("/raw-materials")
+    etag = first.headers['etag']
+
+    again = await api.get("/raw-materials", headers={"If-None-Match": etag})
+
+    assert again.status_code == 304
+    assert again.headers['etag'] == etag
+    assert again.content == b""
+    # A proxy may strip the weak prefix
+    assert (await api.get("/raw-materials", headers={"If-None-Match": etag[2:]})).status_code == 304
+
+
+async def test_write_changes_the_etag(api, fresh_versions):
+    etag = (await api.get("/raw-materials")).headers['etag']
+
+    await api.post("/raw-materials", json=MATERIAL)
+    response = await api.get("/raw-materials", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers['etag'] != etag
+    assert [row['code'] for row in response.json()['items']] == ["RMAVI"]
+
+
+async def test_another_workers_write_changes_the_etag(api, db, fresh_versions):
+    etag = (await api.get("/raw-materials")).headers['etag']
+
+    await CollectionVersions().bump(db, "raw_materials")
+    await fresh_versions.load(db)
+
+    assert (await api.get("/raw-materials", headers={"If-None-Match": etag})).status_code == 200
+
+
+async def test_etag_depends_on_the_query_string(api, fresh_versions):
+    await api.post("/raw-materials", json=MATERIAL)
+    etag = (await api.get("/raw-materials")).headers['etag']
+
+    response = await api.get("/raw-materials", params={"limit": 1}, headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers['etag'] != etag
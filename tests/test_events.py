@@ -0,0 +1,62 @@
+"""Change events: Last-Event-ID replay in insertion order, and stream auth."""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+
+from events import RESYNC, EventBus, stream
+
+pytestmark = pytest.mark.anyio
+
+NOW = datetime.now(timezone.utc)
+
+
+def event(seconds: float, type: str = "stock.changed") -> dict:
+    return {"_id": ObjectId.from_datetime(NOW + timedelta(seconds=seconds)), "type": type, "data": {}}
+
+
+@pytest.fixture
+async def bus(db):
+    bus = EventBus()
+    bus.db = db
+    return bus
+
+
+async def test_replay_follows_insertion_order_not_ids(db, bus):
+    # A worker with a slow clock inserts after the one with a fast clock
+    first, fast, slow, last = event(0), event(2), event(1), event(3, "manufacturing.created")
+    await db.events.insert_many([first, fast, slow, last])
+
+    missed = await bus.missed(str(fast['_id']))
+    assert [e['_id'] for e in missed] == [slow['_id'], last['_id']]
+
+    missed = await bus.missed(str(first['_id']), {"manufacturing.created"})
+    assert [e['_id'] for e in missed] == [last['_id']]
+
+
+async def test_replay_asks_for_a_resync_when_the_event_is_gone(db, bus):
+    await db.events.insert_one(event(0))
+
+    assert await bus.missed(str(ObjectId())) == [{"type": RESYNC, "data": {}}]
+    assert await bus.missed("not-an-id") == []
+
+
+class Request:
+    async def is_disconnected(self):
+        return False
+
+
+async def test_stream_ends_once_the_token_is_no_longer_valid(bus):
+    subscriber = bus.subscribe()
+    valid = [True]
+    body = stream(bus, subscriber, Request(), authorized=lambda: valid[0])
+
+    assert await body.__anext__() == b"retry: 3000\n\n"
+    subscriber.offer(event(0))
+    assert (await body.__anext__()).startswith(b"id: ")
+
+    valid[0] = False
+    subscriber.offer(event(1))
+    with pytest.raises(StopAsyncIteration):
+        await body.__anext__()
+    assert subscriber not in bus.subscribers
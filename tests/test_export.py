@@ -0,0 +1,66 @@
+"""CSV export: streamed from the first byte, same date range as the lists."""
+import csv
+import io
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import export
+from export import EXPORTS, stream_csv
+
+pytestmark = pytest.mark.anyio
+
+START = datetime(2026, 3, 1, tzinfo=timezone.utc)
+
+
+async def test_header_is_sent_before_any_row_is_read():
+    read = []
+
+    async def cursor():
+        for i in range(3):
+            read.append(i)
+            yield {"id": f"r{i}", "quantity": i}
+
+    stream = stream_csv(cursor(), ("id", "quantity"))
+    assert await stream.__anext__() == "﻿id,quantity\r\n".encode("utf-8")
+    assert read == []
+    assert b"".join([chunk async for chunk in stream]) == b"r0,0\r\nr1,1\r\nr2,2\r\n"
+
+
+async def test_rows_are_flushed_in_small_chunks(monkeypatch):
+    monkeypatch.setattr(export, "CSV_CHUNK_SIZE", 64)
+
+    async def cursor():
+        for i in range(100):
+            yield {"id": f"row-{i:04d}", "note": "x" * 20}
+
+    chunks = [chunk async for chunk in stream_csv(cursor(), ("id", "note"))]
+
+    assert len(chunks) > 20
+    assert max(len(chunk) for chunk in chunks[1:]) < 64 + 40
+
+
+async def test_export_and_list_return_the_same_range(db, api):
+    await db.shipments.insert_many([
+        {"id": f"s{day}", "shipment_number": f"SEV-{day:05d}", "shipment_date": START + timedelta(days=day),
+         "customer_company": "ACME", "thickness_mm": 2, "width_cm": 100, "length_m": 50, "quantity": 1,
+         "square_meters": 50, "invoice_number": "1", "vehicle_plate": "34", "driver_name": "Ali",
+         "created_by": "tester", "created_at": START}
+        for day in range(5)
+    ])
+    params = {"from": (START + timedelta(days=1)).isoformat(), "to": (START + timedelta(days=3)).isoformat()}
+
+    listed = (await api.get("/shipments", params=params)).json()['items']
+    exported = (await api.get("/export/shipments", params={**params, "columns": "id"})).text
+
+    rows = list(csv.reader(io.StringIO(exported.lstrip("﻿"))))
+    assert sorted(row['id'] for row in listed) == [row[0] for row in rows[1:]] == ["s1", "s2"]
+
+
+async def test_inverted_range_is_rejected(api):
+    response = await api.get("/export/shipments", params={"from": START.isoformat(), "to": START.isoformat()})
+    assert response.status_code == 400
+
+
+def test_consumption_export_carries_costs():
+    assert {"unit_cost", "total_cost"} <= set(EXPORTS["consumptions"][2])
@@ -0,0 +1,148 @@
+"""Contract: the fast JSON path emits exactly what the Pydantic models would."""
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import List, Union
+
+import pytest
+from pydantic import TypeAdapter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+
+import fast_json  # noqa: E402
+import server  # noqa: E402
+from pagination import Page  # noqa: E402
+
+CREATED = datetime(2025, 3, 4, 5, 6, 7, 123000, tzinfo=timezone.utc)
+
+DOCUMENTS = {
+    server.RawMaterial: [
+        {"_id": "oid", "id": "m1", "name": "Renk Mavi", "code": "R001", "unit": "kg",
+         "unit_price": 12, "current_stock": 40.5, "min_stock_level": 5, "created_at": CREATED},
+        # Optional fields missing, unknown keys present
+        {"id": "m2", "name": "Gaz", "code": "GAZ001", "unit": "kg", "unit_price": 3.25,
+         "created_at": CREATED, "search_keys": ["gaz", "gaz001"]},
+    ],
+    server.StockTransaction: [
+        {"id": "t1", "material_id": "m1", "transaction_type": "in", "quantity": 10,
+         "created_by": "admin", "created_at": CREATED},
+        {"id": "t2", "material_id": "m1", "transaction_type": "out", "quantity": 2.5,
+         "reference": "PRD-0001", "notes": "ç ğ ı ö ş ü", "created_by": "admin", "created_at": CREATED},
+    ],
+    server.Product: [
+        {"id": "p1", "name": "Levha", "code": "L1", "unit": "adet", "created_at": CREATED},
+    ],
+    server.ProductionOrder: [
+        {"id": "o1", "order_number": "PRD-0001", "product_id": "p1", "product_name": "Levha",
+         "quantity": 3, "status": "completed", "planned_date": CREATED,
+         "completed_date": CREATED + timedelta(days=1), "created_by": "admin", "created_at": CREATED},
+        {"id": "o2", "order_number": "PRD-0002", "product_id": "p1", "product_name": "Levha",
+         "quantity": 1.5, "status": "planned", "planned_date": CREATED,
+         "created_by": "admin", "created_at": CREATED},
+    ],
+    server.Consumption: [
+        {"id": "c1", "production_order_id": "MFG-x", "material_id": "m1", "material_name": "Renk Mavi",
+         "quantity": 2, "created_by": "admin", "created_at": CREATED},
+    ],
+    server.Shipment: [
+        {"id": "s1", "shipment_number": "SEV-0001", "shipment_date": CREATED, "customer_company": "ACME",
+         "thickness_mm": 2, "width_cm": 100, "length_m": 50.5, "color_name": "Mavi", "quantity": 3,
+         "square_meters": 151.5, "invoice_number": "IRS-1", "vehicle_plate": "34 ABC 12",
+         "driver_name": "Ali", "created_by": "admin", "created_at": CREATED},
+    ],
+    server.ManufacturingRecord: [
+        {"id": "r1", "production_date": CREATED, "machine": "Makine 1", "thickness_mm": 2,
+         "width_cm": 100.0, "length_m": 50, "quantity": 4.0, "square_meters": 200,
+         "masura_type": "Masura 100", "masura_quantity": 4, "model": "2mm x 100cm x 50m",
+         "gas_consumption_kg": 1, "created_by": "admin", "created_at": CREATED},
+        # Not yet touched by the iso_dates migration
+        {"id": "r2", "production_date": "2025-03-04T05:06:07.123000+00:00", "machine": "Makine 2",
+         "thickness_mm": 1.5, "width_cm": 120, "length_m": 25, "quantity": 1, "square_meters": 30,
+         "masura_type": "Masura Yok", "masura_quantity": 0, "color_material_id": "m1",
+         "color_name": "Mavi", "model": "1.5mm x 120cm x 25m", "gas_consumption_kg": 0.75,
+         "created_by": "admin", "created_at": "2025-03-04T05:06:07+00:00"},
+    ],
+    server.User: [
+        {"id": "u1", "username": "admin", "email": "admin@example.com", "role": "admin",
+         "password": "$2b$12$hash", "created_at": CREATED},
+    ],
+}
+
+
+@pytest.fixture(params=[True, False], ids=["orjson", "stdlib"])
+def encoder(request, monkeypatch):
+    if request.param:
+        if fast_json.orjson is None:
+            pytest.skip("orjson not installed")
+    else:
+        monkeypatch.setattr(fast_json, "orjson", None)
+
+
+@pytest.mark.parametrize("model", list(DOCUMENTS), ids=lambda model: model.__name__)
+def test_list_matches_pydantic(encoder, model):
+    docs = DOCUMENTS[model]
+    expected = TypeAdapter(List[model]).dump_json(TypeAdapter(List[model]).validate_python(docs))
+    assert json.loads(fast_json.encode_documents(docs, model)) == json.loads(expected)
+
+
+@pytest.mark.parametrize("model", list(DOCUMENTS), ids=lambda model: model.__name__)
+def test_page_matches_pydantic(encoder, model):
+    docs = DOCUMENTS[model]
+    adapter = TypeAdapter(Page[model])
+    expected = adapter.dump_json(adapter.validate_python({"items": docs, "next_cursor": "abc"}))
+    assert json.loads(fast_json.encode_page(docs, "abc", model)) == json.loads(expected)
+
+
+def test_key_order_and_types_match(encoder):
+    # Compare token by token, not just parsed values: 12 vs 12.0 matters
+    model = server.RawMaterial
+    docs = DOCUMENTS[model]
+    expected = TypeAdapter(List[model]).dump_json(TypeAdapter(List[model]).validate_python(docs))
+    assert fast_json.encode_documents(docs, model) == expected
+
+
+def test_openapi_schema_unchanged(monkeypatch):
+    import pagination
+
+    app = server.app
+    app.openapi_schema = None
+    before = app.openapi()
+    monkeypatch.setattr(pagination, "FAST_JSON_RESPONSES", True)
+    app.openapi_schema = None
+    assert app.openapi() == before
+
+
+def _parsed_with_types(raw: bytes):
+    return json.loads(raw, parse_float=lambda text: ("float", float(text)), parse_int=lambda text: ("int", int(text)))
+
+
+@pytest.mark.parametrize("model", list(DOCUMENTS), ids=lambda model: model.__name__)
+def test_number_types_match(encoder, model):
+    docs = DOCUMENTS[model]
+    expected = TypeAdapter(List[model]).dump_json(TypeAdapter(List[model]).validate_python(docs))
+    assert _parsed_with_types(fast_json.encode_documents(docs, model)) == _parsed_with_types(expected)
+
+
+@pytest.mark.parametrize("model", [server.Shipment, server.ManufacturingRecord], ids=lambda model: model.__name__)
+def test_field_selection_is_a_subset_of_pydantic(encoder, model):
+    from pagination import FieldParams
+
+    docs = DOCUMENTS[model]
+    fields = FieldParams("square_meters, quantity,created_by").select(model)
+    assert fields[0] == "id"
+    expected = json.loads(TypeAdapter(List[model]).dump_json(TypeAdapter(List[model]).validate_python(docs)))
+    subset = [{name: row[name] for name in fields} for row in expected]
+    assert _parsed_with_types(fast_json.encode_documents(docs, model, fields)) == \
+        _parsed_with_types(json.dumps(subset).encode())
+
+
+def test_unknown_field_is_rejected():
+    from fastapi import HTTPException
+    from pagination import FieldParams
+
+    with pytest.raises(HTTPException) as error:
+        FieldParams("quantity,password").select(server.User)
+    assert error.value.status_code == 400
@@ -0,0 +1,112 @@
+"""finished_stock: incremental deltas and the rebuild from history."""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from finished_stock import post_finished_stock, rebuild_finished_stock, stock_key
+
+pytestmark = pytest.mark.anyio
+
+
+def item(quantity, color=None, thickness=2.0):
+    return {"thickness_mm": thickness, "width_cm": 100.0, "length_m": 50.0, "color_name": color,
+            "quantity": quantity, "square_meters": quantity * 50.0}
+
+
+async def stock(db):
+    rows = await db.finished_stock.find({}, {"_id": 0}).to_list(None)
+    return {row['key']: row['total_quantity'] for row in rows}
+
+
+async def test_rebuild_matches_the_deltas(db):
+    made = [item(10), item(4, "Mavi"), item(3), item(7, thickness=3.0)]
+    shipped = [item(5), item(1, "Mavi")]
+    await db.manufacturing_records.insert_many([dict(row) for row in made])
+    await db.shipments.insert_many([dict(row) for row in shipped])
+    for row in made:
+        await post_finished_stock(db, row, 1)
+    for row in shipped:
+        await post_finished_stock(db, row, -1)
+    incremental = await stock(db)
+
+    # Drift the table, then rebuild it from history
+    await db.finished_stock.update_many({}, {"$inc": {"total_quantity": 100}})
+    await db.finished_stock.insert_one({"key": "stale", "total_quantity": 1})
+    assert await rebuild_finished_stock(db) == 3
+
+    assert await stock(db) == incremental == {
+        stock_key(2.0, 100.0, 50.0, None): 8,
+        stock_key(2.0, 100.0, 50.0, "Mavi"): 3,
+        stock_key(3.0, 100.0, 50.0, None): 7,
+    }
+
+
+async def test_movements_record_every_delta(db):
+    await post_finished_stock(db, item(10), 1)
+    await post_finished_stock(db, item(4), -1)
+    movements = await db.finished_stock_movements.find({}, {"_id": 0, "quantity": 1}).to_list(None)
+    assert [m['quantity'] for m in movements] == [10, -4]
+
+
+async def test_live_rebuild_is_refused_without_transactions(db, monkeypatch):
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server, "client", db.client)
+    await db.finished_stock.insert_one({"key": "k", "total_quantity": 5})
+
+    with pytest.raises(HTTPException) as error:
+        await server.rebuild_stock(current_user={"role": "admin"})
+
+    assert error.value.status_code == 409
+    assert await stock(db) == {"k": 5}
+
+
+async def test_only_one_worker_seeds(db, transactional):
+    calls = []
+
+    async def rebuild(session):
+        calls.append(session)
+        await asyncio.sleep(0)
+        return 3
+
+    results = await asyncio.gather(*[server.seed_once("finished_stock", rebuild) for _ in range(4)])
+
+    assert sorted(results, key=str) == [3, None, None, None]
+    assert len(calls) == 1
+    assert (await db.migrations.find_one({"_id": "finished_stock"}))['done'] is True
+    assert await server.seed_once("finished_stock", rebuild) is None
+
+
+async def test_a_failed_seed_releases_its_lease(db, transactional):
+    async def fail(session):
+        raise RuntimeError("lost the connection")
+
+    async def rebuild(session):
+        return 2
+
+    with pytest.raises(RuntimeError):
+        await server.seed_once("finished_stock", fail)
+    assert await server.seed_once("finished_stock", rebuild) == 2
+
+
+async def test_an_abandoned_lease_is_taken_over(db, transactional):
+    started = datetime.now(timezone.utc) - timedelta(seconds=server.SEED_LEASE_SECONDS + 1)
+    await db.migrations.insert_one({"_id": "finished_stock", "started_at": started})
+
+    async def rebuild(session):
+        return 1
+
+    assert await server.seed_once("finished_stock", rebuild) == 1
+
+
+async def test_startup_leaves_seeding_to_the_cli_without_transactions(db, monkeypatch):
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server, "client", db.client)
+    await db.manufacturing_records.insert_one(item(4))
+
+    await server.prepare_finished_stock()
+
+    assert await stock(db) == {}
+    assert await db.migrations.count_documents({}) == 0
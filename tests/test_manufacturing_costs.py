@@ -0,0 +1,109 @@
+"""A manufacturing write that fails gives back the stock and cost layers it drew."""
+import json
+
+import pytest
+from pymongo.errors import OperationFailure
+
+import server
+from stock_posting import post_stock
+
+pytestmark = pytest.mark.anyio
+
+RECORD = {
+    "production_date": "2026-03-02T08:00:00+00:00", "machine": "Makine 1", "thickness_mm": 2,
+    "width_cm": 100, "length_m": 50, "quantity": 4, "masura_type": "Masura Yok",
+    "masura_quantity": 0, "gas_consumption_kg": 10,
+}
+
+
+async def books(db):
+    """Gas on hand, and the quantity its cost layers still hold."""
+    gas = await db.raw_materials.find_one({"id": "gas"})
+    layers = await db.cost_layers.find({"material_id": "gas"}).to_list(None)
+    return gas['current_stock'], sum(layer['remaining'] for layer in layers)
+
+
+@pytest.fixture
+async def gas(db, api):
+    await db.raw_materials.insert_one({"id": "gas", "name": "Gaz", "code": "GAZ001", "unit": "kg",
+                                       "unit_price": 1.0, "current_stock": 0.0})
+    await post_stock(db, "gas", 25, ledger=("stock_transactions", {
+        "id": "receipt", "material_id": "gas", "transaction_type": "in", "quantity": 25, "unit_cost": 2.0,
+    }))
+    # A consumption id that is already taken makes the ledger insert fail
+    await db.consumptions.create_index("id", unique=True)
+    await db.consumptions.insert_one({"id": "taken"})
+    return "gas"
+
+
+def fail_consumption(monkeypatch, call: int):
+    original = server.record_consumption_doc
+    calls = []
+
+    def record_consumption_doc(*args):
+        doc = original(*args)
+        calls.append(doc)
+        if len(calls) == call:
+            doc['id'] = "taken"
+        return doc
+
+    monkeypatch.setattr(server, "record_consumption_doc", record_consumption_doc)
+
+
+async def test_failed_create_puts_layers_back(db, api, gas, monkeypatch):
+    fail_consumption(monkeypatch, 1)
+
+    with pytest.raises(OperationFailure):
+        await api.post("/manufacturing", json=RECORD)
+
+    assert await books(db) == (25, 25)
+    assert await db.manufacturing_records.count_documents({}) == 0
+    assert await db.finished_stock.count_documents({"total_quantity": {"$ne": 0}}) == 0
+
+
+async def test_failed_import_row_puts_layers_back(db, api, gas, monkeypatch):
+    # 30 kg for the batch does not fit in 25: rows are posted one by one
+    body = "\n".join(json.dumps(RECORD) for _ in range(3))
+    fail_consumption(monkeypatch, 2)
+
+    with pytest.raises(OperationFailure):
+        await api.post("/manufacturing/import", params={"format": "ndjson"}, content=body)
+
+    assert await books(db) == (15, 15)
+    consumption = await db.consumptions.find_one({"material_id": "gas"})
+    assert (consumption['quantity'], consumption['total_cost']) == (10, 20.0)
+
+
+async def test_import_short_on_stock_skips_only_the_rows_that_do_not_fit(db, api, gas):
+    body = "\n".join(json.dumps(RECORD) for _ in range(3))
+
+    result = (await api.post("/manufacturing/import", params={"format": "ndjson"}, content=body)).json()
+
+    assert result['imported'] == 3
+    assert await books(db) == (5, 5)
+    assert await db.consumptions.count_documents({"material_id": "gas"}) == 2
+
+
+async def test_failed_draw_puts_stock_and_layers_back(db, api, gas, monkeypatch):
+    await db.raw_materials.insert_one({"id": "masura", "name": "Masura 100", "code": "MAS100", "unit": "adet",
+                                       "unit_price": 3.0, "current_stock": 0.0})
+    await post_stock(db, "masura", 6, ledger=("stock_transactions", {
+        "id": "masura-receipt", "material_id": "masura", "transaction_type": "in", "quantity": 6, "unit_cost": 3.0,
+    }))
+    original = server.draw
+
+    async def draw(db, material, quantity, session=None):
+        if material['id'] == "gas":
+            raise OperationFailure("draw failed")
+        return await original(db, material, quantity, session)
+
+    monkeypatch.setattr(server, "draw", draw)
+
+    with pytest.raises(OperationFailure):
+        await api.post("/manufacturing", json={**RECORD, "masura_type": "Masura 100", "masura_quantity": 2})
+
+    masura = await db.raw_materials.find_one({"id": "masura"})
+    layer = await db.cost_layers.find_one({"material_id": "masura"})
+    assert (masura['current_stock'], layer['remaining']) == (6, 6)
+    assert await books(db) == (25, 25)
+    assert await db.manufacturing_records.count_documents({}) == 0
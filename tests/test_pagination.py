@@ -0,0 +1,57 @@
+"""Keyset pagination over the API: cursors, ties, bad cursors, legacy lists."""
+from datetime import datetime, timezone
+
+import pytest
+
+import pagination
+
+pytestmark = pytest.mark.anyio
+
+CREATED = datetime(2025, 3, 4, tzinfo=timezone.utc)
+
+
+@pytest.fixture(params=[False, True], ids=["pydantic", "fast_json"])
+def responses(request, monkeypatch):
+    monkeypatch.setattr(pagination, "FAST_JSON_RESPONSES", request.param)
+
+
+async def add_materials(db, count: int):
+    # Every row shares created_at, so only the id tie-break orders them
+    await db.raw_materials.insert_many([
+        {"id": f"m{n:02d}", "name": f"Malzeme {n}", "code": f"M{n:02d}", "unit": "kg",
+         "unit_price": 1.0, "current_stock": 0, "min_stock_level": 0, "created_at": CREATED}
+        for n in reversed(range(count))
+    ])
+
+
+async def test_cursor_walks_equal_sort_values_without_gaps(api, db, responses):
+    await add_materials(db, 7)
+
+    seen, after = [], None
+    while True:
+        params = {"limit": 3, **({"after": after} if after else {})}
+        page = (await api.get("/raw-materials", params=params)).json()
+        seen += [row['id'] for row in page['items']]
+        after = page['next_cursor']
+        if after is None:
+            break
+
+    assert seen == [f"m{n:02d}" for n in range(7)]
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "W10", "e30"])
+async def test_invalid_cursor_is_a_400(api, db, cursor):
+    await add_materials(db, 2)
+
+    response = await api.get("/raw-materials", params={"after": cursor})
+
+    assert response.status_code == 400
+    assert response.json()['detail'] == "Invalid cursor"
+
+
+async def test_legacy_returns_the_plain_list(api, db, responses):
+    await add_materials(db, 4)
+
+    response = await api.get("/raw-materials", params={"legacy": "true", "limit": 2})
+
+    assert [row['id'] for row in response.json()] == ["m00", "m01", "m02", "m03"]
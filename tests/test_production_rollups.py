@@ -0,0 +1,47 @@
+"""Production rollups: the first-start seeding matches the incremental deltas."""
+from datetime import datetime, timezone
+
+import pytest
+
+import server
+from production_rollups import post_production_rollups
+
+pytestmark = pytest.mark.anyio
+
+
+def record(n: int, machine: str = "Makine 1") -> dict:
+    return {"id": f"r{n}", "production_date": datetime(2025, 3, n, 8, tzinfo=timezone.utc), "machine": machine,
+            "thickness_mm": 2.0, "color_name": "Mavi", "quantity": n, "square_meters": n * 50.0,
+            "gas_consumption_kg": 1.5, "masura_type": "Masura 100", "masura_quantity": 1}
+
+
+async def rollups(db) -> dict:
+    return {row['key']: (row['record_count'], row['square_meters'])
+            async for row in db.production_rollups.find({})}
+
+
+async def test_seeding_matches_the_deltas_once(db, transactional):
+    records = [record(1), record(2), record(9, "Makine 2")]
+    await db.manufacturing_records.insert_many([dict(r) for r in records])
+    await post_production_rollups(db, records, 1)
+    incremental = await rollups(db)
+    await db.production_rollups.delete_many({})
+
+    await server.prepare_production_rollups()
+    assert await rollups(db) == incremental
+
+    # Done once: a later empty table is not reseeded behind live deltas
+    await db.production_rollups.delete_many({})
+    await server.prepare_production_rollups()
+    assert await rollups(db) == {}
+
+
+async def test_startup_leaves_seeding_to_the_cli_without_transactions(db, monkeypatch):
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server, "client", db.client)
+    await db.manufacturing_records.insert_one(record(1))
+
+    await server.prepare_production_rollups()
+
+    assert await rollups(db) == {}
+    assert await db.migrations.count_documents({}) == 0
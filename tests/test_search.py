@@ -0,0 +1,91 @@
+"""Prefix search: Turkish folding, ranking and limits."""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from search import MAX_SEARCH_LIMIT, fold, search, search_keys, with_search_keys
+
+pytestmark = pytest.mark.anyio
+
+START = datetime(2025, 3, 1, tzinfo=timezone.utc)
+
+
+def shipment(n: int, company: str) -> dict:
+    return with_search_keys({
+        "id": f"s{n}", "shipment_number": f"SEV-{n:05d}", "shipment_date": START + timedelta(days=n),
+        "customer_company": company, "thickness_mm": 2.0, "width_cm": 100.0, "length_m": 50.0,
+        "quantity": 1, "square_meters": 50.0, "invoice_number": f"IRS-{n}", "vehicle_plate": f"34 ABC {n}",
+        "driver_name": "Sürücü", "created_by": "tester", "created_at": START,
+    }, "shipments")
+
+
+async def add_shipments(db, *companies):
+    await db.shipments.insert_many([shipment(n, company) for n, company in enumerate(companies)])
+
+
+def test_fold_applies_the_turkish_rules():
+    assert fold("İSTANBUL Işık ŞAHİN Ğ ğüöç") == "istanbul isik sahin g guoc"
+    assert fold("ıiIİ") == "iiii"
+
+
+def test_keys_cover_words_runs_and_whole_values():
+    keys = search_keys({"invoice_number": "IRS-2024-001", "driver_name": "Çağrı Işıkoğlu"}, "shipments")
+
+    assert {"irs", "2024", "001", "irs2024001", "cagri", "isikoglu", "cagriisikoglu"} <= set(keys)
+
+
+@pytest.mark.parametrize("query", ["işık", "ISIK", "Işık", "isik", "IŞIK"])
+async def test_folded_queries_find_the_same_document(db, query):
+    await add_shipments(db, "Işık Ambalaj", "Sahin Lojistik")
+
+    assert [row['id'] for row in await search(db, "shipments", query)] == ["s0"]
+
+
+async def test_dotted_capital_i_and_soft_g(db):
+    await add_shipments(db, "Ağaoğlu İnşaat", "Ozgur Plastik")
+
+    assert [row['id'] for row in await search(db, "shipments", "AGAOGLU insa")] == ["s0"]
+    assert [row['id'] for row in await search(db, "shipments", "özgür")] == ["s1"]
+
+
+async def test_exact_words_rank_before_prefixes_then_newest_first(db):
+    await add_shipments(db, "Demirtaş", "Demir A.Ş.", "Demirci", "Demir Metal")
+
+    ranked = [row['id'] for row in await search(db, "shipments", "demir")]
+
+    assert ranked == ["s3", "s1", "s2", "s0"]
+    assert "search_keys" not in (await search(db, "shipments", "demir"))[0]
+
+
+async def test_limit_takes_the_newest_matches_then_ranks_them(db):
+    await add_shipments(db, *[f"Kaya {n}" for n in range(12)], "Kayalar")
+
+    everything = [row['id'] for row in await search(db, "shipments", "kaya", limit=20)]
+    top = [row['id'] for row in await search(db, "shipments", "kaya", limit=5)]
+
+    assert everything == [f"s{n}" for n in range(11, -1, -1)] + ["s12"]
+    # Only the five newest are read; the prefix-only match among them goes last
+    assert top == ["s11", "s10", "s9", "s8", "s12"]
+    assert top == [row['id'] for row in await search(db, "shipments", "kaya", limit=5)]
+
+
+async def test_equal_dates_break_ties_by_id(db):
+    await db.shipments.insert_many([{**shipment(n, "Kaya"), "shipment_date": START} for n in (3, 1, 2)])
+
+    assert [row['id'] for row in await search(db, "shipments", "kaya")] == ["s3", "s2", "s1"]
+
+
+async def test_nothing_to_search_for(db):
+    await add_shipments(db, "Kaya")
+
+    assert await search(db, "shipments", " - ") == []
+
+
+async def test_api_bounds_the_limit(api, db):
+    await add_shipments(db, *[f"Kaya {n}" for n in range(3)])
+
+    response = await api.get("/search", params={"q": "kaya", "types": "shipments", "limit": 2})
+    assert [row['id'] for row in response.json()['shipments']] == ["s2", "s1"]
+
+    response = await api.get("/search", params={"q": "kaya", "limit": MAX_SEARCH_LIMIT + 1})
+    assert response.status_code == 422
@@ -0,0 +1,42 @@
+"""Document number sequences: seeding from existing numbers, unique allocation."""
+import asyncio
+
+import pytest
+
+import sequences
+from sequences import SequenceAllocator, next_document_number, seed_sequence
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_seed_takes_the_numeric_maximum(db):
+    numbers = ["PRD-00012", "PRD-99999", "PRD-100000", "PRD-100002", "PRD-99998", "SEV-5000000", "PRD-x1"]
+    await db.production_orders.insert_many([{"order_number": number} for number in numbers])
+
+    await seed_sequence(db, "PRD", "production_orders", "order_number")
+
+    assert (await db.sequences.find_one({"_id": "PRD"}))['value'] == 100002
+    assert await next_document_number(db, "PRD") == "PRD-100003"
+
+
+async def test_seed_never_moves_a_sequence_back(db):
+    await db.sequences.insert_one({"_id": "SEV", "value": 40})
+    await db.shipments.insert_many([{"shipment_number": "SEV-00007"}])
+
+    await seed_sequence(db, "SEV", "shipments", "shipment_number")
+
+    assert (await db.sequences.find_one({"_id": "SEV"}))['value'] == 40
+
+
+async def test_seed_on_an_empty_collection_leaves_no_counter(db):
+    await seed_sequence(db, "SEV", "shipments", "shipment_number")
+    assert await db.sequences.count_documents({}) == 0
+
+
+async def test_concurrent_numbers_are_unique(db, monkeypatch):
+    monkeypatch.setattr(sequences, "allocator", SequenceAllocator(block_size=5))
+
+    numbers = await asyncio.gather(*[next_document_number(db, "SEV") for _ in range(23)])
+
+    assert len(set(numbers)) == 23
+    assert sorted(numbers)[0] == "SEV-00001"
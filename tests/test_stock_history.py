@@ -0,0 +1,106 @@
+"""Point-in-time stock: snapshots plus ledger replay, compaction gating."""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import stock_history
+from stock_history import HistoryPending, NoHistory, compact, finished_stock_as_of, raw_stock_as_of, snapshot_finished_stock
+
+pytestmark = pytest.mark.anyio
+
+DAY = timedelta(days=1)
+BOUNDARY = datetime(2025, 1, 2, tzinfo=timezone.utc)
+LEDGER = [
+    ("stock_transactions", BOUNDARY - timedelta(hours=12), {"transaction_type": "in", "quantity": 100}),
+    ("consumptions", BOUNDARY - timedelta(hours=1), {"quantity": 30}),
+    ("stock_transactions", BOUNDARY, {"transaction_type": "out", "quantity": 5}),
+    ("consumptions", BOUNDARY + timedelta(hours=1), {"quantity": 20}),
+    ("stock_transactions", BOUNDARY + timedelta(hours=2), {"transaction_type": "in", "quantity": 7}),
+]
+
+
+@pytest.fixture(autouse=True)
+def daily(monkeypatch):
+    monkeypatch.setattr(stock_history, "STOCK_SNAPSHOT_INTERVAL", 24 * 3600)
+    monkeypatch.setattr(stock_history, "STOCK_SNAPSHOT_LAG", 300)
+
+
+@pytest.fixture
+async def ledger(db):
+    for collection, at, row in LEDGER:
+        await db[collection].insert_one({"material_id": "m1", "created_at": at, **row})
+    await db.migrations.insert_one({"_id": "iso_dates", "done": True})
+
+
+def replayed(until: datetime) -> float:
+    signs = {"in": 1, "out": -1, None: -1}
+    return sum(signs[row.get('transaction_type')] * row['quantity'] for _, at, row in LEDGER if at <= until)
+
+
+async def test_compaction_waits_for_the_iso_dates_migration(db):
+    await db.stock_transactions.insert_one(
+        {"material_id": "m1", "transaction_type": "in", "quantity": 4, "created_at": "2025-01-01T10:00:00"}
+    )
+
+    assert await compact(db, now=BOUNDARY + 3 * DAY) == 0
+    assert await db.stock_snapshots.count_documents({}) == 0
+
+
+async def test_compaction_skips_dates_that_never_parsed(db, ledger):
+    await db.consumptions.insert_one({"material_id": "m1", "quantity": 1, "created_at": "not a date"})
+
+    assert await compact(db, now=BOUNDARY + DAY) == 1
+    snapshot = await db.stock_snapshots.find_one({"kind": "raw_materials"})
+    assert snapshot['taken_at'] == BOUNDARY
+    assert snapshot['balances'] == [{"material_id": "m1", "quantity": replayed(BOUNDARY)}]
+
+
+@pytest.mark.parametrize("offset", [-timedelta(hours=2), -timedelta(minutes=30), timedelta(0),
+                                    timedelta(minutes=90), timedelta(hours=3), DAY + timedelta(hours=1)])
+async def test_as_of_matches_a_full_replay_around_a_snapshot(db, ledger, offset):
+    await compact(db, now=BOUNDARY + 2 * DAY)
+    assert await db.stock_snapshots.count_documents({"kind": "raw_materials"}) == 2
+
+    as_of = BOUNDARY + offset
+    assert await raw_stock_as_of(db, as_of) == {"m1": replayed(as_of)}
+
+
+async def test_finished_history_starts_at_its_first_snapshot(db):
+    with pytest.raises(NoHistory) as error:
+        await finished_stock_as_of(db, BOUNDARY)
+    assert error.value.args == (None,)
+
+    await snapshot_finished_stock(db)
+    with pytest.raises(NoHistory) as error:
+        await finished_stock_as_of(db, BOUNDARY)
+    assert error.value.args[0] > BOUNDARY
+
+
+async def test_finished_stock_replays_movements_after_the_snapshot(db):
+    row = {"key": "k", "thickness_mm": 2.0, "width_cm": 100.0, "length_m": 50.0, "color_name": "Mavi"}
+    await db.finished_stock.insert_one({**row, "total_quantity": 3, "total_square_meters": 150.0})
+    await snapshot_finished_stock(db)
+    taken_at = (await db.stock_snapshots.find_one({"kind": "finished_stock"}))['taken_at']
+    await db.finished_stock_movements.insert_many([
+        {**row, "at": taken_at + timedelta(hours=1), "quantity": 2, "square_meters": 100.0},
+        {**row, "at": taken_at + timedelta(hours=5), "quantity": -4, "square_meters": -200.0},
+    ])
+
+    async def totals(at):
+        return [(r['total_quantity'], r['total_square_meters']) for r in await finished_stock_as_of(db, at)]
+
+    assert await totals(taken_at) == [(3, 150.0)]
+    assert await totals(taken_at + timedelta(hours=2)) == [(5, 250.0)]
+    assert await totals(taken_at + DAY) == [(1, 50.0)]
+
+
+async def test_as_of_waits_for_the_iso_dates_migration(db, api):
+    await db.stock_transactions.insert_many([
+        {"material_id": "m1", "transaction_type": "in", "quantity": 100, "created_at": "2025-01-01T10:00:00"},
+        {"material_id": "m1", "transaction_type": "in", "quantity": 5, "created_at": BOUNDARY - DAY / 2},
+    ])
+
+    with pytest.raises(HistoryPending):
+        await raw_stock_as_of(db, BOUNDARY)
+    response = await api.get("/raw-materials", params={"as_of": BOUNDARY.isoformat()})
+    assert response.status_code == 409
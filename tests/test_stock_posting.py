@@ -0,0 +1,69 @@
+"""Guarded raw-material postings: no lost updates, no negative stock."""
+import asyncio
+
+import pytest
+
+from stock_posting import InsufficientStock, MaterialNotFound, post_stock, post_stock_batch
+
+pytestmark = pytest.mark.anyio
+
+
+async def material(db, material_id="m1", stock=0.0):
+    await db.raw_materials.insert_one({"id": material_id, "name": material_id, "code": material_id,
+                                       "unit": "kg", "unit_price": 2.0, "current_stock": stock})
+
+
+async def balance(db, material_id="m1"):
+    return (await db.raw_materials.find_one({"id": material_id}))['current_stock']
+
+
+async def test_concurrent_withdrawals_never_go_negative(db):
+    await material(db, stock=10)
+
+    async def withdraw():
+        try:
+            await post_stock(db, "m1", -3)
+            return True
+        except InsufficientStock:
+            return False
+
+    results = await asyncio.gather(*[withdraw() for _ in range(8)])
+
+    assert results.count(True) == 3
+    assert await balance(db) == 1
+
+
+async def test_withdrawal_writes_a_priced_ledger_row(db):
+    await material(db, stock=5)
+    doc = {"id": "c1", "material_id": "m1", "quantity": 2}
+
+    await post_stock(db, "m1", -2, ledger=("consumptions", doc))
+
+    row = await db.consumptions.find_one({"id": "c1"})
+    assert row['total_cost'] == 4.0
+    assert await balance(db) == 3
+
+
+async def test_unknown_material(db):
+    with pytest.raises(MaterialNotFound):
+        await post_stock(db, "missing", 1)
+
+
+async def test_batch_reports_the_deltas_it_applied(db):
+    await material(db, "m1", stock=10)
+    await material(db, "m2", stock=1)
+    await material(db, "m3", stock=0)
+
+    applied = await post_stock_batch(db, {"m1": -4, "m2": -2, "m3": 5, "missing": -1})
+
+    assert applied == {"m1", "m3"}
+    assert [await balance(db, m) for m in ("m1", "m2", "m3")] == [6, 1, 5]
+
+
+async def test_concurrent_batches_never_go_negative(db):
+    await material(db, stock=10)
+
+    results = await asyncio.gather(*[post_stock_batch(db, {"m1": -4}) for _ in range(5)])
+
+    assert sum(1 for applied in results if applied) == 2
+    assert await balance(db) == 2